@@ -0,0 +1,173 @@
+"""
+对话流式输出协议
+
+- v1 (旧协议，默认)：每个模型片段发送一条 chat_stream，附带截至当前的 full_text，并固定等待 100ms
+- v2：只发送增量 chat_delta，带 stream_id + seq 以便断线重连后续传；
+  片段按 时间/长度 策略合并后发送，不再人为等待
+
+客户端在 chat 消息中携带 "protocol": 2 即可使用 v2，不带时保持 v1 行为。
+"""
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from app.config import settings
+
+def wire_size(message: dict) -> int:
+    """消息在 WebSocket 上的字节数（与 Starlette send_json 的序列化方式一致）"""
+    return len(json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+class ChatStreamLog:
+    """
+    每个客户端最近一次流式回复的 v2 帧记录，用于重连后按 seq 续传。
+    只保留最近 max_clients 个客户端的最后一条回复。
+    """
+
+    def __init__(self, max_clients: int = 256):
+        self.max_clients = max_clients
+        self._streams = OrderedDict()  # client_id -> {"stream_id", "frames", "done"}
+
+    def start(self, client_id: str, stream_id: str):
+        self._streams[client_id] = {"stream_id": stream_id, "frames": [], "done": False}
+        self._streams.move_to_end(client_id)
+        while len(self._streams) > self.max_clients:
+            self._streams.popitem(last=False)
+
+    def append(self, client_id: str, frame: dict, done: bool = False):
+        stream = self._streams.get(client_id)
+        if stream and stream["stream_id"] == frame["stream_id"]:
+            stream["frames"].append(frame)
+            stream["done"] = stream["done"] or done
+
+    def frames_after(self, client_id: str, stream_id: str, last_seq: int):
+        """返回 seq > last_seq 的帧；stream_id 不匹配（已被新回复覆盖）时返回 None"""
+        stream = self._streams.get(client_id)
+        if not stream or stream["stream_id"] != stream_id:
+            return None
+        return [frame for frame in stream["frames"] if frame["seq"] > last_seq]
+
+chat_stream_log = ChatStreamLog()
+
+class ChatStreamWriter:
+    """
+    将模型片段按协议版本写出
+
+    v2 合并策略：
+    - 距离上次发送已超过 flush_interval 且缓冲区为空时立即发送（慢速输出不引入额外延迟）
+    - 否则先缓冲，累计达到 flush_chars 立即发送，或在 flush_interval 到期时由定时器发送
+    """
+
+    def __init__(self, send, client_id: str, protocol: int = 1,
+                 flush_interval: float = None, flush_chars: int = None, log: ChatStreamLog = None):
+        """send: 发送单条 JSON 消息的协程函数"""
+        self.send = send
+        self.client_id = client_id
+        self.protocol = protocol
+        self.flush_interval = settings.CHAT_FLUSH_INTERVAL_MS / 1000 if flush_interval is None else flush_interval
+        self.flush_chars = settings.CHAT_FLUSH_CHARS if flush_chars is None else flush_chars
+        self.log = log if log is not None else chat_stream_log
+        self.stream_id = uuid.uuid4().hex
+        self.full_text = ""
+        self.seq = 0
+        self.chunk_count = 0
+        self.wire_bytes = 0
+        self.messages = 0
+        self.started_at = time.perf_counter()
+        self.last_token_at = None
+        self._buffer = ""
+        self._last_flush = 0.0
+        self._timer = None
+        self._lock = asyncio.Lock()
+        if protocol >= 2:
+            self.log.start(client_id, self.stream_id)
+
+    async def _emit(self, message: dict):
+        self.wire_bytes += wire_size(message)
+        self.messages += 1
+        await self.send(message)
+
+    async def write(self, text: str):
+        """写入一个模型片段"""
+        if not text:
+            return
+        self.full_text += text
+        self.chunk_count += 1
+
+        if self.protocol < 2:
+            await self._emit({
+                "type": "chat_stream",
+                "chunk": text,
+                "full_text": self.full_text
+            })
+            self.last_token_at = time.perf_counter()
+            # 添加延迟，让前端有时间渲染每个片段（100ms）
+            await asyncio.sleep(0.1)
+            return
+
+        self._buffer += text
+        idle = time.perf_counter() - self._last_flush >= self.flush_interval
+        if len(self._buffer) >= self.flush_chars or (idle and len(self._buffer) == len(text)):
+            await self._flush()
+        elif self._timer is None:
+            delay = max(0.0, self._last_flush + self.flush_interval - time.perf_counter())
+            self._timer = asyncio.ensure_future(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self._timer = None
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            delta, self._buffer = self._buffer, ""
+            self.seq += 1
+            frame = {
+                "type": "chat_delta",
+                "stream_id": self.stream_id,
+                "seq": self.seq,
+                "delta": delta
+            }
+            self.log.append(self.client_id, frame)
+            self._last_flush = time.perf_counter()
+            await self._emit(frame)
+            self.last_token_at = time.perf_counter()
+
+    async def close(self, extra: dict = None):
+        """发送剩余内容与完成消息；extra 中的字段（如本轮 token 用量）附加到完成消息"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.protocol < 2:
+            await self._emit({
+                "type": "chat_response",
+                "message": self.full_text,
+                "is_complete": True,
+                **(extra or {})
+            })
+            return
+
+        await self._flush()
+        self.seq += 1
+        frame = {
+            "type": "chat_response",
+            "stream_id": self.stream_id,
+            "seq": self.seq,
+            "message": self.full_text,
+            "is_complete": True,
+            **(extra or {})
+        }
+        self.log.append(self.client_id, frame, done=True)
+        await self._emit(frame)
+
+    def stats(self) -> dict:
+        return {
+            "protocol": self.protocol,
+            "chunks": self.chunk_count,
+            "messages": self.messages,
+            "wire_bytes": self.wire_bytes,
+            "text_chars": len(self.full_text),
+            "time_to_last_token_ms": round((self.last_token_at - self.started_at) * 1000, 1) if self.last_token_at else 0.0,
+        }
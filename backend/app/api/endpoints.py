@@ -5,11 +5,25 @@ import uuid
 import os
 import asyncio
 import json
+import hashlib
+import time
 from typing import List, Dict
 from app.config import settings
-from app.service.video_llm import video_llm
-from app.service.video_producer import render_final_video
+from app.service.video_llm import video_llm, CHAT_SYSTEM_INSTRUCTION
+from app.service.conversation_store import conversation_store, estimate_tokens
+from app.service.context_cache import context_cache, build_prefix
+from app.core.metrics import LatencyStats
+from app.core.llm_scheduler import llm_scheduler
+from app.service.service_backend import backend_stats
+from app.service.video_producer import render_final_video, slide_cache, tts_cache
+from app.service.tts_provider import tts_router
+from app.service.video_files import video_file_store
+from app.service.video_preprocess import preprocess_cache
+from app.service.result_cache import result_cache
+from app.core.disk_cache import hash_file
 from app.core.rag_engine import rag_engine
+from app.api.chat_stream import ChatStreamWriter, chat_stream_log
+from app.core.dag import DAGExecutor
 from app.service.example_video_index import ExampleVideoIndex
 
 router = APIRouter()
@@ -59,6 +73,46 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# 对话首个片段延迟，按历史模式分别统计，用于对比服务端历史带来的延迟变化
+chat_first_token_stats = {"server_history": LatencyStats(), "client_history": LatencyStats()}
+chat_token_totals = {"turns": 0, "estimated_prompt_tokens": 0, "estimated_legacy_tokens": 0, "cached_tokens": 0}
+
+async def _summarize_conversation(conversation, pending_tokens=0):
+    """折叠超出预算的历史；摘要失败时保留原始历史，不影响对话"""
+    try:
+        await video_llm.asummarize_conversation(conversation, pending_tokens)
+    except Exception as e:
+        print(f"[WARNING] 对话摘要失败，保留原始历史: {e}")
+
+def _chat_usage(conversation, user_message, usage_metadata, started_at, first_token_at):
+    """
+    本轮用量：提示词 token（提供方返回值优先）、缓存命中 token，
+    以及与旧方式（每轮重发完整历史）相比估算节省的 token 数
+    """
+    message_tokens = estimate_tokens(user_message)
+    estimated_prompt = estimate_tokens(build_prefix(CHAT_SYSTEM_INSTRUCTION, conversation.summary)) \
+        + conversation.recent_tokens() + message_tokens
+    estimated_legacy = estimate_tokens(CHAT_SYSTEM_INSTRUCTION) + conversation.full_history_tokens() + message_tokens
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+    usage = {
+        "prompt_tokens": getattr(usage_metadata, "prompt_token_count", None) or estimated_prompt,
+        "cached_tokens": cached_tokens,
+        "estimated_prompt_tokens": estimated_prompt,
+        "estimated_legacy_tokens": estimated_legacy,
+        "saved_tokens": max(0, estimated_legacy - estimated_prompt),
+        "summarized_turns": conversation.summarized,
+        "first_token_ms": round((first_token_at - started_at) * 1000, 1) if first_token_at else None,
+        "latency_ms": round((time.perf_counter() - started_at) * 1000, 1),
+    }
+    chat_token_totals["turns"] += 1
+    chat_token_totals["estimated_prompt_tokens"] += estimated_prompt
+    chat_token_totals["estimated_legacy_tokens"] += estimated_legacy
+    chat_token_totals["cached_tokens"] += cached_tokens
+    print(f"[INFO] 📊 本轮用量 - 提示词 {usage['prompt_tokens']} tokens (缓存命中 {cached_tokens}), "
+          f"旧方式约 {estimated_legacy} tokens, 节省约 {usage['saved_tokens']} tokens, "
+          f"首片段 {usage['first_token_ms']} ms, 总耗时 {usage['latency_ms']} ms")
+    return usage
+
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await manager.connect(websocket, client_id)
@@ -73,9 +127,31 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     history = message_data.get("history", [])
                     model_name = message_data.get("model", "gemini-3-pro-preview")
                     use_stream = message_data.get("stream", True)  # 默认使用流式输出
+                    # 流式协议版本：客户端未声明时使用旧协议 (v1)
+                    protocol = int(message_data.get("protocol", settings.CHAT_STREAM_PROTOCOL))
                     
                     print(f"[INFO] 📨 收到聊天请求 - 用户: {user_message[:30]}...")
                     print(f"[INFO] 📊 消息统计 - 历史: {len(history)} 条, 模型: {model_name}, 流式: {use_stream}")
+
+                    # 服务端对话状态：客户端只发送历史增量 (history_offset 之后的部分)
+                    conversation = None
+                    conversation_id = message_data.get("conversation_id")
+                    if settings.CHAT_SERVER_HISTORY and conversation_id:
+                        conversation = conversation_store.get(f"{client_id}:{conversation_id}")
+                        if not conversation.sync(history, int(message_data.get("history_offset", 0))):
+                            # 服务端状态已丢失（如重启），请客户端重发完整历史
+                            print(f"[INFO] 🔄 对话 {conversation_id} 历史不连续，请求客户端重发完整历史")
+                            await manager.send_json({
+                                "type": "history_resync",
+                                "conversation_id": conversation_id
+                            }, client_id)
+                            continue
+                        # 首次携带完整长历史时已超出预算，先折叠再请求
+                        message_tokens = estimate_tokens(user_message)
+                        if conversation.recent_tokens() + message_tokens > settings.CHAT_HISTORY_TOKEN_BUDGET:
+                            await _summarize_conversation(conversation, message_tokens)
+                    history_mode = "server_history" if conversation else "client_history"
+                    started_at = time.perf_counter()
                     
                     # 发送开始状态
                     await manager.send_json({
@@ -86,48 +162,72 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     if use_stream:
                         # 流式输出
                         print(f"[INFO] 🌊 开始流式生成回复...")
-                        import time
-                        import asyncio
-                        stream_response = video_llm.chat(user_message, history, model_name=model_name, stream=True)
-                        full_text = ""
-                        chunk_count = 0
+                        # 异步客户端：生成期间不阻塞事件循环，其他连接可同时收发
+                        stream_response = await video_llm.achat(
+                            user_message, history, model_name=model_name, stream=True, conversation=conversation
+                        )
+                        writer = ChatStreamWriter(
+                            lambda message: manager.send_json(message, client_id),
+                            client_id,
+                            protocol=protocol
+                        )
                         
-                        for chunk in stream_response:
+                        first_token_at = None
+                        usage_metadata = None
+                        async for chunk in stream_response:
+                            # 用量信息随最后一个片段返回
+                            if getattr(chunk, "usage_metadata", None):
+                                usage_metadata = chunk.usage_metadata
                             if hasattr(chunk, 'text') and chunk.text:
-                                full_text += chunk.text
-                                chunk_count += 1
-                                
-                                # 记录时间戳
-                                timestamp = time.time()
-                                print(f"[INFO] 📡 [{timestamp}] 发送片段 #{chunk_count}, chunk长度: {len(chunk.text)}, 总长度: {len(full_text)}")
-                                
-                                # 发送流式片段
-                                await manager.send_json({
-                                    "type": "chat_stream",
-                                    "chunk": chunk.text,
-                                    "full_text": full_text
-                                }, client_id)
-                                
-                                # 添加延迟，让前端有时间渲染每个片段（100ms）
-                                await asyncio.sleep(0.1)
-                        
-                        print(f"[INFO] ✅ 流式输出完成 - 共 {chunk_count} 个片段, 总长度: {len(full_text)} 字符")
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                    chat_first_token_stats[history_mode].record(first_token_at - started_at)
+                                await writer.write(chunk.text)
                         
                         # 发送完成状态
-                        await manager.send_json({
-                            "type": "chat_response",
-                            "message": full_text,
-                            "is_complete": True
-                        }, client_id)
+                        extra = None
+                        if conversation:
+                            extra = {"usage": _chat_usage(conversation, user_message, usage_metadata, started_at, first_token_at)}
+                        await writer.close(extra)
+                        stats = writer.stats()
+                        print(f"[INFO] ✅ 流式输出完成 (协议 v{protocol}) - 共 {stats['chunks']} 个片段 / {stats['messages']} 条消息, "
+                              f"总长度: {stats['text_chars']} 字符, 传输 {stats['wire_bytes']} 字节, 末个片段耗时 {stats['time_to_last_token_ms']} ms")
+                        response_text = writer.full_text
                     else:
                         # 非流式输出（一次性返回）
                         print(f"[INFO] 📦 使用非流式模式...")
-                        response_text = video_llm.chat(user_message, history, model_name=model_name, stream=False)
+                        response_text = await video_llm.achat(
+                            user_message, history, model_name=model_name, stream=False, conversation=conversation
+                        )
+                        chat_first_token_stats[history_mode].record(time.perf_counter() - started_at)
                         
-                        await manager.send_json({
+                        response = {
                             "type": "chat_response",
                             "message": response_text
+                        }
+                        if conversation:
+                            response["usage"] = _chat_usage(conversation, user_message, None, started_at, None)
+                        await manager.send_json(response, client_id)
+
+                    if conversation:
+                        # 本轮提问与回复会随下一轮的历史增量到达，提前在后台折叠，摘要不占用下一轮的首字延迟
+                        pending_tokens = estimate_tokens(user_message) + estimate_tokens(response_text)
+                        asyncio.ensure_future(_summarize_conversation(conversation, pending_tokens))
+                        
+                elif message_data.get("type") == "chat_resume":
+                    # 断线重连后续传 (v2)：重发 seq 大于 last_seq 的帧
+                    frames = chat_stream_log.frames_after(
+                        client_id, message_data.get("stream_id"), int(message_data.get("last_seq", 0))
+                    )
+                    if frames is None:
+                        await manager.send_json({
+                            "type": "chat_resume_failed",
+                            "stream_id": message_data.get("stream_id")
                         }, client_id)
+                    else:
+                        print(f"[INFO] 🔁 续传流式回复: {len(frames)} 帧")
+                        for frame in frames:
+                            await manager.send_json(frame, client_id)
                         
             except json.JSONDecodeError:
                 print(f"[ERROR] ❌ JSON 解析失败")
@@ -176,100 +276,217 @@ async def refresh_rag():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def process_video_task(file_path: str, session_path: str, client_id: str, loop: asyncio.AbstractEventLoop, prompt: str = None, model_name: str = "gemini-3-pro-preview"):
+def _example_index_fingerprint(videos):
+    """范例视频索引指纹，索引重建后推荐缓存随之失效"""
+    names = "\n".join(sorted(v["filename"] for v in videos))
+    return hashlib.sha256(names.encode("utf-8")).hexdigest()
+
+async def _match_example_videos(text_analysis, prompt, progress_callback, job_key=None):
+    """LLM 推荐 + 关键词搜索补充，匹配相关的范例视频"""
+    example_videos = []
     try:
+        progress_callback("正在匹配相关范例视频...")
+        
+        # 确保索引已加载
+        if not example_video_index.video_index:
+            example_video_index.load_index()
+        
+        all_videos = example_video_index.video_index
+
+        fingerprint = _example_index_fingerprint(all_videos)
+        cached = await asyncio.to_thread(result_cache.get_json, "recommend", job_key, fingerprint) if job_key else None
+        if cached is not None:
+            print(f"[INFO] ♻️ 命中推荐缓存: {len(cached)} 个视频")
+            return cached
+        
+        # 1. 尝试使用 LLM 进行智能推荐
+        recommended_ids = await video_llm.arecommend_videos(text_analysis, all_videos)
+        
+        if recommended_ids:
+            print(f"[INFO] 🎯 LLM 推荐了 {len(recommended_ids)} 个视频")
+            for vid in recommended_ids:
+                video = next((v for v in all_videos if v['filename'] == vid), None)
+                if video:
+                    example_videos.append({
+                        "filename": video["filename"],
+                        "category": video["category"],
+                        "tags": video["tags"],
+                        "download_url": f"/api/example-video/{video['relative_path']}",
+                        "relevance_score": 90  # LLM 推荐的高置信度
+                    })
+        
+        # 2. 如果 LLM 推荐不足 3 个，使用关键词搜索补充
+        if len(example_videos) < 3:
+            print("[INFO] 🔍 补充关键词搜索结果...")
+            search_query = text_analysis if text_analysis else ""
+            if prompt:
+                search_query += " " + prompt
+            
+            # 排除已经推荐的视频
+            existing_ids = {v['filename'] for v in example_videos}
+            
+            keyword_results = example_video_index.search_videos(search_query, max_results=5)
+            
+            for video in keyword_results:
+                if video['filename'] not in existing_ids:
+                    example_videos.append({
+                        "filename": video["filename"],
+                        "category": video["category"],
+                        "tags": video["tags"],
+                        "download_url": f"/api/example-video/{video['relative_path']}",
+                        "relevance_score": video.get("relevance_score", 0)
+                    })
+                    if len(example_videos) >= 5:
+                        break
+
+        if job_key:
+            await asyncio.to_thread(result_cache.put_json, "recommend", job_key, example_videos, fingerprint)
+                        
+    except Exception as e:
+        print(f"[WARNING] 搜索范例视频失败: {e}")
+        import traceback
+        traceback.print_exc()
+    return example_videos
+
+async def process_video_task(file_path: str, session_path: str, client_id: str, prompt: str = None, model_name: str = "gemini-3-pro-preview"):
+    """视频生成任务：在事件循环中运行，阻塞操作（哈希、缓存读写、预处理）放到线程中执行"""
+    loop = asyncio.get_running_loop()
+    try:
+        # 预处理等步骤在线程中回调，统一通过 run_coroutine_threadsafe 投递到事件循环
         def progress_callback(msg):
             asyncio.run_coroutine_threadsafe(
                 manager.send_json({"type": "progress", "message": msg}, client_id),
                 loop
             )
 
-        # 1. LLM Pipeline
-        progress_callback("正在分析视频...")
-        script_data, text_analysis = video_llm.process_video_pipeline(file_path, user_prompt=prompt, progress_callback=progress_callback, model_name=model_name)
-        
-        # 2. Render Video
-        progress_callback("开始制作演示视频...")
         session_id = os.path.basename(session_path)
         output_filename = "final_output.mp4"
-        
-        # 使用 asyncio.run_coroutine_threadsafe 来运行异步函数，并传递 progress_callback
-        future = asyncio.run_coroutine_threadsafe(
-            render_final_video(script_data, session_id, progress_callback),
-            loop
-        )
-        # 等待视频渲染完成
-        future.result()
-        
-        progress_callback("视频生成完成！")
-        
+
+        # 渐进式输出：每个片段就绪后通知前端，可边渲染边播放
+        def segment_callback(segment):
+            asyncio.run_coroutine_threadsafe(
+                manager.send_json({"type": "segment", **segment}, client_id),
+                loop
+            )
+
+        # 任务按依赖图执行：范例视频推荐只依赖视频理解结果，与 RAG、脚本生成、渲染并行
+        #   lookup -> understand -> rag -> script -> render -> store
+        #                       \-> recommend
+        # 流式脚本模式下 render 只依赖 rag，通过队列逐页接收 script 产出的幻灯片
+        streaming = settings.SCRIPT_STREAMING
+        slide_queue = asyncio.Queue()
+
+        async def slide_source():
+            while True:
+                slide = await slide_queue.get()
+                if slide is None:
+                    return
+                yield slide
+
+        async def lookup():
+            # 结果缓存：同一视频 + 提示词 + 模型 + 知识库版本的重复任务（如断线重试）直接复用结果
+            if not settings.RESULT_CACHE:
+                return None, None
+            video_hash = await asyncio.to_thread(hash_file, file_path)
+            job_key = result_cache.job_key(video_hash, prompt, model_name)
+            analysis = await asyncio.to_thread(result_cache.get_json, "analysis", job_key)
+            if analysis:
+                progress_callback("♻️ 命中分析缓存，跳过视频理解与脚本生成")
+            return job_key, analysis
+
+        async def understand(cached):
+            _, analysis = cached
+            if analysis:
+                return analysis["raw_description"]
+            progress_callback("正在分析视频...")
+            return await video_llm.aanalyze_video(file_path, user_prompt=prompt, progress_callback=progress_callback, model_name=model_name)
+
+        async def rag(cached, text_analysis):
+            if cached[1]:
+                return None
+            return await video_llm.aquery_knowledge(text_analysis, progress_callback)
+
+        async def script(cached, text_analysis, rag_context):
+            """返回 (脚本, 是否完整)；只有完整的脚本才写入结果缓存"""
+            job_key, analysis = cached
+            status = {}
+            try:
+                if analysis:
+                    script_data = analysis["script_data"]
+                    for slide in script_data.get("slides", []):
+                        slide_queue.put_nowait(slide)
+                    return script_data, True
+                if streaming:
+                    slides = []
+                    async for slide in video_llm.astream_script(text_analysis, rag_context, user_prompt=prompt, progress_callback=progress_callback, model_name=model_name, status=status):
+                        slides.append(slide)
+                        slide_queue.put_nowait(slide)
+                    script_data = {"slides": slides}
+                else:
+                    script_data = await video_llm.agenerate_script(text_analysis, rag_context, user_prompt=prompt, progress_callback=progress_callback, model_name=model_name, status=status)
+                    for slide in script_data.get("slides", []):
+                        slide_queue.put_nowait(slide)
+            finally:
+                slide_queue.put_nowait(None)
+            # 默认脚本、中途出错或被截断的脚本不缓存，重试时重新生成
+            complete = status.get("complete", False)
+            if job_key and complete:
+                await asyncio.to_thread(result_cache.put_json, "analysis", job_key, {"raw_description": text_analysis, "script_data": script_data})
+            return script_data, complete
+
+        async def render(cached, upstream):
+            job_key, analysis = cached
+            # 视频缓存按脚本内容寻址：只有渲染前已知完整脚本时才查找
+            # （分析缓存命中，或批量模式下脚本已生成）；流式模式下新生成的脚本直接渲染
+            script_data = None
+            if analysis:
+                script_data = analysis["script_data"]
+            elif not streaming and upstream[1]:
+                script_data = upstream[0]
+            if job_key and script_data is not None and await asyncio.to_thread(
+                    result_cache.fetch_video, result_cache.script_digest(script_data), session_path):
+                progress_callback("♻️ 命中视频缓存，直接使用已生成的演示视频")
+                return True
+            progress_callback("开始制作演示视频...")
+            source = slide_source() if streaming else {"slides": [slide async for slide in slide_source()]}
+            await render_final_video(source, session_id, progress_callback, segment_callback=segment_callback)
+            return False
+
+        async def store(cached, script_result, cache_hit):
+            job_key = cached[0]
+            script_data, complete = script_result
+            if job_key and not cache_hit and complete:
+                await asyncio.to_thread(result_cache.put_video, result_cache.script_digest(script_data), session_path)
+            progress_callback("视频生成完成！")
+
+        async def recommend(cached, text_analysis):
+            # 搜索相关的范例视频
+            return await _match_example_videos(text_analysis, prompt, progress_callback, cached[0])
+
+        dag = DAGExecutor()
+        dag.add("lookup", lookup)
+        dag.add("understand", understand, deps=["lookup"])
+        dag.add("rag", rag, deps=["lookup", "understand"])
+        dag.add("script", script, deps=["lookup", "understand", "rag"])
+        dag.add("render", render, deps=["lookup", "rag" if streaming else "script"])
+        dag.add("store", store, deps=["lookup", "script", "render"])
+        dag.add("recommend", recommend, deps=["lookup", "understand"])
+        results = await dag.run()
+
+        text_analysis = results["understand"]
+        example_videos = results["recommend"]
         download_url = f"/api/download/{session_id}/{output_filename}"
+        timings = dag.report()
+        print(f"[INFO] ⏱️ 任务耗时 {timings['total_ms']} ms，关键路径: {' -> '.join(timings['critical_path'])}")
         
-        # 搜索相关的范例视频
-        example_videos = []
-        try:
-            progress_callback("正在匹配相关范例视频...")
-            
-            # 确保索引已加载
-            if not example_video_index.video_index:
-                example_video_index.load_index()
-            
-            all_videos = example_video_index.video_index
-            
-            # 1. 尝试使用 LLM 进行智能推荐
-            recommended_ids = video_llm.recommend_videos(text_analysis, all_videos)
-            
-            if recommended_ids:
-                print(f"[INFO] 🎯 LLM 推荐了 {len(recommended_ids)} 个视频")
-                for vid in recommended_ids:
-                    video = next((v for v in all_videos if v['filename'] == vid), None)
-                    if video:
-                        example_videos.append({
-                            "filename": video["filename"],
-                            "category": video["category"],
-                            "tags": video["tags"],
-                            "download_url": f"/api/example-video/{video['relative_path']}",
-                            "relevance_score": 90  # LLM 推荐的高置信度
-                        })
-            
-            # 2. 如果 LLM 推荐不足 3 个，使用关键词搜索补充
-            if len(example_videos) < 3:
-                print("[INFO] 🔍 补充关键词搜索结果...")
-                search_query = text_analysis if text_analysis else ""
-                if prompt:
-                    search_query += " " + prompt
-                
-                # 排除已经推荐的视频
-                existing_ids = {v['filename'] for v in example_videos}
-                
-                keyword_results = example_video_index.search_videos(search_query, max_results=5)
-                
-                for video in keyword_results:
-                    if video['filename'] not in existing_ids:
-                        example_videos.append({
-                            "filename": video["filename"],
-                            "category": video["category"],
-                            "tags": video["tags"],
-                            "download_url": f"/api/example-video/{video['relative_path']}",
-                            "relevance_score": video.get("relevance_score", 0)
-                        })
-                        if len(example_videos) >= 5:
-                            break
-                            
-        except Exception as e:
-            print(f"[WARNING] 搜索范例视频失败: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        asyncio.run_coroutine_threadsafe(
-            manager.send_json({
-                "type": "complete",
-                "download_url": download_url,
-                "text_analysis": text_analysis,
-                "example_videos": example_videos
-            }, client_id),
-            loop
-        )
+        await manager.send_json({
+            "type": "complete",
+            "download_url": download_url,
+            "captions_url": f"/api/download/{session_id}/captions.vtt",
+            "text_analysis": text_analysis,
+            "example_videos": example_videos,
+            "timings": timings
+        }, client_id)
         
     except Exception as e:
         import traceback
@@ -285,13 +502,10 @@ def process_video_task(file_path: str, session_path: str, client_id: str, loop:
             
         print(f"[ERROR] {error_msg}")
         traceback.print_exc()
-        asyncio.run_coroutine_threadsafe(
-            manager.send_json({
-                "type": "error",
-                "message": error_msg
-            }, client_id),
-            loop
-        )
+        await manager.send_json({
+            "type": "error",
+            "message": error_msg
+        }, client_id)
 
 @router.post("/upload-user-video")
 async def upload_user_video(
@@ -329,8 +543,7 @@ async def generate_video(
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    loop = asyncio.get_running_loop()
-    background_tasks.add_task(process_video_task, file_path, session_path, client_id, loop, prompt, model)
+    background_tasks.add_task(process_video_task, file_path, session_path, client_id, prompt, model)
     
     return {"status": "processing", "session_id": session_id}
 
@@ -344,7 +557,7 @@ async def generate_title(request: dict = Body(...)):
         if not first_message:
             return {"title": "新对话"}
         
-        title = video_llm.generate_session_title(first_message, model_name)
+        title = await video_llm.agenerate_session_title(first_message, model_name)
         return {"title": title}
     except Exception as e:
         print(f"[ERROR] 生成标题失败: {e}")
@@ -395,10 +608,21 @@ async def upload_pdf(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
+@router.post("/result_cache/invalidate")
+async def invalidate_result_cache():
+    """清空端到端结果缓存（知识库、模板或模型行为变化后调用）"""
+    result_cache.invalidate()
+    return {"status": "success", "message": "结果缓存已清空"}
+
 @router.get("/download/{session_id}/{filename}")
 async def download_file(session_id: str, filename: str):
     file_path = os.path.join(settings.TEMP_DIR, session_id, filename)
     if os.path.exists(file_path):
+        # HLS 片段的 MIME 类型无法从扩展名正确推断
+        if filename.endswith(".ts"):
+            return FileResponse(file_path, media_type="video/mp2t")
+        if filename.endswith(".m3u8"):
+            return FileResponse(file_path, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
         return FileResponse(file_path)
     raise HTTPException(status_code=404, detail="File not found")
 
@@ -461,4 +685,28 @@ async def rebuild_example_index():
             "total": len(index)
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"重建索引失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"重建索引失败: {str(e)}")
+
+@router.get("/metrics")
+async def get_metrics():
+    """获取性能指标（缓存命中率等），用于容量规划"""
+    return {
+        "status": "success",
+        "slide_cache": slide_cache.stats(),
+        "tts_cache": tts_cache.stats(),
+        "tts": tts_router.stats(),
+        "video_files": video_file_store.stats(),
+        "preprocess_cache": preprocess_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_coalesce": video_llm.coalesce_stats(),
+        "service_backend": backend_stats(),
+        "embeddings": rag_engine.embedding_model.stats(),
+        "rag": rag_engine.stats(),
+        "chat": {
+            "first_token": {mode: stats.snapshot() for mode, stats in chat_first_token_stats.items()},
+            "tokens": dict(chat_token_totals),
+            "conversations": conversation_store.stats(),
+            "context_cache": context_cache.stats()
+        }
+    }
@@ -18,11 +18,161 @@ class Settings:
     FONTS_DIR = os.path.join(BASE_DIR, "fonts")
     
     VECTOR_DB_DIR = os.path.join(DATA_DIR, "chroma_db")
+    # 知识库版本号，每次内容变更时递增（放在向量库目录之外，不影响其存在性判断）
+    KB_VERSION_FILE = os.path.join(DATA_DIR, "kb_version.txt")
     PDF_PATH = os.path.join(DATA_DIR, "knowledge.pdf")
     
     # 范例视频目录
     EXAMPLE_VIDEO_DIR = os.path.join(DATA_DIR, "范例视频")
 
+    # 范例视频推荐：先在本地向量预筛选出前 N 个候选再交给 LLM 重排（0 = 整个视频库都放入提示词）
+    RECOMMEND_SHORTLIST_N = int(os.getenv("RECOMMEND_SHORTLIST_N", "30"))
+
+    # 视频发送方式: upload = 通过 Files API 上传一次并复用句柄; inline = 每次请求内联视频数据
+    VIDEO_TRANSFER_MODE = os.getenv("VIDEO_TRANSFER_MODE", "upload")
+    # 内容哈希 -> 远端文件句柄 的索引及句柄有效期（秒）
+    VIDEO_FILE_INDEX = os.path.join(DATA_DIR, "cache", "video_files.json")
+    VIDEO_FILE_TTL = float(os.getenv("VIDEO_FILE_TTL", str(47 * 3600)))
+    # 等待远端文件处理完成 (PROCESSING -> ACTIVE) 的最长时间（秒），超时后删除远端文件并改为内联发送
+    VIDEO_UPLOAD_TIMEOUT = float(os.getenv("VIDEO_UPLOAD_TIMEOUT", "300"))
+    # 上传遇到超时、5xx 等临时故障后，间隔多少秒再尝试上传（期间内联发送）
+    VIDEO_UPLOAD_RETRY = float(os.getenv("VIDEO_UPLOAD_RETRY", "300"))
+
+    # 分析前的视频预处理：ffprobe 探测后缩放、降帧率、去音轨重新编码，减小上传体积与推理耗时
+    VIDEO_PREPROCESS = os.getenv("VIDEO_PREPROCESS", "1") == "1"
+    PREPROCESS_HEIGHT = int(os.getenv("PREPROCESS_HEIGHT", "480"))
+    PREPROCESS_FPS = int(os.getenv("PREPROCESS_FPS", "5"))
+    PREPROCESS_CRF = int(os.getenv("PREPROCESS_CRF", "30"))
+    PREPROCESS_KEEP_AUDIO = os.getenv("PREPROCESS_KEEP_AUDIO", "0") == "1"
+    # 超过最大时长（秒，0 为不限制）的视频: trim = 只分析开头部分; reject = 直接拒绝
+    PREPROCESS_MAX_DURATION = float(os.getenv("PREPROCESS_MAX_DURATION", "180"))
+    PREPROCESS_OVER_LIMIT = os.getenv("PREPROCESS_OVER_LIMIT", "trim")
+    PREPROCESS_MAX_WORKERS = int(os.getenv("PREPROCESS_MAX_WORKERS", "2"))
+    PREPROCESS_CACHE_DIR = os.path.join(DATA_DIR, "cache", "preprocessed")
+    PREPROCESS_CACHE_MAX_BYTES = int(os.getenv("PREPROCESS_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+    # 端到端结果缓存：相同视频 + 提示词 + 模型 + 知识库版本直接复用分析、脚本、推荐与最终视频
+    RESULT_CACHE = os.getenv("RESULT_CACHE", "1") == "1"
+    RESULT_CACHE_DIR = os.path.join(DATA_DIR, "cache", "results")
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+    # 流式生成脚本：每解析出一页幻灯片就开始渲染，与后续页面的生成重叠
+    # 流式模式下逐页编译与合成，不走 SLIDE_COMPILE_MODE=batch 与 TTS_BATCH 的批量路径
+    SCRIPT_STREAMING = os.getenv("SCRIPT_STREAMING", "1") == "1"
+
+    # 对话流式协议：1 = 旧协议（每片段附带全文）; 2 = 增量 + 序号，可断线续传
+    # 客户端可在 chat 消息中通过 "protocol" 字段自行协商，此处为未声明时的默认值
+    CHAT_STREAM_PROTOCOL = int(os.getenv("CHAT_STREAM_PROTOCOL", "1"))
+    # v2 片段合并策略：最多等待 FLUSH_INTERVAL 毫秒，或累计 FLUSH_CHARS 个字符立即发送
+    CHAT_FLUSH_INTERVAL_MS = int(os.getenv("CHAT_FLUSH_INTERVAL_MS", "50"))
+    CHAT_FLUSH_CHARS = int(os.getenv("CHAT_FLUSH_CHARS", "64"))
+
+    # 服务端对话状态：按会话保存历史，只向模型发送 摘要 + 预算内的最近轮次
+    CHAT_SERVER_HISTORY = os.getenv("CHAT_SERVER_HISTORY", "1") == "1"
+    # 最近轮次的 token 预算，超出后较早的轮次折叠进滚动摘要
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+    CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gemini-2.0-flash")
+    # 系统指令 + 摘要 + 较早轮次 组成的前缀走提供方上下文缓存；前缀低于 MIN_TOKENS 或接口不支持时照常携带
+    CHAT_CONTEXT_CACHE = os.getenv("CHAT_CONTEXT_CACHE", "1") == "1"
+    CHAT_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CHAT_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+    CHAT_CONTEXT_CACHE_TTL = int(os.getenv("CHAT_CONTEXT_CACHE_TTL", "3600"))
+    # 创建缓存遇到限流、过载等临时故障后，间隔多少秒再重试
+    CHAT_CONTEXT_CACHE_RETRY = float(os.getenv("CHAT_CONTEXT_CACHE_RETRY", "300"))
+
+    # 出站 LLM 调用调度：按模型的令牌桶限速（每分钟请求数，0 = 不限速），突发上限 LLM_BURST
+    LLM_RPM = float(os.getenv("LLM_RPM", "60"))
+    # 按模型覆盖，逗号分隔，例如 "gemini-3-pro-preview=20,gemini-2.0-flash=120"
+    LLM_MODEL_RPM = os.getenv("LLM_MODEL_RPM", "")
+    LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+    # 各优先级的排队上限 (chat > video > batch)，队列满时直接拒绝
+    LLM_QUEUE_LIMIT_CHAT = int(os.getenv("LLM_QUEUE_LIMIT_CHAT", "64"))
+    LLM_QUEUE_LIMIT_VIDEO = int(os.getenv("LLM_QUEUE_LIMIT_VIDEO", "32"))
+    LLM_QUEUE_LIMIT_BATCH = int(os.getenv("LLM_QUEUE_LIMIT_BATCH", "8"))
+    # 429/503 时限速减半并暂停 BACKOFF_BASE * 2^n 秒（不超过 BACKOFF_MAX），成功后逐步恢复
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "2"))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+    # 相同请求（模型 + 内容 + 配置）并发时合并为一次上游调用；结果在 COALESCE_TTL 秒内直接复用（0 = 不缓存）
+    LLM_COALESCE = os.getenv("LLM_COALESCE", "1") == "1"
+    LLM_COALESCE_TTL = float(os.getenv("LLM_COALESCE_TTL", "10"))
+
+    # 文档向量化：每批 EMBED_BATCH_SIZE 个片段一次请求，最多 EMBED_MAX_CONCURRENCY 批并发，失败的批次单独重试
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+    EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "1.0"))
+
+    # 持久化向量缓存 (SQLite)，按 (模型, 归一化文本哈希) 寻址；DTYPE 为 float16（体积减半）或 float32
+    EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+    EMBED_CACHE_PATH = os.path.join(DATA_DIR, "cache", "embeddings.sqlite3")
+    EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float16")
+    # 查询向量的内存 LRU 容量
+    EMBED_QUERY_LRU_SIZE = int(os.getenv("EMBED_QUERY_LRU_SIZE", "1024"))
+
+    # 外部服务后端 (Gemini / Embedding / TTS):
+    # live = 直连; record = 直连并录制响应; replay = 只回放录制（无网络）; synthetic = 合成响应
+    SERVICE_BACKEND = os.getenv("SERVICE_BACKEND", "live")
+    RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", os.path.join(DATA_DIR, "recordings"))
+    # 回放时按录制的延迟与流式节奏等待；关闭时立即返回
+    REPLAY_REALTIME = os.getenv("REPLAY_REALTIME", "0") == "1"
+    # synthetic 后端：延迟为对数正态分布（中位数 + sigma），流式输出按固定节奏分片
+    SYNTHETIC_SEED = int(os.getenv("SYNTHETIC_SEED", "0"))
+    SYNTHETIC_LLM_LATENCY_MS = float(os.getenv("SYNTHETIC_LLM_LATENCY_MS", "800"))
+    SYNTHETIC_EMBED_LATENCY_MS = float(os.getenv("SYNTHETIC_EMBED_LATENCY_MS", "60"))
+    SYNTHETIC_TTS_LATENCY_MS = float(os.getenv("SYNTHETIC_TTS_LATENCY_MS", "300"))
+    SYNTHETIC_LATENCY_SIGMA = float(os.getenv("SYNTHETIC_LATENCY_SIGMA", "0.4"))
+    SYNTHETIC_CHUNK_MS = float(os.getenv("SYNTHETIC_CHUNK_MS", "30"))
+    SYNTHETIC_CHUNK_CHARS = int(os.getenv("SYNTHETIC_CHUNK_CHARS", "8"))
+    SYNTHETIC_RESPONSE_CHARS = int(os.getenv("SYNTHETIC_RESPONSE_CHARS", "400"))
+    SYNTHETIC_EMBEDDING_DIM = int(os.getenv("SYNTHETIC_EMBEDDING_DIM", "768"))
+    # 注入故障的概率（一半 429、一半 503）
+    SYNTHETIC_FAULT_RATE = float(os.getenv("SYNTHETIC_FAULT_RATE", "0"))
+
+    # 视频渲染并发配置
+    # RENDER_CONCURRENT=0 时回退为逐页串行渲染
+    RENDER_CONCURRENT = os.getenv("RENDER_CONCURRENT", "1") == "1"
+    # LaTeX 编译进程池大小
+    LATEX_MAX_WORKERS = int(os.getenv("LATEX_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # 幻灯片编译方式: batch = 整份脚本一次编译为多页 Beamer; per_slide = 逐页编译
+    SLIDE_COMPILE_MODE = os.getenv("SLIDE_COMPILE_MODE", "batch")
+    # 是否使用预编译的 LaTeX 导言区格式文件 (.fmt)
+    LATEX_FORMAT_CACHE = os.getenv("LATEX_FORMAT_CACHE", "1") == "1"
+    LATEX_FORMAT_DIR = os.path.join(TEMP_DIR, "latex_fmt")
+    # 导言区格式构建失败后，间隔多少秒再重试（失败只记在进程内存中）
+    LATEX_FORMAT_RETRY = float(os.getenv("LATEX_FORMAT_RETRY", "600"))
+    # 跨会话共享的幻灯片图片缓存（内容寻址，LRU 淘汰）
+    SLIDE_CACHE_DIR = os.path.join(DATA_DIR, "cache", "slides")
+    SLIDE_CACHE_MAX_BYTES = int(os.getenv("SLIDE_CACHE_MAX_MB", "512")) * 1024 * 1024
+    # 视频编码后端: ffmpeg = 静态图片片段 + concat 无重编码拼接; moviepy = 旧的逐帧合成
+    VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "ffmpeg")
+    # 静态幻灯片片段的帧率
+    STILL_FRAME_RATE = int(os.getenv("STILL_FRAME_RATE", "2"))
+    # 渐进式输出：片段编码完成即发布到 HLS 播放列表（仅 ffmpeg 编码后端）
+    PROGRESSIVE_OUTPUT = os.getenv("PROGRESSIVE_OUTPUT", "1") == "1"
+    # 同时运行的 ffmpeg 片段编码数量
+    FFMPEG_MAX_CONCURRENCY = int(os.getenv("FFMPEG_MAX_CONCURRENCY", "2"))
+    # 同时进行的 TTS 合成数量
+    TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+    # 整份脚本的讲解词在一次 Edge-TTS 会话中批量合成后按页切分
+    TTS_BATCH = os.getenv("TTS_BATCH", "1") == "1"
+    # TTS 服务优先级，逗号分隔：edge = Edge 在线服务, local = espeak-ng 离线引擎
+    TTS_PROVIDERS = os.getenv("TTS_PROVIDERS", "edge,local")
+    LOCAL_TTS_VOICE = os.getenv("LOCAL_TTS_VOICE", "cmn")
+    # 单次合成超时与重试退避（秒）
+    TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "20"))
+    TTS_RETRY_BACKOFF = float(os.getenv("TTS_RETRY_BACKOFF", "0.5"))
+    # TTS 熔断器：最近 WINDOW 次调用中失败率达到 FAILURE_RATE 时熔断 COOLDOWN 秒
+    TTS_BREAKER_WINDOW = int(os.getenv("TTS_BREAKER_WINDOW", "20"))
+    TTS_BREAKER_MIN_CALLS = int(os.getenv("TTS_BREAKER_MIN_CALLS", "4"))
+    TTS_BREAKER_FAILURE_RATE = float(os.getenv("TTS_BREAKER_FAILURE_RATE", "0.5"))
+    TTS_BREAKER_COOLDOWN = float(os.getenv("TTS_BREAKER_COOLDOWN", "30"))
+    # TTS 音色与语速
+    TTS_VOICE = os.getenv("TTS_VOICE", "zh-CN-YunxiNeural")
+    TTS_RATE = os.getenv("TTS_RATE", "+0%")
+    # 持久化 TTS 音频缓存（按讲解词、音色、语速寻址）
+    TTS_CACHE_DIR = os.path.join(DATA_DIR, "cache", "tts")
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024
+
 settings = Settings()
 
 # 确保目录存在
@@ -0,0 +1,79 @@
+import time
+import threading
+from collections import deque
+
+class CircuitBreaker:
+    """
+    熔断器：统计最近 window 次调用的失败率
+    - closed: 正常放行；失败率超过阈值后进入 open
+    - open: 直接拒绝，快速失败；冷却 cooldown 秒后进入 half_open
+    - half_open: 只放行一次探测调用，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, name: str, failure_threshold: float = 0.5, window: int = 20,
+                 min_calls: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.rejected = 0
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允许发起一次调用"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def is_open(self) -> bool:
+        """是否处于冷却中的 open 状态（只读，不占用 half_open 的探测名额）"""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half_open":
+                print(f"[INFO] 🔌 熔断器恢复: {self.name}")
+                self.state = "closed"
+                self._results.clear()
+            self._probing = False
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._results.append(False)
+            self._probing = False
+            if self.state == "half_open":
+                self._trip()
+                return
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        print(f"[WARN] ⚡ 熔断器打开: {self.name}，{self.cooldown:.0f} 秒内快速失败")
+        self.state = "open"
+        self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_failures": self._results.count(False),
+                "recent_calls": len(self._results),
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,90 @@
+import time
+import asyncio
+
+class DAGExecutor:
+    """
+    按依赖关系并发执行异步阶段：每个阶段在其依赖全部完成后立即启动，
+    互不依赖的阶段同时运行。记录各阶段起止时间，并给出关键路径。
+
+    用法:
+        dag = DAGExecutor()
+        dag.add("a", fetch_a)
+        dag.add("b", build_b, deps=["a"])
+        results = await dag.run()   # {"a": ..., "b": ...}
+
+    阶段函数为协程函数，参数为依赖阶段的结果（按 deps 顺序传入）。
+    """
+
+    def __init__(self):
+        self._stages = {}   # name -> (fn, deps)
+        self.timings = {}   # name -> {"start": 秒, "end": 秒}
+        self._origin = None
+
+    def add(self, name, fn, deps=()):
+        if name in self._stages:
+            raise ValueError(f"阶段重复定义: {name}")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"阶段 {name} 依赖未定义的阶段 {dep}（需先添加依赖）")
+        self._stages[name] = (fn, tuple(deps))
+
+    async def run(self) -> dict:
+        """执行所有阶段；任一阶段失败时取消其余阶段并抛出该异常"""
+        self._origin = time.perf_counter()
+        tasks = {}
+
+        async def run_stage(name):
+            fn, deps = self._stages[name]
+            args = [await tasks[dep] for dep in deps]
+            start = time.perf_counter() - self._origin
+            try:
+                return await fn(*args)
+            finally:
+                self.timings[name] = {"start": start, "end": time.perf_counter() - self._origin}
+
+        # 依赖总是先于使用者添加，按添加顺序创建任务即可
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # 等待取消完成，避免遗留任务
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    def critical_path(self) -> list:
+        """
+        关键路径：从最晚结束的阶段出发，逐级回溯到最晚完成的依赖
+        （即实际卡住它启动的那个阶段）
+        """
+        if not self.timings:
+            return []
+        current = max(self.timings, key=lambda name: self.timings[name]["end"])
+        path = [current]
+        while True:
+            deps = [dep for dep in self._stages[current][1] if dep in self.timings]
+            if not deps:
+                break
+            current = max(deps, key=lambda name: self.timings[name]["end"])
+            path.append(current)
+        return list(reversed(path))
+
+    def report(self) -> dict:
+        """各阶段耗时与关键路径，单位毫秒"""
+        stages = {
+            name: {
+                "start_ms": round(t["start"] * 1000, 1),
+                "duration_ms": round((t["end"] - t["start"]) * 1000, 1),
+            }
+            for name, t in self.timings.items()
+        }
+        path = self.critical_path()
+        return {
+            "stages": stages,
+            "critical_path": path,
+            "total_ms": round(max(t["end"] for t in self.timings.values()) * 1000, 1) if self.timings else 0.0,
+        }
@@ -0,0 +1,158 @@
+import os
+import hashlib
+import shutil
+import threading
+import uuid
+
+class DiskCache:
+    """
+    基于文件的内容寻址缓存
+    - 键由调用方给出（通常为内容哈希 + 扩展名），文件按键前两位分目录存放
+    - 写入先落到临时文件再 os.replace，多个会话/进程并发读写也不会读到半个文件
+    - 命中时刷新 mtime，超出容量时按 mtime 从旧到新淘汰 (LRU)
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, name: str = "cache"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = None  # 首次使用时扫描目录
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str, track: bool = True):
+        """
+        返回缓存文件路径，未命中返回 None
+
+        Args:
+            track: 是否计入命中统计（读取附属文件时传 False）
+        """
+        path = self._path(key)
+        try:
+            # 刷新访问时间，作为 LRU 依据
+            os.utime(path, None)
+        except FileNotFoundError:
+            if track:
+                with self._lock:
+                    self.misses += 1
+            return None
+        if track:
+            with self._lock:
+                self.hits += 1
+        return path
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """命中时将缓存文件复制到 dest_path"""
+        path = self.get(key)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, dest_path)
+            return True
+        except FileNotFoundError:
+            # 读取前恰好被其他进程淘汰
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+            return False
+
+    def put_file(self, key: str, src_path: str):
+        """将已有文件写入缓存（复制）"""
+        self._commit(key, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+    def put_bytes(self, key: str, data: bytes):
+        """将二进制内容写入缓存"""
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        self._commit(key, write)
+
+    def _commit(self, key: str, writer):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        try:
+            writer(tmp_path)
+            size = os.path.getsize(tmp_path)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size - old_size
+        self._evict_if_needed()
+
+    def _scan(self):
+        """返回 [(mtime, size, path)]，忽略未完成的临时文件"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if ".tmp-" in name:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict_if_needed(self):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            # 其他进程也可能写入，淘汰前重新扫描得到真实占用
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._total_bytes = total
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """流式计算文件 SHA-256，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
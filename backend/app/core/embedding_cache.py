@@ -0,0 +1,135 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def normalize_text(text: str) -> str:
+    """缓存键使用的归一化文本：合并所有空白"""
+    return " ".join(text.split())
+
+class EmbeddingCache:
+    """
+    持久化向量缓存
+    - 键为 sha256(模型 + 归一化文本)，同一文本重复入库或重复查询都不再请求远端模型
+    - 向量以 float16 / float32 二进制存放在 SQLite 中 (WAL 模式，多进程可同时读写)
+    - 查询向量额外有一层内存 LRU，热门查询不访问磁盘
+    """
+
+    def __init__(self, path: str, dtype: str = "float16", lru_size: int = 1024):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"不支持的向量存储类型: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, dtype TEXT NOT NULL,"
+                " dim INTEGER NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _decode(self, dtype: str, blob: bytes) -> list:
+        return np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+
+    def get_many(self, model: str, texts: list) -> list:
+        """返回与 texts 一一对应的向量，未命中的位置为 None"""
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            unique = list(dict.fromkeys(keys))
+            # SQLite 单条语句的参数个数有限，分段查询
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, dtype, blob in rows:
+                    found[key] = (dtype, blob)
+            hits = sum(1 for key in keys if key in found)
+            self.disk_hits += hits
+            self.misses += len(keys) - hits
+        return [self._decode(*found[key]) if key in found else None for key in keys]
+
+    def put_many(self, model: str, texts: list, vectors: list) -> list:
+        """
+        写入向量，返回按存储精度还原后的向量。
+        调用方应使用返回值，保证首次计算与之后命中缓存得到完全相同的向量。
+        """
+        now = time.time()
+        rows = []
+        stored = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=self.dtype).tobytes()
+            rows.append((self.key(model, text), model, self.dtype, len(vector), blob, now))
+            stored.append(self._decode(self.dtype, blob))
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        return stored
+
+    def get_query(self, model: str, text: str):
+        """查询向量：先查内存 LRU，再查 SQLite"""
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        vector = self.get_many(model, [text])[0]
+        if vector is not None:
+            self._remember(key, vector)
+        return vector
+
+    def put_query(self, model: str, text: str, vector: list) -> list:
+        """写入查询向量，返回按存储精度还原后的向量（内存 LRU 中存的也是它）"""
+        vector = self.put_many(model, [text], [vector])[0]
+        self._remember(self.key(model, text), vector)
+        return vector
+
+    def _remember(self, key: str, vector: list):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.memory_hits + self.disk_hits + self.misses
+            entries = 0
+            if os.path.exists(self.path):
+                entries = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "entries": entries,
+                "dtype": self.dtype,
+                "memory_entries": len(self._lru),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / total, 4) if total else 0.0,
+            }
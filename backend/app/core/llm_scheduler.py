@@ -0,0 +1,273 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from app.config import settings
+from app.core.metrics import LatencyStats
+
+# 数值越小优先级越高
+PRIORITIES = {"chat": 0, "video": 1, "batch": 2}
+
+class SchedulerQueueFull(RuntimeError):
+    """对应优先级的排队数已达上限"""
+
+def is_rate_limited(error) -> bool:
+    """是否为限流/过载错误 (429 / 503)"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in (429, 503):
+        return True
+    text = str(error)
+    return any(mark in text for mark in ("429", "503", "RESOURCE_EXHAUSTED", "UNAVAILABLE"))
+
+def _parse_model_rpm(value: str) -> dict:
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            model, rpm = item.split("=", 1)
+            limits[model.strip()] = float(rpm)
+    return limits
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "granted", "cancelled", "event", "loop", "future")
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self.cancelled = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+class _ModelBucket:
+    """单个模型的令牌桶、等待队列与 AIMD 状态；rpm <= 0 表示不限速"""
+
+    def __init__(self, rpm: float, burst: int):
+        self.rpm = rpm
+        self.unlimited = rpm <= 0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.rate_factor = 1.0        # AIMD 系数：限流时减半，成功时线性恢复
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.throttled = 0
+        self.waiters = []             # 堆: (优先级, 序号, waiter)
+        self.depth = {name: 0 for name in PRIORITIES}
+
+    def rate(self) -> float:
+        """当前每秒发放的令牌数"""
+        return self.rpm / 60 * self.rate_factor
+
+    def available(self, now: float) -> float:
+        """推算 now 时刻的令牌数（只读）；退避期间不积累令牌，恢复后不会立即突发"""
+        since = max(self.updated_at, min(self.cooldown_until, now))
+        return min(self.capacity, self.tokens + max(0.0, now - since) * self.rate())
+
+    def refill(self, now: float):
+        self.tokens = self.available(now)
+        self.updated_at = now
+
+class LLMScheduler:
+    """
+    所有出站 LLM 调用共用的调度器，同步（线程）与异步调用方均可使用
+
+    - 每个模型一个令牌桶，限制请求速率与突发
+    - 等待者按优先级出队：chat（交互对话） > video（视频任务） > batch（批处理维护），同级先到先得
+    - 各优先级的排队数有上限，超出时抛出 SchedulerQueueFull，而不是无限堆积
+    - 调用返回 429/503 时 AIMD 退避：速率减半并暂停发放令牌，成功后逐步恢复
+    """
+
+    def __init__(self, rpm: float = None, burst: int = None, model_rpm: dict = None, queue_limits: dict = None):
+        self.rpm = settings.LLM_RPM if rpm is None else rpm
+        self.burst = settings.LLM_BURST if burst is None else burst
+        self.model_rpm = _parse_model_rpm(settings.LLM_MODEL_RPM) if model_rpm is None else model_rpm
+        self.queue_limits = queue_limits or {
+            "chat": settings.LLM_QUEUE_LIMIT_CHAT,
+            "video": settings.LLM_QUEUE_LIMIT_VIDEO,
+            "batch": settings.LLM_QUEUE_LIMIT_BATCH,
+        }
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._seq = itertools.count()
+        self.wait_stats = {name: LatencyStats() for name in PRIORITIES}
+        self.rejected = {name: 0 for name in PRIORITIES}
+
+    # ---------------- 排队与发放 ----------------
+
+    def _bucket(self, model: str) -> _ModelBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = _ModelBucket(self.model_rpm.get(model, self.rpm), self.burst)
+        return bucket
+
+    def _enqueue(self, model: str, waiter: _Waiter) -> _ModelBucket:
+        if waiter.priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {waiter.priority}")
+        with self._lock:
+            bucket = self._bucket(model)
+            if bucket.depth[waiter.priority] >= self.queue_limits[waiter.priority]:
+                self.rejected[waiter.priority] += 1
+                raise SchedulerQueueFull(f"LLM 调用队列已满: {model} / {waiter.priority}")
+            bucket.depth[waiter.priority] += 1
+            heapq.heappush(bucket.waiters, (PRIORITIES[waiter.priority], next(self._seq), waiter))
+        return bucket
+
+    def _dispatch(self, bucket: _ModelBucket) -> float:
+        """（持锁调用）按优先级发放可用令牌，返回距离下一次可发放的秒数"""
+        now = time.monotonic()
+        if now < bucket.cooldown_until:
+            return bucket.cooldown_until - now
+        bucket.refill(now)
+        while bucket.waiters and (bucket.unlimited or bucket.tokens >= 1):
+            _, _, waiter = heapq.heappop(bucket.waiters)
+            if waiter.cancelled:
+                continue
+            if not bucket.unlimited:
+                bucket.tokens -= 1
+            bucket.depth[waiter.priority] -= 1
+            waiter.granted = True
+            waiter.wake()
+        if bucket.unlimited or bucket.tokens >= 1:
+            return 0.0
+        return (1 - bucket.tokens) / bucket.rate()
+
+    def _cancel(self, bucket: _ModelBucket, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                # 已拿到令牌但调用方放弃（如任务被取消），归还令牌
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                bucket.depth[waiter.priority] -= 1
+
+    def _granted(self, waiter: _Waiter):
+        self.wait_stats[waiter.priority].record(time.perf_counter() - waiter.enqueued_at)
+
+    def acquire(self, model: str, priority: str = "video"):
+        """阻塞等待一个调用令牌（同步调用方）"""
+        waiter = _Waiter(priority)
+        waiter.event = threading.Event()
+        bucket = self._enqueue(model, waiter)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch(bucket)
+                if waiter.granted:
+                    break
+                # 被其他调用方发放令牌时提前唤醒，否则到下一个令牌的时间点自行发放
+                waiter.event.wait(max(delay, 0.01))
+        except BaseException:
+            self._cancel(bucket, waiter)
+            raise
+        self._granted(waiter)
+
+    async def aacquire(self, model: str, priority: str = "video"):
+        """等待一个调用令牌（异步调用方），等待期间不阻塞事件循环"""
+        waiter = _Waiter(priority)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        bucket = self._enqueue(model, waiter)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch(bucket)
+                if waiter.granted:
+                    break
+                await asyncio.wait({waiter.future}, timeout=max(delay, 0.01))
+        except BaseException:
+            self._cancel(bucket, waiter)
+            raise
+        self._granted(waiter)
+
+    # ---------------- 结果反馈 ----------------
+
+    def record_result(self, model: str, error: Exception = None):
+        """报告调用结果：成功时速率线性恢复，429/503 时速率减半并指数退避"""
+        with self._lock:
+            bucket = self._bucket(model)
+            if error is None:
+                bucket.consecutive_throttles = 0
+                bucket.rate_factor = min(1.0, bucket.rate_factor + 0.05)
+                return
+            if not is_rate_limited(error):
+                return
+            bucket.throttled += 1
+            backoff = min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** bucket.consecutive_throttles)
+            bucket.consecutive_throttles += 1
+            bucket.rate_factor = max(0.1, bucket.rate_factor / 2)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.cooldown_until = max(bucket.cooldown_until, time.monotonic() + backoff)
+        if bucket.unlimited:
+            print(f"[WARN] 🚦 模型 {model} 被限流，暂停 {backoff:.1f} 秒")
+        else:
+            print(f"[WARN] 🚦 模型 {model} 被限流，速率降至 {bucket.rpm * bucket.rate_factor:.1f} 次/分钟，暂停 {backoff:.1f} 秒")
+
+    def call(self, model: str, fn, priority: str = "video", max_retries: int = None):
+        """
+        在调度下执行同步调用，限流错误自动重新排队重试
+
+        Args:
+            fn: 无参函数，执行一次 LLM 请求
+        """
+        max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            self.acquire(model, priority)
+            try:
+                result = fn()
+            except Exception as e:
+                self.record_result(model, e)
+                if is_rate_limited(e) and attempt < max_retries:
+                    continue
+                raise
+            self.record_result(model)
+            return result
+
+    async def acall(self, model: str, fn, priority: str = "video", max_retries: int = None):
+        """call 的异步版本，fn 为无参协程函数"""
+        max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            await self.aacquire(model, priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                self.record_result(model, e)
+                if is_rate_limited(e) and attempt < max_retries:
+                    continue
+                raise
+            self.record_result(model)
+            return result
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for model, bucket in self._buckets.items():
+                # 只读：不修改令牌桶，轮询 /api/metrics 不会在退避期间补充令牌
+                models[model] = {
+                    "rpm": bucket.rpm,
+                    "effective_rpm": None if bucket.unlimited else round(bucket.rpm * bucket.rate_factor, 1),
+                    "tokens": None if bucket.unlimited else round(bucket.available(now), 2),
+                    "cooldown_s": round(max(0.0, bucket.cooldown_until - now), 1),
+                    "queue_depth": dict(bucket.depth),
+                    "throttled": bucket.throttled,
+                }
+            rejected = dict(self.rejected)
+        return {
+            "models": models,
+            "wait": {name: stats.snapshot() for name, stats in self.wait_stats.items()},
+            "rejected": rejected,
+        }
+
+llm_scheduler = LLMScheduler()
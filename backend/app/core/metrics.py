@@ -0,0 +1,38 @@
+import threading
+from collections import deque
+
+class LatencyStats:
+    """记录调用次数、失败次数与最近一批延迟样本，用于 /api/metrics"""
+
+    def __init__(self, window: int = 200):
+        self.count = 0
+        self.errors = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool = True):
+        with self._lock:
+            self.count += 1
+            if not ok:
+                self.errors += 1
+            self._samples.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors = self.count, self.errors
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            "count": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 1) if samples else 0.0,
+            "p50_ms": round(percentile(0.5) * 1000, 1),
+            "p95_ms": round(percentile(0.95) * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1) if samples else 0.0,
+        }
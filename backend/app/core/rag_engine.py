@@ -1,15 +1,58 @@
 import os
+import time
 import shutil
+import asyncio
+import threading
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from app.service.custom_embedding import AiHubMixEmbeddings
 from app.config import settings
+from app.core.metrics import LatencyStats
 
 class RAGEngine:
     def __init__(self):
         self.embedding_model = AiHubMixEmbeddings()
         self.vector_store = None
+        self._kb_version = None
+        self._kb_version_mtime = None
+        # 切片数量按知识库版本缓存：本进程 add_pdf 时增量维护，
+        # 版本文件被其他进程（其他 worker）更新时重新统计，查询路径不再每次扫描整个集合
+        self._doc_count = None
+        self._count_version = None
+        self._count_lock = threading.Lock()
+        self.phase_stats = {"embed": LatencyStats(), "search": LatencyStats()}
+
+    @staticmethod
+    def _version_mtime():
+        try:
+            return os.stat(settings.KB_VERSION_FILE).st_mtime_ns
+        except OSError:
+            return None
+
+    def kb_version(self) -> int:
+        """知识库版本号，作为下游结果缓存键的一部分；版本文件修改时间变化时重新读取"""
+        mtime = self._version_mtime()
+        if self._kb_version is None or mtime != self._kb_version_mtime:
+            try:
+                with open(settings.KB_VERSION_FILE, "r", encoding="utf-8") as f:
+                    self._kb_version = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                self._kb_version = 0
+            self._kb_version_mtime = mtime
+        return self._kb_version
+
+    def bump_kb_version(self) -> int:
+        """知识库内容变化后递增版本号，使依赖旧知识库的缓存结果失效"""
+        version = self.kb_version() + 1
+        tmp_path = settings.KB_VERSION_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(version))
+        os.replace(tmp_path, settings.KB_VERSION_FILE)
+        self._kb_version = version
+        self._kb_version_mtime = self._version_mtime()
+        print(f"[INFO] 知识库版本更新为 {version}")
+        return version
 
     def initialize_knowledge_base(self):
         """系统启动时：总是尝试加载现有的向量数据库"""
@@ -20,6 +63,9 @@ class RAGEngine:
             persist_directory=settings.VECTOR_DB_DIR,
             embedding_function=self.embedding_model
         )
+        with self._count_lock:
+            self._doc_count = None
+            self._count_version = None
         
         # 如果数据库为空且存在默认 PDF，则加载默认 PDF
         if not os.path.exists(settings.VECTOR_DB_DIR) and os.path.exists(settings.PDF_PATH):
@@ -49,25 +95,94 @@ class RAGEngine:
             self.initialize_knowledge_base()
 
         # 3. 增量添加到数据库 (使用 add_documents 而不是 from_documents)
+        # 向量化在 AiHubMixEmbeddings 中分批并发完成
+        start = time.perf_counter()
         self.vector_store.add_documents(documents=splits)
+        elapsed = time.perf_counter() - start
+        previous_version = self.kb_version()
+        version = self.bump_kb_version()
+        with self._count_lock:
+            # 计数与入库前的版本一致时直接累加，否则留待下次重新统计
+            if self._doc_count is not None and self._count_version == previous_version:
+                self._doc_count += len(splits)
+                self._count_version = version
         
-        print(f"[INFO] 成功添加文档，新增切片数: {len(splits)}")
+        print(f"[INFO] 成功添加文档，新增切片数: {len(splits)}, 入库耗时 {elapsed:.2f}s "
+              f"({len(splits) / max(elapsed, 1e-6):.1f} 片段/秒)")
 
-    def query(self, query_text: str, k=3):
-        """查询接口"""
+    def document_count(self) -> int:
+        """知识库切片数量；知识库版本不变时直接返回缓存值，变化时用集合自带的 count() 重新统计（不扫描文档）"""
+        version = self.kb_version()
+        with self._count_lock:
+            if self._doc_count is None or self._count_version != version:
+                self._doc_count = self.vector_store._collection.count()
+                self._count_version = version
+            return self._doc_count
+
+    def _check_ready(self):
+        """返回知识库不可用时的提示文本，可用时返回 None"""
         if not self.vector_store:
             self.initialize_knowledge_base()
-            
+
         # 检查数据库是否真的有数据（避免空库报错）
         try:
-            if not self.vector_store.get()['ids']:
+            if not self.document_count():
                 return "知识库为空，请先上传 PDF 文档。"
-        except:
+        except Exception:
             return "知识库未初始化。"
+        return None
+
+    def _embed(self, query_text: str):
+        start = time.perf_counter()
+        vector = self.embedding_model.embed_query(query_text)
+        elapsed = time.perf_counter() - start
+        self.phase_stats["embed"].record(elapsed)
+        return vector, elapsed
+
+    def _search(self, vector, k: int):
+        start = time.perf_counter()
+        results = self.vector_store.similarity_search_by_vector(vector, k=k)
+        elapsed = time.perf_counter() - start
+        self.phase_stats["search"].record(elapsed)
+        return "\n".join([doc.page_content for doc in results]), elapsed
+
+    @staticmethod
+    def _log_phases(embed_seconds: float, search_seconds: float):
+        print(f"[INFO] RAG 检索耗时: 向量化 {embed_seconds * 1000:.1f} ms, 相似度搜索 {search_seconds * 1000:.1f} ms")
+
+    def query(self, query_text: str, k=3):
+        """查询接口"""
+        message = self._check_ready()
+        if message:
+            return message
 
         print(f"[INFO] RAG 检索: {query_text}")
-        results = self.vector_store.similarity_search(query_text, k=k)
-        return "\n".join([doc.page_content for doc in results])
+        vector, embed_seconds = self._embed(query_text)
+        context, search_seconds = self._search(vector, k)
+        self._log_phases(embed_seconds, search_seconds)
+        return context
+
+    async def aquery(self, query_text: str, k=3):
+        """
+        query 的异步版本：向量化与相似度搜索都在线程中执行，不阻塞事件循环
+        """
+        message = await asyncio.to_thread(self._check_ready)
+        if message:
+            return message
+
+        print(f"[INFO] RAG 检索: {query_text}")
+        vector, embed_seconds = await asyncio.to_thread(self._embed, query_text)
+        context, search_seconds = await asyncio.to_thread(self._search, vector, k)
+        self._log_phases(embed_seconds, search_seconds)
+        return context
+
+    def stats(self) -> dict:
+        return {
+            "documents": self._doc_count,
+            "kb_version": self.kb_version(),
+            "embed": self.phase_stats["embed"].snapshot(),
+            "search": self.phase_stats["search"].snapshot(),
+        }
 
 # 全局单例
 rag_engine = RAGEngine()
\ No newline at end of file
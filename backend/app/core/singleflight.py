@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+# 领导者被取消时交给跟随者的标记
+_LEADER_CANCELLED = object()
+
+class AsyncSingleFlight:
+    """
+    合并相同键的并发异步调用：同一时刻只有第一个调用者真正执行，
+    其余调用者等待并共享它的结果（或异常）。
+    执行者被取消（如客户端断开）时不影响跟随者，由其中一个跟随者接替重新执行。
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key, fn):
+        """
+        Args:
+            key: 去重键
+            fn: 无参协程函数，只在没有同键调用进行中时执行
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            # shield: 跟随者被取消时不影响正在执行的调用
+            result = await asyncio.shield(future)
+            if result is not _LEADER_CANCELLED:
+                return result
+            # 领导者被取消：跟随者不受影响，重新竞争，第一个醒来的跟随者接替执行
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # 只取消领导者自己，不把取消传递给跟随者
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有跟随者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """AsyncSingleFlight 的线程版本，供同步调用方使用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    def do(self, key, fn):
+        """
+        Args:
+            key: 去重键
+            fn: 无参函数，只在没有同键调用进行中时执行
+        """
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.api.endpoints import router, example_video_index
 from app.core.rag_engine import rag_engine
+from app.service.video_producer import ensure_latex_format
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -19,6 +20,10 @@ async def lifespan(app: FastAPI):
         stats = example_video_index.get_statistics()
         print(f"[SYSTEM] ✅ 范例视频索引加载完成 - 共 {stats['total_videos']} 个视频")
     
+    # 预编译 LaTeX 导言区格式，首次渲染时无需再构建
+    print("[SYSTEM] 正在检查 LaTeX 导言区格式缓存...")
+    ensure_latex_format()
+    
     yield
     # 关闭时执行
     print("[SYSTEM] 系统关闭")
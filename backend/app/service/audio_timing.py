@@ -0,0 +1,122 @@
+"""
+语音时长与字幕工具
+- 通过解析 MP3 帧头计算时长，无需解码音频
+- 将 Edge-TTS 的 WordBoundary 元数据整理为 WebVTT 字幕
+"""
+
+# MPEG Layer III 码率表 (kbps)
+_BITRATES_V1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_BITRATES_V2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+# 采样率表，按版本位 (00=MPEG2.5, 10=MPEG2, 11=MPEG1) 索引
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+def _skip_id3(data):
+    """跳过开头的 ID3v2 标签，返回音频帧起始位置"""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+def mp3_frames(data):
+    """
+    解析 MP3 帧头，返回 [(offset, length, duration_seconds), ...]
+    只支持 Layer III (Edge-TTS 输出即为 MPEG2 Layer III)
+    """
+    frames = []
+    pos = _skip_id3(data)
+    end = len(data)
+    while pos + 4 <= end:
+        header = int.from_bytes(data[pos:pos + 4], "big")
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        sample_rate_index = (header >> 10) & 0x3
+        valid = (
+            (header >> 21) == 0x7FF
+            and version != 1
+            and layer == 1
+            and 0 < bitrate_index < 15
+            and sample_rate_index < 3
+        )
+        if not valid:
+            # 非法帧头，逐字节向后重新同步
+            pos += 1
+            continue
+
+        padding = (header >> 9) & 0x1
+        sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+        if version == 3:
+            bitrate = _BITRATES_V1[bitrate_index] * 1000
+            samples = 1152
+            length = 144 * bitrate // sample_rate + padding
+        else:
+            bitrate = _BITRATES_V2[bitrate_index] * 1000
+            samples = 576
+            length = 72 * bitrate // sample_rate + padding
+
+        if pos + length > end:
+            break
+        frames.append((pos, length, samples / sample_rate))
+        pos += length
+    return frames
+
+def mp3_duration(data):
+    """根据帧头计算 MP3 时长（秒）"""
+    return sum(duration for _, _, duration in mp3_frames(data))
+
+def _join(left, right):
+    # 英文单词之间需要空格，中文不需要
+    if left and right and left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return f"{left} {right}"
+    return left + right
+
+def build_cues(boundaries, start=0.0, max_chars=18, max_gap=0.35):
+    """
+    将 WordBoundary 合并为字幕条目：遇到停顿或长度超限时断句
+
+    Args:
+        boundaries: [{"offset": 秒, "duration": 秒, "text": str}, ...]
+        start: 该段语音在整条视频中的起始时间（秒）
+    Returns:
+        [{"start": 秒, "end": 秒, "text": str}, ...]
+    """
+    cues = []
+    current = None
+    for boundary in boundaries:
+        word_start = start + boundary["offset"]
+        word_end = word_start + boundary["duration"]
+        if current and (
+            word_start - current["end"] > max_gap
+            or len(current["text"]) + len(boundary["text"]) > max_chars
+        ):
+            cues.append(current)
+            current = None
+        if current is None:
+            current = {"start": word_start, "end": word_end, "text": boundary["text"]}
+        else:
+            current["end"] = word_end
+            current["text"] = _join(current["text"], boundary["text"])
+    if current:
+        cues.append(current)
+    return cues
+
+def _format_timestamp(seconds):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+def to_webvtt(cues):
+    """将字幕条目序列化为 WebVTT 文本"""
+    lines = ["WEBVTT", ""]
+    for cue in cues:
+        lines.append(f"{_format_timestamp(cue['start'])} --> {_format_timestamp(cue['end'])}")
+        lines.append(cue["text"])
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,100 @@
+"""
+范例视频候选预筛选：推荐前先在本地用字符 n-gram 向量从整个视频库中挑出最相关的前 N 个，
+LLM 只在这份短名单上重排，提示词长度不再随视频库规模线性增长。
+"""
+import time
+import zlib
+import hashlib
+import threading
+import numpy as np
+from app.config import settings
+
+def _ngrams(text, sizes=(1, 2, 3)):
+    text = "".join(text.lower().split())
+    for n in sizes:
+        for i in range(len(text) - n + 1):
+            yield text[i:i + n]
+
+def _video_text(video):
+    # 文件名与分类各出现一次，标签重复一次以提高权重
+    tags = " ".join(video.get("tags", []))
+    return f"{video.get('filename', '')} {video.get('category', '')} {tags} {tags}"
+
+class CatalogShortlist:
+    """
+    哈希字符 n-gram + IDF 加权的向量检索
+
+    - 视频库向量预先计算并保存在 (视频数 × dim) 的 NumPy 矩阵中，按视频库指纹缓存
+    - 查询时一次矩阵乘法得到余弦相似度，argpartition 取前 N
+    """
+
+    def __init__(self, dim: int = 4096):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._matrix = None
+        self._idf = None
+
+    def _hash_vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for gram in _ngrams(text):
+            vector[zlib.crc32(gram.encode("utf-8")) % self.dim] += 1.0
+        # 次线性词频，避免长文本中的高频字主导
+        np.log1p(vector, out=vector)
+        return vector
+
+    @staticmethod
+    def _catalog_fingerprint(videos):
+        digest = hashlib.sha256()
+        for video in videos:
+            digest.update(_video_text(video).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _ensure_index(self, videos):
+        fingerprint = self._catalog_fingerprint(videos)
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return self._matrix, self._idf
+
+            start = time.perf_counter()
+            raw = np.stack([self._hash_vector(_video_text(v)) for v in videos]) if videos else np.zeros((0, self.dim), dtype=np.float32)
+            doc_freq = (raw > 0).sum(axis=0)
+            idf = np.log((1 + len(videos)) / (1 + doc_freq)).astype(np.float32) + 1.0
+            matrix = raw * idf
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.maximum(norms, 1e-8)
+
+            self._fingerprint, self._matrix, self._idf = fingerprint, matrix, idf
+            print(f"[INFO] 范例视频向量索引已构建: {len(videos)} 个视频, 耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+            return matrix, idf
+
+    def rank(self, query: str, videos: list, top_n: int) -> list:
+        """返回与 query 最相关的前 top_n 个视频下标（按相似度降序）"""
+        matrix, idf = self._ensure_index(videos)
+        if not len(videos):
+            return []
+        query_vector = self._hash_vector(query) * idf
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-8)
+        scores = matrix @ query_vector
+
+        top_n = min(top_n, len(videos))
+        candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+        return candidates[np.argsort(-scores[candidates])].tolist()
+
+    def select(self, query: str, videos: list, top_n: int = None) -> list:
+        """
+        视频库超过 top_n 时返回预筛选后的短名单，否则原样返回
+
+        Args:
+            top_n: 短名单大小，默认读取 settings.RECOMMEND_SHORTLIST_N（0 表示不筛选）
+        """
+        top_n = settings.RECOMMEND_SHORTLIST_N if top_n is None else top_n
+        if not top_n or len(videos) <= top_n:
+            return videos
+        start = time.perf_counter()
+        shortlist = [videos[idx] for idx in self.rank(query, videos, top_n)]
+        print(f"[INFO] 🔎 范例视频预筛选: {len(videos)} -> {len(shortlist)} 个候选, 耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+        return shortlist
+
+catalog_shortlist = CatalogShortlist()
@@ -0,0 +1,149 @@
+"""
+对话前缀缓存：系统指令 + 滚动摘要 + 较早的对话轮次 组成前缀，
+通过 Gemini 显式上下文缓存 (caches.create) 在提供方复用，命中部分不再重复处理且按折扣计费。
+
+前缀在摘要更新之前只增长不改变：会话记住上次缓存到第几轮（锚点），之后的请求沿用同一个缓存，
+只携带锚点之后的轮次；未缓存部分再次超过最小缓存长度时才扩展锚点、创建新缓存。
+前缀达不到提供方的最小缓存长度 (CHAT_CONTEXT_CACHE_MIN_TOKENS) 或缓存不可用时，照常携带系统指令与全部最近轮次。
+"""
+import time
+import hashlib
+from collections import OrderedDict
+from google.genai import types
+from app.config import settings
+from app.core.llm_scheduler import llm_scheduler, is_rate_limited, SchedulerQueueFull
+from app.core.singleflight import AsyncSingleFlight
+from app.service.conversation_store import estimate_tokens
+
+def build_prefix(system_instruction: str, summary: str) -> str:
+    if not summary:
+        return system_instruction
+    return f"{system_instruction}\n\n之前对话的摘要：\n{summary}"
+
+def is_cache_unsupported(error) -> bool:
+    """
+    是否为明确的"不支持缓存"错误（模型或代理不支持该接口、4xx 能力错误）。
+    限流、过载、排队已满、超时以及前缀过短都是临时情况，冷却后可以重试。
+    """
+    if isinstance(error, SchedulerQueueFull) or is_rate_limited(error):
+        return False
+    text = str(error)
+    if "too small" in text or "min_total_token_count" in text:
+        return False
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code == 501 or (400 <= code < 500 and code not in (408, 409, 429))
+    lowered = text.lower()
+    return any(mark in lowered for mark in ("not supported", "unsupported", "unimplemented"))
+
+class ContextCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> {"name": 缓存名, "expires_at": float}
+        self._flight = AsyncSingleFlight()
+        self._unsupported = set()       # 明确不支持缓存的模型，本进程内不再尝试
+        self._retry_after = {}          # 模型 -> 临时失败后的冷却截止时间 (monotonic)
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.provider_created = 0
+        self.provider_failures = 0
+
+    @staticmethod
+    def _anchor(conversation) -> int:
+        """放入缓存前缀的最近轮次数：沿用会话已有的锚点，未缓存部分过长时扩展到全部最近轮次"""
+        recent = conversation.recent_turns()
+        anchor = conversation.cache_anchor
+        if anchor and anchor[0] == conversation.summarized and anchor[1] <= len(recent):
+            tail_tokens = sum(turn["tokens"] for turn in recent[anchor[1]:])
+            if tail_tokens < settings.CHAT_CONTEXT_CACHE_MIN_TOKENS:
+                return anchor[1]
+        return len(recent)
+
+    async def resolve(self, client, model: str, system_instruction: str, conversation):
+        """
+        Returns:
+            (config, contents): GenerateContentConfig 的前缀参数
+            ({"cached_content": 缓存名} 或 {"system_instruction": 前缀文本})，
+            以及请求中需要携带的历史轮次（不含本轮提问）
+        """
+        prefix = build_prefix(system_instruction, conversation.summary)
+        contents = conversation.contents()
+        uncached = ({"system_instruction": prefix}, contents)
+        if not settings.CHAT_CONTEXT_CACHE or model in self._unsupported:
+            self.uncached += 1
+            return uncached
+
+        count = self._anchor(conversation)
+        turns = conversation.recent_turns()[:count]
+        tokens = estimate_tokens(prefix) + sum(turn["tokens"] for turn in turns)
+        if tokens < settings.CHAT_CONTEXT_CACHE_MIN_TOKENS:
+            self.uncached += 1
+            return uncached
+
+        key = hashlib.sha256("\0".join(
+            [model, prefix] + [f"{turn['role']}:{turn['text']}" for turn in turns]
+        ).encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        # 预留 30 秒余量，避免请求途中缓存过期
+        if entry and entry["expires_at"] > time.time() + 30:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            if time.monotonic() < self._retry_after.get(model, 0.0):
+                self.uncached += 1
+                return uncached
+            entry = await self._flight.do(key, lambda: self._create(client, model, key, prefix, contents[:count], tokens))
+            if entry is None:
+                self.uncached += 1
+                return uncached
+
+        conversation.cache_anchor = (conversation.summarized, count)
+        return {"cached_content": entry["name"]}, contents[count:]
+
+    async def _create(self, client, model: str, key: str, prefix: str, contents: list, tokens: int):
+        self.misses += 1
+        ttl = settings.CHAT_CONTEXT_CACHE_TTL
+        try:
+            cached = await llm_scheduler.acall(model, lambda: client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=prefix,
+                    contents=contents or None,
+                    ttl=f"{ttl}s",
+                    display_name=f"chat-prefix-{key[:12]}"
+                )
+            ), "chat")
+        except Exception as e:
+            self.provider_failures += 1
+            if is_cache_unsupported(e):
+                self._unsupported.add(model)
+                print(f"[WARNING] 模型 {model} 不支持上下文缓存，本进程内不再尝试: {e}")
+            else:
+                self._retry_after[model] = time.monotonic() + settings.CHAT_CONTEXT_CACHE_RETRY
+                print(f"[WARNING] 创建上下文缓存失败 ({model})，{settings.CHAT_CONTEXT_CACHE_RETRY:.0f} 秒后重试: {e}")
+            return None
+
+        self.provider_created += 1
+        self._retry_after.pop(model, None)
+        entry = self._entries[key] = {"name": cached.name, "expires_at": time.time() + ttl}
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        print(f"[INFO] 🧊 已创建上下文缓存: {cached.name} (约 {tokens} tokens, {len(contents)} 轮历史, TTL {ttl}s)")
+        return entry
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "uncached_requests": self.uncached,
+            "provider_created": self.provider_created,
+            "provider_failures": self.provider_failures,
+            "unsupported_models": sorted(self._unsupported),
+            "cooling_down_models": sorted(m for m, until in self._retry_after.items() if until > time.monotonic()),
+        }
+
+context_cache = ContextCache()
@@ -0,0 +1,118 @@
+"""
+服务端对话状态：每个会话保存最近的对话轮次与更早轮次的滚动摘要，
+请求模型时只发送 摘要 + 预算内的最近轮次。
+
+客户端只需发送服务端尚未见过的历史增量 (history_offset + history)；
+服务端状态丢失（如重启）时回复 history_resync，客户端重发完整历史。
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from google.genai import types
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约每字 1 个 token，其余约每 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+class Conversation:
+    def __init__(self, conversation_id: str):
+        self.id = conversation_id
+        self.turns = []          # [{"role": "user" | "model", "text": str, "tokens": int}]
+        self.summary = ""        # 已折叠轮次的滚动摘要
+        self.summarized = 0      # 已折叠进摘要的轮次数
+        self.client_seen = 0     # 已合并的客户端历史条数
+        self.cache_anchor = None # 上下文缓存锚点: (创建时的 summarized, 缓存的最近轮次数)
+        self.updated_at = time.time()
+        self.summary_lock = asyncio.Lock()
+
+    def add(self, role: str, text: str):
+        self.turns.append({"role": role, "text": text, "tokens": estimate_tokens(text)})
+        self.updated_at = time.time()
+
+    def sync(self, history: list, offset: int = 0) -> bool:
+        """
+        合并客户端历史增量：history 为客户端历史中从 offset 开始的部分。
+        已见过的部分跳过；offset 超出已见范围（中间有缺口）时返回 False，需要客户端重发完整历史。
+        """
+        if offset > self.client_seen:
+            return False
+        for msg in (history or [])[self.client_seen - offset:]:
+            content = msg.get("content")
+            # 过滤掉非文本内容（如视频占位符）
+            if isinstance(content, str) and not content.startswith("[系统"):
+                self.add("user" if msg.get("role") == "user" else "model", content)
+        self.client_seen = max(self.client_seen, offset + len(history or []))
+        self.updated_at = time.time()
+        return True
+
+    def recent_turns(self) -> list:
+        return self.turns[self.summarized:]
+
+    def recent_tokens(self) -> int:
+        return sum(turn["tokens"] for turn in self.recent_turns())
+
+    def full_history_tokens(self) -> int:
+        """客户端重发完整历史时的 token 数，用于对比节省量"""
+        return sum(turn["tokens"] for turn in self.turns)
+
+    def contents(self) -> list:
+        return [
+            types.Content(role=turn["role"], parts=[types.Part(text=turn["text"])])
+            for turn in self.recent_turns()
+        ]
+
+    def turns_to_fold(self, budget: int, pending_tokens: int = 0) -> int:
+        """
+        最近轮次超出预算时，返回需要折叠进摘要的轮次数：
+        从最早的轮次开始折叠，直到剩余部分不超过预算的一半（留出增长空间）
+
+        Args:
+            pending_tokens: 尚未合并、但下一轮请求会带上的 token 数（如本轮的提问与回复）
+        """
+        recent = self.recent_turns()
+        total = sum(turn["tokens"] for turn in recent) + pending_tokens
+        if total <= budget:
+            return 0
+        count = 0
+        while count < len(recent) - 2 and total > budget // 2:
+            total -= recent[count]["tokens"]
+            count += 1
+        # 剩余历史不以 model 开头
+        while count < len(recent) - 1 and recent[count]["role"] == "model":
+            count += 1
+        return count
+
+class ConversationStore:
+    """按会话 ID 保存对话状态，LRU + 空闲超时淘汰"""
+
+    def __init__(self, max_conversations: int = 512, idle_ttl: float = 6 * 3600):
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self._conversations = OrderedDict()
+
+    def get(self, conversation_id: str) -> Conversation:
+        now = time.time()
+        conversation = self._conversations.get(conversation_id)
+        if conversation and now - conversation.updated_at > self.idle_ttl:
+            conversation = None
+        if conversation is None:
+            conversation = Conversation(conversation_id)
+            self._conversations[conversation_id] = conversation
+        self._conversations.move_to_end(conversation_id)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+        return conversation
+
+    def drop(self, conversation_id: str):
+        self._conversations.pop(conversation_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._conversations),
+            "summarized_turns": sum(c.summarized for c in self._conversations.values()),
+        }
+
+conversation_store = ConversationStore()
@@ -1,38 +1,115 @@
+import time
+import threading
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.embeddings import Embeddings
 import openai
 from app.config import settings
+from app.core.embedding_cache import EmbeddingCache
+from app.service.service_backend import wrap_embedding_client, backend_mode
+
+embedding_cache = EmbeddingCache(
+    settings.EMBED_CACHE_PATH,
+    dtype=settings.EMBED_CACHE_DTYPE,
+    lru_size=settings.EMBED_QUERY_LRU_SIZE
+) if settings.EMBED_CACHE else None
 
 class AiHubMixEmbeddings(Embeddings):
-    def __init__(self):
-        self.client = openai.OpenAI(
+    def __init__(self, batch_size: int = None, max_concurrency: int = None):
+        # 按 SERVICE_BACKEND 选择直连 / 录制 / 回放 / 合成客户端
+        self.client = wrap_embedding_client(lambda: openai.OpenAI(
             api_key=settings.API_KEY,
             base_url=settings.OPENAI_BASE_URL,
-            timeout=60.0, 
-            max_retries=3
-        )
+            timeout=60.0,
+            # 重试由 _embed_batch 按批统一处理，避免与客户端内置重试叠加
+            max_retries=0
+        ))
         # 使用 Gemini 嵌入模型
         self.model = "gemini-embedding-001"
+        # 缓存命名空间：合成向量与真实向量分开存放（record / replay 返回的都是真实向量）
+        mode = backend_mode()
+        self.cache_model = self.model if mode in ("live", "record", "replay") else f"{self.model}@{mode}"
+        self.cache = embedding_cache
+        self.batch_size = batch_size or settings.EMBED_BATCH_SIZE
+        self.max_concurrency = max_concurrency or settings.EMBED_MAX_CONCURRENCY
+        self._stats_lock = threading.Lock()
+        self._stats = {"chunks": 0, "requests": 0, "retries": 0, "seconds": 0.0}
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """一批文本一次请求；失败时指数退避重试整批"""
+        for attempt in range(settings.EMBED_MAX_RETRIES + 1):
+            try:
+                response = self.client.embeddings.create(input=texts, model=self.model)
+                with self._stats_lock:
+                    self._stats["requests"] += 1
+                # 按 index 排序，保证与输入顺序一致
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                if attempt == settings.EMBED_MAX_RETRIES:
+                    raise
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                delay = settings.EMBED_RETRY_BACKOFF * (2 ** attempt)
+                print(f"[WARN] 向量化批次失败 ({len(texts)} 个片段, 尝试 {attempt + 1}/{settings.EMBED_MAX_RETRIES + 1})，{delay:.1f} 秒后重试: {e}")
+                time.sleep(delay)
+
+    def _embed_remote(self, texts: List[str]) -> List[List[float]]:
+        """分批请求，批次间有界并发，结果与输入顺序一致"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                # map 按提交顺序返回结果；任一批次重试耗尽时抛出
+                results = list(pool.map(self._embed_batch, batches))
+        return [vector for batch in results for vector in batch]
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """对文档列表进行向量化"""
-        # 为了避免超长，简单的逐个处理，生产环境可以使用 batch
-        embeddings = []
-        for text in texts:
-            # 替换换行符以优化准确性
-            text = text.replace("\n", " ")
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.model
-            )
-            embeddings.append(response.data[0].embedding)
+        """对文档列表进行向量化：已缓存的片段直接复用，其余分批并发请求"""
+        if not texts:
+            return []
+        start = time.perf_counter()
+        # 替换换行符以优化准确性
+        texts = [text.replace("\n", " ") for text in texts]
+
+        embeddings = self.cache.get_many(self.cache_model, texts) if self.cache else [None] * len(texts)
+        missing = [idx for idx, vector in enumerate(embeddings) if vector is None]
+        # 同一批次内的重复片段只请求一次
+        unique = list(dict.fromkeys(texts[idx] for idx in missing))
+        if unique:
+            fresh = self._embed_remote(unique)
+            if self.cache:
+                # 使用按缓存精度还原后的向量，与之后命中缓存时返回的完全一致
+                fresh = self.cache.put_many(self.cache_model, unique, fresh)
+            vectors = dict(zip(unique, fresh))
+            for idx in missing:
+                embeddings[idx] = vectors[texts[idx]]
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["chunks"] += len(texts)
+            self._stats["seconds"] += elapsed
+        print(f"[INFO] 📐 向量化完成: {len(texts)} 个片段 (缓存命中 {len(texts) - len(missing)}, 请求 {len(unique)}), "
+              f"耗时 {elapsed:.2f}s, {len(texts) / max(elapsed, 1e-6):.1f} 片段/秒")
         return embeddings
 
     def embed_query(self, text: str) -> List[float]:
-        """对单个查询进行向量化"""
+        """对单个查询进行向量化（内存 LRU + 持久化缓存）"""
         text = text.replace("\n", " ")
-        response = self.client.embeddings.create(
-            input=text,
-            model=self.model
-        )
-        return response.data[0].embedding
\ No newline at end of file
+        if self.cache:
+            vector = self.cache.get_query(self.cache_model, text)
+            if vector is not None:
+                return vector
+        vector = self._embed_batch([text])[0]
+        if self.cache:
+            vector = self.cache.put_query(self.cache_model, text, vector)
+        return vector
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["chunks_per_second"] = round(stats["chunks"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        stats["seconds"] = round(stats["seconds"], 2)
+        if self.cache:
+            stats["cache"] = self.cache.stats()
+        return stats
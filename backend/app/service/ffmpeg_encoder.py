@@ -0,0 +1,244 @@
+import os
+import math
+import shutil
+import asyncio
+from app.config import settings
+
+# 所有片段必须使用完全相同的编码参数，拼接时才能直接 -c copy
+VIDEO_WIDTH = 1920
+VIDEO_HEIGHT = 1080
+
+def ffmpeg_available():
+    """检查 ffmpeg 是否可用"""
+    return shutil.which("ffmpeg") is not None
+
+async def run_ffmpeg(args):
+    """异步执行 ffmpeg，不阻塞事件循环；失败时抛出异常并附带错误输出"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg 执行失败 ({process.returncode}): {stderr.decode(errors='ignore')[-500:]}")
+
+async def probe_duration(path):
+    """用 ffprobe 读取容器时长（只读元数据，不解码）"""
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    return float(stdout.decode().strip() or 0)
+
+async def encode_still_segment(image_path, audio_path, output_path, duration=None):
+    """
+    将一张静态幻灯片和它的讲解音频编码为一个视频片段
+    - 极低帧率 + stillimage 调优，每个片段只有开头一个关键帧
+    - duration 已知时直接截断，否则以音频长度为准
+    """
+    fps = settings.STILL_FRAME_RATE
+    args = [
+        "-loop", "1", "-framerate", str(fps), "-i", image_path,
+        "-i", audio_path,
+        "-map", "0:v", "-map", "1:a",
+        # 统一分辨率，不同来源的幻灯片图片尺寸可能不同
+        "-vf", (
+            f"scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=decrease,"
+            f"pad={VIDEO_WIDTH}:{VIDEO_HEIGHT}:(ow-iw)/2:(oh-ih)/2:color=white,format=yuv420p"
+        ),
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage",
+        "-r", str(fps), "-x264-params", "keyint=infinite:scenecut=0",
+        "-c:a", "aac", "-b:a", "128k", "-ar", "48000", "-ac", "2",
+    ]
+    if duration:
+        args += ["-t", f"{duration:.3f}"]
+    else:
+        args += ["-shortest"]
+    args += ["-movflags", "+faststart", output_path]
+    await run_ffmpeg(args)
+
+async def concat_segments(segment_paths, output_path, subtitle_path=None):
+    """使用 concat demuxer 无重编码拼接片段，可选同时封装软字幕流"""
+    list_path = output_path + ".txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            # concat 列表中的单引号需要转义
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if subtitle_path:
+        args += ["-i", subtitle_path, "-map", "0", "-map", "1", "-c:s", "mov_text"]
+    args += ["-c:v", "copy", "-c:a", "copy", "-movflags", "+faststart", output_path]
+    try:
+        await run_ffmpeg(args)
+    finally:
+        os.remove(list_path)
+
+async def mux_subtitles(video_path, subtitle_path):
+    """为已生成的视频追加软字幕流（不重编码音视频）"""
+    muxed_path = video_path + ".sub.mp4"
+    await run_ffmpeg([
+        "-i", video_path, "-i", subtitle_path,
+        "-map", "0", "-map", "1",
+        "-c:v", "copy", "-c:a", "copy", "-c:s", "mov_text",
+        "-movflags", "+faststart", muxed_path
+    ])
+    os.replace(muxed_path, video_path)
+
+class HLSPublisher:
+    """
+    渐进式输出：片段编码完成后立即转封装为 MPEG-TS 并追加到不断增长的 HLS 播放列表，
+    用户可以在后续幻灯片仍在渲染时开始播放。
+
+    片段可能乱序完成，只有连续的前缀才会按顺序发布；每个 TS 片段通过
+    -output_ts_offset 设置累计时间戳，保证整条播放列表的时间轴连续。
+    """
+
+    PLAYLIST_NAME = "stream.m3u8"
+
+    def __init__(self, session_dir, session_id, total_segments, segment_callback=None):
+        """total_segments 为幻灯片总数（流式脚本时为 None，稍后确定），缺失的页面需通过 skip() 标记"""
+        self.session_dir = session_dir
+        self.session_id = session_id
+        self.total_segments = total_segments
+        self.segment_callback = segment_callback
+        self.playlist_path = os.path.join(session_dir, self.PLAYLIST_NAME)
+        self.playlist_url = f"/api/download/{session_id}/{self.PLAYLIST_NAME}"
+        self._pending = {}      # position -> segment_path (None 表示跳过)，等待前序片段
+        self._entries = []      # [(ts_filename, duration)]
+        self._next_position = 0
+        self._offset = 0.0
+        self._lock = asyncio.Lock()
+
+    async def add_segment(self, position, segment_path, duration=None):
+        """登记一个编码完成的片段，并发布所有已连续的片段；duration 未知时用 ffprobe 读取"""
+        async with self._lock:
+            self._pending[position] = (segment_path, duration) if segment_path else None
+            while self._next_position in self._pending:
+                segment = self._pending.pop(self._next_position)
+                if segment:
+                    await self._publish(self._next_position, *segment)
+                self._next_position += 1
+
+    async def skip(self, position):
+        """标记某页没有片段，避免阻塞后续片段的发布"""
+        await self.add_segment(position, None)
+
+    async def _publish(self, position, segment_path, duration=None):
+        if not duration:
+            duration = await probe_duration(segment_path)
+        ts_filename = f"hls_{position}.ts"
+        await run_ffmpeg([
+            "-i", segment_path, "-c", "copy",
+            "-bsf:v", "h264_mp4toannexb",
+            "-output_ts_offset", f"{self._offset:.3f}",
+            "-f", "mpegts", os.path.join(self.session_dir, ts_filename)
+        ])
+        self._offset += duration
+        self._entries.append((ts_filename, duration))
+        self._write_playlist(finished=False)
+        print(f"[INFO] 📺 已发布片段 {position + 1}/{self.total_segments or '?'}: {ts_filename} ({duration:.1f}s)")
+
+        if self.segment_callback:
+            self.segment_callback({
+                "index": position,
+                "total": self.total_segments,
+                "duration": duration,
+                "url": f"/api/download/{self.session_id}/{ts_filename}",
+                "playlist_url": self.playlist_url
+            })
+
+    def _write_playlist(self, finished):
+        target_duration = max(math.ceil(d) for _, d in self._entries) if self._entries else 1
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for ts_filename, duration in self._entries:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(ts_filename)
+        if finished:
+            lines.append("#EXT-X-ENDLIST")
+
+        # 原子替换，播放器轮询时不会读到写了一半的列表
+        tmp_path = self.playlist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist_path)
+
+    def finish(self):
+        """所有片段发布完毕，写入 ENDLIST"""
+        self._write_playlist(finished=True)
+
+class SegmentEncoder:
+    """
+    逐页编码视频片段：每页的图片与语音一就绪即可提交，无需等待整份脚本，
+    全部提交后由 finish() 按页序无重编码拼接。
+    """
+
+    def __init__(self, output_path, total_slides, progress_callback=None, publisher=None):
+        self.output_path = output_path
+        self.total_slides = total_slides
+        self.progress_callback = progress_callback
+        self.publisher = publisher
+        self._semaphore = asyncio.Semaphore(settings.FFMPEG_MAX_CONCURRENCY)
+        self._tasks = {}  # idx -> 编码任务
+
+    def set_total(self, total_slides):
+        """流式脚本生成结束后设置总页数"""
+        self.total_slides = total_slides
+        if self.publisher:
+            self.publisher.total_segments = total_slides
+
+    async def submit(self, idx, img_path, audio_path, audio_meta=None):
+        """提交一页素材，素材缺失时跳过该页；audio_meta 提供时长，省去探测"""
+        # 检查素材是否生成成功
+        if not os.path.exists(img_path) or not os.path.exists(audio_path):
+            print(f"[WARNING] 片段 {idx} 素材缺失，跳过。")
+            if self.progress_callback:
+                self.progress_callback(f"⚠️ 第 {idx + 1} 页素材生成失败，跳过")
+            if self.publisher:
+                await self.publisher.skip(idx)
+            return
+        duration = audio_meta["duration"] if audio_meta else None
+        self._tasks[idx] = asyncio.ensure_future(self._encode(idx, img_path, audio_path, duration))
+
+    async def _encode(self, idx, img_path, audio_path, duration=None):
+        segment_path = os.path.join(os.path.dirname(self.output_path), f"segment_{idx}.mp4")
+        async with self._semaphore:
+            await encode_still_segment(img_path, audio_path, segment_path, duration)
+        if self.progress_callback:
+            self.progress_callback(f"✅ 第 {idx + 1}/{self.total_slides or '?'} 页视频片段完成")
+        if self.publisher:
+            await self.publisher.add_segment(idx, segment_path, duration)
+        return segment_path
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def finish(self, subtitle_path=None):
+        """等待所有片段编码完成并拼接为最终视频，可选封装软字幕"""
+        if not self._tasks:
+            raise Exception("没有生成任何视频片段")
+
+        order = sorted(self._tasks)
+        try:
+            segment_paths = await asyncio.gather(*[self._tasks[idx] for idx in order])
+        except BaseException:
+            self.cancel()
+            raise
+        if self.publisher:
+            self.publisher.finish()
+
+        if self.progress_callback:
+            self.progress_callback(f"🔗 正在拼接 {len(segment_paths)} 个视频片段...")
+        print("[INFO] 正在拼接最终视频 (ffmpeg concat)...")
+        await concat_segments(segment_paths, self.output_path, subtitle_path)
@@ -0,0 +1,123 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from app.config import settings
+from app.core.disk_cache import DiskCache
+from app.core.rag_engine import rag_engine
+
+class ResultCache:
+    """
+    端到端结果缓存：同一视频 + 同一提示词 + 同一模型 + 同一知识库版本的任务直接复用结果。
+
+    分三级存储，任一级缺失时只重做该级：
+    - analysis: 视频理解结果 raw_description 与脚本 script_data
+    - video: 最终 MP4 与字幕，按脚本内容摘要 + 音色 + 语速寻址；
+      分析/脚本重新生成后摘要随之变化，不会取到为旧脚本渲染的视频
+    - recommend: 范例视频推荐结果（键额外包含范例视频索引指纹）
+
+    JSON 结果在内存中保留一份 (L1)，全部结果持久化在磁盘 (L2, LRU 淘汰)。
+    知识库更新后版本号变化，旧结果自然不再命中；也可调用 invalidate() 显式清空。
+    """
+
+    VIDEO_FILES = ("final_output.mp4", "captions.vtt")
+
+    def __init__(self, cache_dir: str, max_bytes: int, memory_entries: int = 128):
+        self.store = DiskCache(cache_dir, max_bytes, name="results")
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+
+    @staticmethod
+    def _digest(*parts) -> str:
+        return hashlib.sha256(
+            json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def job_key(self, video_hash: str, prompt: str, model_name: str) -> str:
+        """任务键：视频内容哈希 + 提示词 + 模型 + 知识库版本"""
+        return self._digest(video_hash, prompt or "", model_name, rag_engine.kb_version())
+
+    def _entry_key(self, level: str, job_key: str, *extra) -> str:
+        return self._digest(level, job_key, *extra)
+
+    def get_json(self, level: str, job_key: str, *extra):
+        """读取 JSON 结果，未命中返回 None"""
+        key = self._entry_key(level, job_key, *extra) + ".json"
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        path = self.store.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put_json(self, level: str, job_key: str, value, *extra):
+        key = self._entry_key(level, job_key, *extra) + ".json"
+        self.store.put_bytes(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        self._remember(key, value)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def script_digest(self, script_data) -> str:
+        """脚本内容摘要，作为视频级缓存的键"""
+        return self._digest("script", script_data)
+
+    def _video_key(self, script_digest: str, filename: str) -> str:
+        # 渲染结果取决于脚本内容，以及音色与语速
+        return self._entry_key("video", script_digest, settings.TTS_VOICE, settings.TTS_RATE, filename)
+
+    def fetch_video(self, script_digest: str, session_dir: str) -> bool:
+        """命中时将最终视频（及字幕）复制到会话目录"""
+        video_name = self.VIDEO_FILES[0]
+        if not self.store.fetch(self._video_key(script_digest, video_name), os.path.join(session_dir, video_name)):
+            return False
+        for filename in self.VIDEO_FILES[1:]:
+            path = self.store.get(self._video_key(script_digest, filename), track=False)
+            if path:
+                try:
+                    shutil.copyfile(path, os.path.join(session_dir, filename))
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def put_video(self, script_digest: str, session_dir: str):
+        # 字幕先于视频写入，视频存在即代表整组结果完整
+        for filename in reversed(self.VIDEO_FILES):
+            path = os.path.join(session_dir, filename)
+            if os.path.exists(path):
+                self.store.put_file(self._video_key(script_digest, filename), path)
+
+    def invalidate(self):
+        """清空所有结果（知识库或模板发生变化时调用）"""
+        with self._lock:
+            self._memory.clear()
+        self.store.clear()
+        print("[INFO] 🧹 结果缓存已清空")
+
+    def stats(self) -> dict:
+        stats = self.store.stats()
+        with self._lock:
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_hits"] = self.memory_hits
+        stats["kb_version"] = rag_engine.kb_version()
+        return stats
+
+result_cache = ResultCache(settings.RESULT_CACHE_DIR, settings.RESULT_CACHE_MAX_BYTES)
@@ -0,0 +1,101 @@
+"""
+增量解析脚本 JSON：模型流式输出 {"slides": [{...}, {...}, ...]} 时，
+每当一个幻灯片对象闭合就立即产出，无需等待整个 JSON 完成。
+截断或格式错误的尾部只会丢弃未完成的那一页。
+"""
+import json
+
+class SlideStreamParser:
+    """
+    逐段喂入文本，返回新闭合的幻灯片对象
+
+    只跟踪字符串/转义状态与括号深度，不做完整的 JSON 语法分析；
+    每个闭合的对象再交给 json.loads 校验，解析失败的对象被跳过。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._array_found = False
+        self._depth = 0          # 相对 slides 数组的嵌套深度
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self._done = False
+        self.skipped = 0
+
+    def _find_array(self):
+        key = self._buffer.find('"slides"', self._pos)
+        if key < 0:
+            # 保留可能被截断的键名
+            self._pos = max(self._pos, len(self._buffer) - len('"slides"'))
+            return False
+        bracket = self._buffer.find("[", key)
+        if bracket < 0:
+            self._pos = key
+            return False
+        self._pos = bracket + 1
+        self._array_found = True
+        return True
+
+    def feed(self, text: str) -> list:
+        if self._done:
+            return []
+        self._buffer += text
+        if not self._array_found and not self._find_array():
+            return []
+
+        slides = []
+        buffer = self._buffer
+        for pos in range(self._pos, len(buffer)):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0 and char == "}" and self._object_start is not None:
+                    slide = self._parse_object(buffer[self._object_start:pos + 1])
+                    if slide:
+                        slides.append(slide)
+                    self._object_start = None
+                elif self._depth < 0:
+                    # slides 数组结束，之后的内容忽略
+                    self._done = True
+                    return slides
+        self._pos = len(buffer)
+        return slides
+
+    @property
+    def complete(self) -> bool:
+        """slides 数组已闭合，且没有因格式错误被跳过的页面"""
+        return self._done and not self.skipped
+
+    def _parse_object(self, text):
+        try:
+            slide = json.loads(text)
+        except json.JSONDecodeError:
+            self.skipped += 1
+            return None
+        if not isinstance(slide, dict) or not slide.get("title"):
+            self.skipped += 1
+            return None
+        slide.setdefault("bullets", [])
+        slide.setdefault("narration", "")
+        return slide
+
+def parse_slides_partial(text: str) -> list:
+    """从完整或截断的脚本文本中提取所有已闭合的幻灯片"""
+    return SlideStreamParser().feed(text)
@@ -0,0 +1,526 @@
+"""
+外部服务后端切换 (settings.SERVICE_BACKEND)，用于离线压测与基准测试：
+
+- live: 直连 AIHubMix / Gemini / Edge-TTS（默认）
+- record: 直连，同时把每次响应（含流式片段的时间间隔）写入 RECORDINGS_DIR
+- replay: 只从录制回放，结果确定且不访问网络；缺少录制时抛出 ReplayMissError
+- synthetic: 合成响应，延迟分布、流式片段节奏与 429/503 故障注入均可配置
+
+Gemini 以替身客户端接入（与 genai.Client 相同的 models / aio / files 接口），
+Embedding 替换 OpenAI 客户端的 embeddings.create，TTS 以 TTSProvider 的形式接入。
+"""
+import json
+import math
+import time
+import zlib
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from google import genai
+from app.config import settings
+from app.core.disk_cache import DiskCache
+from app.service.conversation_store import estimate_tokens
+
+BACKENDS = ("live", "record", "replay", "synthetic")
+
+class ReplayMissError(KeyError):
+    """回放模式下找不到对应的录制"""
+
+class SyntheticAPIError(Exception):
+    """synthetic 后端注入的故障，code 为 429 或 503"""
+
+    def __init__(self, code: int):
+        status = "RESOURCE_EXHAUSTED" if code == 429 else "UNAVAILABLE"
+        super().__init__(f"{code} {status} (synthetic fault)")
+        self.code = code
+
+def backend_mode() -> str:
+    mode = settings.SERVICE_BACKEND
+    if mode not in BACKENDS:
+        raise ValueError(f"未知的 SERVICE_BACKEND: {mode}，可选 {', '.join(BACKENDS)}")
+    return mode
+
+def request_fingerprint(value) -> str:
+    """请求内容的哈希：pydantic 对象 (genai types) 先转为 JSON"""
+    def jsonable(item):
+        if hasattr(item, "model_dump"):
+            return item.model_dump(mode="json", exclude_none=True)
+        if isinstance(item, dict):
+            return {key: jsonable(val) for key, val in item.items()}
+        if isinstance(item, (list, tuple)):
+            return [jsonable(val) for val in item]
+        return item
+
+    text = json.dumps(jsonable(value), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# ---------------- 录制存储 ----------------
+
+class RecordingStore:
+    """录制文件按 (类型, 请求哈希) 存放；录制不参与容量淘汰"""
+
+    def __init__(self, root: str = None):
+        self.cache = DiskCache(root or settings.RECORDINGS_DIR, max_bytes=1 << 62, name="recordings")
+        self.saved = 0
+        self.replayed = 0
+
+    @staticmethod
+    def _key(kind: str, key: str, ext: str) -> str:
+        return f"{key}.{kind}.{ext}"
+
+    def save(self, kind: str, key: str, data: dict):
+        self.cache.put_bytes(self._key(kind, key, "json"), json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        self.saved += 1
+
+    def load(self, kind: str, key: str) -> dict:
+        path = self.cache.get(self._key(kind, key, "json"))
+        if path is None:
+            raise ReplayMissError(f"没有 {kind} 录制: {key[:16]}（先用 SERVICE_BACKEND=record 录制）")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.replayed += 1
+        return data
+
+    def save_blob(self, kind: str, key: str, data: bytes):
+        self.cache.put_bytes(self._key(kind, key, "bin"), data)
+
+    def load_blob(self, kind: str, key: str) -> bytes:
+        path = self.cache.get(self._key(kind, key, "bin"))
+        if path is None:
+            raise ReplayMissError(f"没有 {kind} 录制数据: {key[:16]}")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def stats(self) -> dict:
+        return {"saved": self.saved, "replayed": self.replayed, "misses": self.cache.misses}
+
+# ---------------- 合成延迟与故障 ----------------
+
+class SyntheticProfile:
+    """对数正态延迟（中位数 median_ms，离散度 sigma）与按概率注入的 429/503"""
+
+    def __init__(self, seed: int = None):
+        self._rng = random.Random(settings.SYNTHETIC_SEED if seed is None else seed)
+        self._lock = threading.Lock()
+        self.faults = 0
+
+    def latency(self, median_ms: float) -> float:
+        with self._lock:
+            return median_ms / 1000 * math.exp(self._rng.gauss(0, settings.SYNTHETIC_LATENCY_SIGMA))
+
+    def maybe_fail(self):
+        with self._lock:
+            roll = self._rng.random()
+        if roll < settings.SYNTHETIC_FAULT_RATE:
+            self.faults += 1
+            raise SyntheticAPIError(429 if roll < settings.SYNTHETIC_FAULT_RATE / 2 else 503)
+
+# ---------------- Gemini ----------------
+
+def _request_text(request: dict) -> str:
+    contents = request.get("contents")
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    texts = []
+    for content in contents:
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in getattr(content, "parts", None) or []:
+            if getattr(part, "text", None):
+                texts.append(part.text)
+    config = request.get("config")
+    if getattr(config, "system_instruction", None):
+        texts.append(str(config.system_instruction))
+    return "\n".join(texts)
+
+def _response(text: str, usage: dict = None):
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(**usage) if usage else None)
+
+def _usage_data(response) -> dict:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_token_count": getattr(usage, "prompt_token_count", None),
+        "candidates_token_count": getattr(usage, "candidates_token_count", None),
+        "cached_content_token_count": getattr(usage, "cached_content_token_count", None),
+    }
+
+class SyntheticGenAI:
+    """按请求类型合成结构合法的回复，保证流水线各阶段能完整跑通"""
+
+    FILLER = "建议保持动作缓慢可控，发力时呼气，回到起始位置时吸气，每组八到十二次，以不引起明显疼痛为度。"
+
+    def __init__(self, profile: SyntheticProfile):
+        self.profile = profile
+
+    def _text(self, request: dict) -> str:
+        prompt = _request_text(request)
+        config = request.get("config")
+        if '"slides"' in prompt:
+            slides = [
+                {
+                    "title": f"第{idx}步 动作要领",
+                    "bullets": ["保持躯干稳定", "动作缓慢可控", "配合呼吸节奏"],
+                    "narration": self.FILLER
+                }
+                for idx in range(1, 6)
+            ]
+            return json.dumps({"slides": slides}, ensure_ascii=False)
+        if getattr(config, "response_mime_type", None) == "application/json":
+            ids = [line.split("ID:", 1)[1].split(",", 1)[0].strip() for line in prompt.splitlines() if "ID:" in line]
+            return json.dumps(ids[:3], ensure_ascii=False)
+        if "生成一个简洁的标题" in prompt:
+            return "康复训练咨询"
+        repeat = settings.SYNTHETIC_RESPONSE_CHARS // len(self.FILLER) + 1
+        return (self.FILLER * repeat)[:settings.SYNTHETIC_RESPONSE_CHARS]
+
+    def _usage(self, request: dict) -> dict:
+        config = request.get("config")
+        return {
+            "prompt_token_count": estimate_tokens(_request_text(request)),
+            "candidates_token_count": None,
+            "cached_content_token_count": 256 if getattr(config, "cached_content", None) else 0,
+        }
+
+    def _chunks(self, text: str):
+        step = max(1, settings.SYNTHETIC_CHUNK_CHARS)
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    def generate(self, request):
+        time.sleep(self.profile.latency(settings.SYNTHETIC_LLM_LATENCY_MS))
+        self.profile.maybe_fail()
+        return _response(self._text(request), self._usage(request))
+
+    async def agenerate(self, request):
+        await asyncio.sleep(self.profile.latency(settings.SYNTHETIC_LLM_LATENCY_MS))
+        self.profile.maybe_fail()
+        return _response(self._text(request), self._usage(request))
+
+    def generate_stream(self, request):
+        # 故障在建立流时抛出，与真实接口一致
+        self.profile.maybe_fail()
+        first_delay = self.profile.latency(settings.SYNTHETIC_LLM_LATENCY_MS)
+        chunks = self._chunks(self._text(request))
+        usage = self._usage(request)
+
+        def iterate():
+            time.sleep(first_delay)
+            for idx, chunk in enumerate(chunks):
+                if idx:
+                    time.sleep(settings.SYNTHETIC_CHUNK_MS / 1000)
+                yield _response(chunk, usage if idx == len(chunks) - 1 else None)
+        return iterate()
+
+    async def agenerate_stream(self, request):
+        self.profile.maybe_fail()
+        first_delay = self.profile.latency(settings.SYNTHETIC_LLM_LATENCY_MS)
+        chunks = self._chunks(self._text(request))
+        usage = self._usage(request)
+
+        async def iterate():
+            await asyncio.sleep(first_delay)
+            for idx, chunk in enumerate(chunks):
+                if idx:
+                    await asyncio.sleep(settings.SYNTHETIC_CHUNK_MS / 1000)
+                yield _response(chunk, usage if idx == len(chunks) - 1 else None)
+        return iterate()
+
+    def upload(self, path: str, display_name: str, mime_type: str):
+        return SimpleNamespace(
+            name=f"files/{display_name}", uri=f"synthetic://files/{display_name}",
+            mime_type=mime_type, state=None, expiration_time=None
+        )
+
+    async def create_cache(self, model: str, config):
+        await asyncio.sleep(self.profile.latency(settings.SYNTHETIC_LLM_LATENCY_MS) / 4)
+        return SimpleNamespace(name=f"cachedContents/{request_fingerprint(config)[:16]}")
+
+class RecordingGenAI:
+    """
+    record: 调用真实客户端并录制响应；流式响应逐片记录距上一片的间隔
+    replay: 只读录制，REPLAY_REALTIME=1 时按录制的间隔回放
+    """
+
+    def __init__(self, store: RecordingStore, live_client=None):
+        self.store = store
+        self.live = live_client
+
+    @staticmethod
+    def _key(request: dict) -> str:
+        return request_fingerprint({name: request.get(name) for name in ("model", "contents", "config")})
+
+    def _replay_delay(self, seconds: float) -> float:
+        return seconds if settings.REPLAY_REALTIME else 0.0
+
+    def generate(self, request):
+        key = self._key(request)
+        if self.live is None:
+            data = self.store.load("generate", key)
+            time.sleep(self._replay_delay(data.get("latency", 0.0)))
+            return _response(data["text"], data.get("usage"))
+        start = time.perf_counter()
+        response = self.live.models.generate_content(**request)
+        self.store.save("generate", key, {
+            "text": response.text, "usage": _usage_data(response), "latency": time.perf_counter() - start
+        })
+        return response
+
+    async def agenerate(self, request):
+        key = self._key(request)
+        if self.live is None:
+            data = self.store.load("generate", key)
+            await asyncio.sleep(self._replay_delay(data.get("latency", 0.0)))
+            return _response(data["text"], data.get("usage"))
+        start = time.perf_counter()
+        response = await self.live.aio.models.generate_content(**request)
+        self.store.save("generate", key, {
+            "text": response.text, "usage": _usage_data(response), "latency": time.perf_counter() - start
+        })
+        return response
+
+    def _replay_chunks(self, request):
+        data = self.store.load("stream", self._key(request))
+        chunks = data["chunks"]
+        return [
+            (self._replay_delay(chunk["delay"]), _response(chunk["text"], data.get("usage") if idx == len(chunks) - 1 else None))
+            for idx, chunk in enumerate(chunks)
+        ]
+
+    def generate_stream(self, request):
+        if self.live is None:
+            chunks = self._replay_chunks(request)
+
+            def replay():
+                for delay, chunk in chunks:
+                    time.sleep(delay)
+                    yield chunk
+            return replay()
+
+        key = self._key(request)
+        stream = self.live.models.generate_content_stream(**request)
+
+        def record():
+            chunks, usage, last = [], None, time.perf_counter()
+            for chunk in stream:
+                now = time.perf_counter()
+                chunks.append({"text": chunk.text or "", "delay": now - last})
+                usage = _usage_data(chunk) or usage
+                last = now
+                yield chunk
+            self.store.save("stream", key, {"chunks": chunks, "usage": usage})
+        return record()
+
+    async def agenerate_stream(self, request):
+        if self.live is None:
+            chunks = self._replay_chunks(request)
+
+            async def replay():
+                for delay, chunk in chunks:
+                    await asyncio.sleep(delay)
+                    yield chunk
+            return replay()
+
+        key = self._key(request)
+        start = time.perf_counter()
+        stream = await self.live.aio.models.generate_content_stream(**request)
+
+        async def record():
+            chunks, usage, last = [], None, start
+            async for chunk in stream:
+                now = time.perf_counter()
+                chunks.append({"text": chunk.text or "", "delay": now - last})
+                usage = _usage_data(chunk) or usage
+                last = now
+                yield chunk
+            self.store.save("stream", key, {"chunks": chunks, "usage": usage})
+        return record()
+
+    def upload(self, path: str, display_name: str, mime_type: str):
+        # display_name 为视频内容哈希，回放时据此找回录制时的远端 URI，请求哈希保持一致
+        if self.live is None:
+            data = self.store.load("file", display_name)
+            return SimpleNamespace(state=None, expiration_time=None, **data)
+        return None
+
+    def record_upload(self, display_name: str, uploaded):
+        self.store.save("file", display_name, {
+            "name": uploaded.name, "uri": uploaded.uri, "mime_type": uploaded.mime_type
+        })
+
+    async def create_cache(self, model: str, config):
+        key = request_fingerprint({"model": model, "config": config})
+        if self.live is None:
+            return SimpleNamespace(**self.store.load("cache", key))
+        cached = await self.live.aio.caches.create(model=model, config=config)
+        self.store.save("cache", key, {"name": cached.name})
+        return cached
+
+class _Models:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content(self, **request):
+        return self._backend.generate(request)
+
+    def generate_content_stream(self, **request):
+        return self._backend.generate_stream(request)
+
+class _AsyncModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def generate_content(self, **request):
+        return await self._backend.agenerate(request)
+
+    async def generate_content_stream(self, **request):
+        return await self._backend.agenerate_stream(request)
+
+class _AsyncCaches:
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def create(self, model, config):
+        return await self._backend.create_cache(model, config)
+
+class _Files:
+    def __init__(self, backend, live_client=None):
+        self._backend = backend
+        self._live = live_client
+
+    def upload(self, file, config):
+        uploaded = self._backend.upload(file, config.display_name, config.mime_type)
+        if uploaded is not None:
+            return uploaded
+        # record 模式：真实上传，等待处理完成后记录 URI
+        uploaded = self._live.files.upload(file=file, config=config)
+        while uploaded.state and uploaded.state.name == "PROCESSING":
+            time.sleep(2)
+            uploaded = self._live.files.get(name=uploaded.name)
+        self._backend.record_upload(config.display_name, uploaded)
+        return uploaded
+
+    def get(self, name):
+        if self._live is not None:
+            return self._live.files.get(name=name)
+        return SimpleNamespace(name=name, state=None)
+
+class OfflineGenAIClient:
+    """与 genai.Client 接口一致的替身，只实现本项目用到的部分"""
+
+    def __init__(self, backend, live_client=None):
+        self.models = _Models(backend)
+        self.files = _Files(backend, live_client)
+        self.aio = SimpleNamespace(models=_AsyncModels(backend), caches=_AsyncCaches(backend))
+
+# ---------------- Embedding ----------------
+
+class SyntheticEmbeddings:
+    """哈希字符 n-gram 向量：相同文本得到相同向量，文本越相似向量越接近"""
+
+    def __init__(self, profile: SyntheticProfile):
+        self.profile = profile
+
+    def vector(self, text: str) -> list:
+        dim = settings.SYNTHETIC_EMBEDDING_DIM
+        vector = [0.0] * dim
+        compact = "".join(text.split())
+        for n in (1, 2, 3):
+            for i in range(len(compact) - n + 1):
+                vector[zlib.crc32(compact[i:i + n].encode("utf-8")) % dim] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def create(self, input, model):
+        texts = [input] if isinstance(input, str) else list(input)
+        time.sleep(self.profile.latency(settings.SYNTHETIC_EMBED_LATENCY_MS))
+        self.profile.maybe_fail()
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=idx, embedding=self.vector(text)) for idx, text in enumerate(texts)
+        ])
+
+class RecordingEmbeddings:
+    """按单条文本录制/回放向量，批量大小变化不影响回放命中"""
+
+    def __init__(self, store: RecordingStore, live_client=None):
+        self.store = store
+        self.live = live_client
+
+    def create(self, input, model):
+        texts = [input] if isinstance(input, str) else list(input)
+        keys = [request_fingerprint({"model": model, "input": text}) for text in texts]
+        if self.live is None:
+            vectors = [self.store.load("embedding", key)["embedding"] for key in keys]
+        else:
+            response = self.live.embeddings.create(input=input, model=model)
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            for key, vector in zip(keys, vectors):
+                self.store.save("embedding", key, {"embedding": vector})
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=idx, embedding=vector) for idx, vector in enumerate(vectors)
+        ])
+
+class OfflineEmbeddingClient:
+    """替换 openai.OpenAI，只实现 embeddings.create"""
+
+    def __init__(self, backend):
+        self.embeddings = backend
+
+# ---------------- 工厂函数 ----------------
+
+_store = None
+_profile = None
+
+def shared_backends():
+    """录制存储与合成延迟配置，进程内共享"""
+    global _store, _profile
+    if _store is None:
+        _store = RecordingStore()
+        _profile = SyntheticProfile()
+    return _store, _profile
+
+def create_genai_client():
+    """按 SERVICE_BACKEND 创建 Gemini 客户端"""
+    mode = backend_mode()
+    if mode in ("live", "record"):
+        live = genai.Client(
+            api_key=settings.API_KEY,
+            http_options={"base_url": settings.GOOGLE_GENAI_BASE_URL}
+        )
+        if mode == "live":
+            return live
+    store, profile = shared_backends()
+    print(f"[INFO] 🧪 Gemini 使用 {mode} 后端")
+    if mode == "synthetic":
+        return OfflineGenAIClient(SyntheticGenAI(profile))
+    if mode == "replay":
+        return OfflineGenAIClient(RecordingGenAI(store))
+    return OfflineGenAIClient(RecordingGenAI(store, live), live)
+
+def wrap_embedding_client(live_factory):
+    """
+    按 SERVICE_BACKEND 返回 Embedding 客户端
+
+    Args:
+        live_factory: 创建真实 OpenAI 客户端的函数，replay / synthetic 模式下不会调用
+    """
+    mode = backend_mode()
+    if mode == "live":
+        return live_factory()
+    store, profile = shared_backends()
+    print(f"[INFO] 🧪 Embedding 使用 {mode} 后端")
+    if mode == "synthetic":
+        return OfflineEmbeddingClient(SyntheticEmbeddings(profile))
+    if mode == "replay":
+        return OfflineEmbeddingClient(RecordingEmbeddings(store))
+    return OfflineEmbeddingClient(RecordingEmbeddings(store, live_factory()))
+
+def backend_stats() -> dict:
+    stats = {"mode": settings.SERVICE_BACKEND}
+    if _store is not None:
+        stats["recordings"] = _store.stats()
+        stats["synthetic_faults"] = _profile.faults
+    return stats
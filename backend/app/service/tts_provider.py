@@ -0,0 +1,259 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import tempfile
+import edge_tts
+from app.config import settings
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.metrics import LatencyStats
+from app.service.service_backend import backend_mode, shared_backends, request_fingerprint
+
+class TTSProvider:
+    """
+    TTS 服务接口
+    synthesize 返回 (MP3 数据, WordBoundary 列表)，WordBoundary 单位为秒
+    """
+
+    name = "base"
+    # 结果是否写入持久化缓存（降级引擎的音质较差，不应长期复用）
+    cacheable = True
+
+    def available(self) -> bool:
+        return True
+
+    async def synthesize(self, text, voice, rate):
+        raise NotImplementedError
+
+class EdgeTTSProvider(TTSProvider):
+    """微软 Edge 在线 TTS"""
+
+    name = "edge"
+
+    async def synthesize(self, text, voice, rate):
+        communicate = edge_tts.Communicate(text, voice, rate=rate, boundary="WordBoundary")
+        audio = bytearray()
+        boundaries = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                # offset/duration 单位为 100 纳秒
+                boundaries.append({
+                    "offset": chunk["offset"] / 1e7,
+                    "duration": chunk["duration"] / 1e7,
+                    "text": chunk["text"]
+                })
+        if not audio:
+            raise Exception("Edge TTS 未返回音频数据")
+        return bytes(audio), boundaries
+
+class LocalTTSProvider(TTSProvider):
+    """
+    离线 TTS (espeak-ng)，远程服务不可用时兜底
+    输出转码为与 Edge-TTS 相同的 24kHz 单声道 MP3，便于后续统一处理
+    """
+
+    name = "local"
+    cacheable = False
+
+    def available(self) -> bool:
+        return shutil.which("espeak-ng") is not None and shutil.which("ffmpeg") is not None
+
+    @staticmethod
+    def _words_per_minute(rate):
+        # Edge-TTS 语速格式为 "+10%" / "-20%"
+        match = re.fullmatch(r"([+-]\d+)%", rate or "")
+        percent = int(match.group(1)) if match else 0
+        return max(80, int(175 * (1 + percent / 100)))
+
+    async def synthesize(self, text, voice, rate):
+        with tempfile.TemporaryDirectory(prefix="local_tts_") as work_dir:
+            wav_path = os.path.join(work_dir, "speech.wav")
+            mp3_path = os.path.join(work_dir, "speech.mp3")
+            for cmd, stdin in (
+                # 文本经 stdin 传入，以 "-" 开头的旁白不会被当作命令行选项
+                (["espeak-ng", "-v", settings.LOCAL_TTS_VOICE, "-s", str(self._words_per_minute(rate)), "-w", wav_path, "--stdin"],
+                 text.encode("utf-8")),
+                (["ffmpeg", "-y", "-loglevel", "error", "-i", wav_path, "-ar", "24000", "-ac", "1", "-b:a", "48k", mp3_path],
+                 None),
+            ):
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await process.communicate(stdin)
+                if process.returncode != 0:
+                    raise Exception(f"{cmd[0]} 执行失败: {stderr.decode(errors='ignore')[-200:]}")
+            with open(mp3_path, "rb") as f:
+                return f.read(), []
+
+# 24kHz 单声道 48kbps MPEG2 Layer III 静音帧（与 Edge-TTS 输出格式一致），每帧 576 个采样 = 24ms
+_SILENT_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC0]) + bytes(140)
+_SILENT_FRAME_SECONDS = 576 / 24000
+
+def _synthetic_words(text, seconds_per_char=0.2, pause=0.3):
+    """按字估算 WordBoundary：中文逐字、英文数字按词，标点处停顿"""
+    boundaries = []
+    elapsed = 0.0
+    for match in re.finditer(r"[A-Za-z0-9]+|\w|[^\w\s]", text):
+        word = match.group()
+        if not word[0].isalnum():
+            elapsed += pause
+            continue
+        duration = seconds_per_char * (1 if len(word) == 1 else max(1, len(word) / 3))
+        boundaries.append({"offset": elapsed, "duration": duration * 0.9, "text": word})
+        elapsed += duration
+    return boundaries, elapsed + pause
+
+class SyntheticTTSProvider(TTSProvider):
+    """
+    合成 TTS (SERVICE_BACKEND=synthetic)：生成时长与讲解词长度匹配的静音 MP3 与逐字 WordBoundary，
+    延迟与故障由 synthetic 配置控制。结果不写入持久化缓存，避免污染真实语音缓存。
+    """
+
+    name = "synthetic"
+    cacheable = False
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    async def synthesize(self, text, voice, rate):
+        await asyncio.sleep(self.profile.latency(settings.SYNTHETIC_TTS_LATENCY_MS))
+        self.profile.maybe_fail()
+        boundaries, duration = _synthetic_words(text)
+        return _SILENT_FRAME * max(1, int(duration / _SILENT_FRAME_SECONDS)), boundaries
+
+class RecordingTTSProvider(TTSProvider):
+    """record: 调用真实服务并录制音频与 WordBoundary; replay: 只回放录制"""
+
+    def __init__(self, inner, store, live: bool):
+        self.inner = inner
+        self.store = store
+        self.live = live
+        self.name = inner.name
+        self.cacheable = inner.cacheable
+
+    def available(self) -> bool:
+        return self.inner.available() if self.live else True
+
+    async def synthesize(self, text, voice, rate):
+        key = request_fingerprint({"provider": self.name, "text": text, "voice": voice, "rate": rate})
+        if not self.live:
+            boundaries = (await asyncio.to_thread(self.store.load, "tts", key))["boundaries"]
+            return await asyncio.to_thread(self.store.load_blob, "tts", key), boundaries
+        audio, boundaries = await self.inner.synthesize(text, voice, rate)
+        await asyncio.to_thread(self.store.save_blob, "tts", key, audio)
+        await asyncio.to_thread(self.store.save, "tts", key, {"boundaries": boundaries})
+        return audio, boundaries
+
+PROVIDER_CLASSES = {
+    "edge": EdgeTTSProvider,
+    "local": LocalTTSProvider,
+}
+
+class TTSRouter:
+    """
+    按优先级调用 TTS 服务，每个服务配有熔断器与延迟/错误统计。
+    服务降级时熔断器打开，后续请求直接跳到下一个服务，
+    单次任务在 TTS 故障时的耗时不再随幻灯片数成倍增长。
+    """
+
+    def __init__(self, providers):
+        self.providers = providers
+        self.breakers = {
+            p.name: CircuitBreaker(
+                f"tts:{p.name}",
+                failure_threshold=settings.TTS_BREAKER_FAILURE_RATE,
+                window=settings.TTS_BREAKER_WINDOW,
+                min_calls=settings.TTS_BREAKER_MIN_CALLS,
+                cooldown=settings.TTS_BREAKER_COOLDOWN
+            )
+            for p in providers
+        }
+        self.metrics = {p.name: LatencyStats() for p in providers}
+
+    async def synthesize(self, text, voice, rate, progress_callback=None, max_retries=3, allow_fallback=True):
+        """
+        Returns:
+            (MP3 数据, WordBoundary 列表, 实际使用的 provider)
+        """
+        text_preview = text[:30] + "..." if len(text) > 30 else text
+        providers = self.providers if allow_fallback else self.providers[:1]
+        failures = {}   # provider 名称 -> 失败原因，用于最终的错误信息
+
+        for provider in providers:
+            if not provider.available():
+                failures[provider.name] = "不可用"
+                continue
+            breaker = self.breakers[provider.name]
+            for attempt in range(max_retries):
+                if not breaker.allow():
+                    print(f"[WARN] TTS 服务 {provider.name} 已熔断，跳过")
+                    failures[provider.name] = failures.get(provider.name, "已熔断，跳过")
+                    break
+                if progress_callback and attempt > 0:
+                    progress_callback(f"🔄 语音生成重试 ({attempt + 1}/{max_retries}): {text_preview}")
+
+                start = time.perf_counter()
+                try:
+                    audio, boundaries = await asyncio.wait_for(
+                        provider.synthesize(text, voice, rate), timeout=settings.TTS_TIMEOUT
+                    )
+                except Exception as e:
+                    self.metrics[provider.name].record(time.perf_counter() - start, ok=False)
+                    breaker.record_failure()
+                    failures[provider.name] = f"{e!r}"
+                    print(f"[WARN] 音频生成失败 ({provider.name}, 尝试 {attempt + 1}/{max_retries}): {e!r}")
+                    if attempt == max_retries - 1:
+                        break
+                    if breaker.is_open():
+                        # 熔断器打开后不再等待，直接尝试下一个服务
+                        print(f"[WARN] TTS 服务 {provider.name} 已熔断，跳过")
+                        break
+                    # 指数退避
+                    await asyncio.sleep(settings.TTS_RETRY_BACKOFF * (2 ** attempt))
+                    continue
+
+                self.metrics[provider.name].record(time.perf_counter() - start)
+                breaker.record_success()
+                if provider is not self.providers[0] and progress_callback:
+                    progress_callback(f"⚠️ 在线语音服务不可用，已使用离线引擎: {text_preview}")
+                return audio, boundaries, provider
+
+        detail = "; ".join(f"{name}: {reason}" for name, reason in failures.items()) or "没有配置 TTS 服务"
+        print(f"[ERROR] 音频生成最终失败: {detail}")
+        if progress_callback:
+            progress_callback(f"❌ 语音生成失败")
+        raise Exception(f"TTS 服务不可用，请稍后再试 ({detail})")
+
+    def stats(self) -> dict:
+        return {
+            p.name: {
+                "available": p.available(),
+                "breaker": self.breakers[p.name].stats(),
+                "latency": self.metrics[p.name].snapshot(),
+            }
+            for p in self.providers
+        }
+
+def _build_providers():
+    """按 TTS_PROVIDERS 创建服务列表，非 live 后端时替换为录制/回放/合成版本"""
+    providers = [
+        PROVIDER_CLASSES[name.strip()]()
+        for name in settings.TTS_PROVIDERS.split(",")
+        if name.strip() in PROVIDER_CLASSES
+    ]
+    mode = backend_mode()
+    if mode == "live":
+        return providers
+    store, profile = shared_backends()
+    print(f"[INFO] 🧪 TTS 使用 {mode} 后端")
+    if mode == "synthetic":
+        return [SyntheticTTSProvider(profile)]
+    return [RecordingTTSProvider(p, store, live=(mode == "record")) for p in providers]
+
+tts_router = TTSRouter(_build_providers())
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import threading
+from google.genai import types
+from app.config import settings
+from app.core.disk_cache import hash_file
+from app.core.llm_scheduler import is_rate_limited
+
+class UploadTimeout(Exception):
+    """远端文件在 VIDEO_UPLOAD_TIMEOUT 内没有处理完成"""
+
+def is_upload_unsupported(error) -> bool:
+    """
+    是否为明确的"不支持 Files API"错误（代理未实现该接口、4xx 能力错误）。
+    超时、限流、5xx、网络错误以及远端处理失败都是临时情况，冷却后可以重试。
+    """
+    if isinstance(error, UploadTimeout) or is_rate_limited(error):
+        return False
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code == 501 or (400 <= code < 500 and code not in (408, 409, 429))
+    lowered = str(error).lower()
+    return any(mark in lowered for mark in ("not supported", "unsupported", "unimplemented", "not implemented"))
+
+class VideoFileStore:
+    """
+    视频文件句柄缓存：同一视频只通过 Files API 流式上传一次，
+    之后按内容哈希复用远端文件句柄，请求中只携带 file_uri，不再内联 base64 视频。
+
+    - 句柄带过期时间（Gemini 文件默认保留 48 小时），过期前自动重新上传
+    - Files API 明确不可用（如代理不支持）时回退为内联数据，并在本进程内不再尝试上传；
+      超时、5xx 等临时故障只在 VIDEO_UPLOAD_RETRY 秒内改为内联，之后重新尝试
+    """
+
+    def __init__(self, index_path: str, ttl: float):
+        self.index_path = index_path
+        self.ttl = ttl
+        self.uploads = 0
+        self.reuses = 0
+        self.inline_fallbacks = 0
+        self._upload_supported = True
+        self._retry_after = 0.0      # 临时故障后的冷却截止时间 (monotonic)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._index = self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _save_index(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _key_lock(self, digest):
+        # 同一文件的并发请求只上传一次
+        with self._lock:
+            return self._key_locks.setdefault(digest, threading.Lock())
+
+    def _lookup(self, digest):
+        entry = self._index.get(digest)
+        # 预留 10 分钟余量，避免请求途中句柄过期
+        if entry and entry["expires_at"] - 600 > time.time():
+            return entry
+        return None
+
+    def invalidate(self, digest):
+        """远端句柄失效（被删除或提前过期）时移除"""
+        with self._lock:
+            if self._index.pop(digest, None):
+                self._save_index()
+
+    @staticmethod
+    def inline_part(video_path, mime_type="video/mp4"):
+        """旧方式：将整个视频内联到请求中"""
+        with open(video_path, "rb") as f:
+            return types.Part(inline_data=types.Blob(data=f.read(), mime_type=mime_type))
+
+    def get_part(self, client, video_path, mime_type="video/mp4", log=print):
+        """
+        返回引用该视频的 Part，以及内容哈希（失败重试时用于 invalidate）
+
+        Returns:
+            (types.Part, digest 或 None)
+        """
+        if (settings.VIDEO_TRANSFER_MODE != "upload" or not self._upload_supported
+                or time.monotonic() < self._retry_after):
+            return self.inline_part(video_path, mime_type), None
+
+        digest = hash_file(video_path)
+        with self._key_lock(digest):
+            entry = self._lookup(digest)
+            if entry:
+                self.reuses += 1
+                log("复用已上传的视频文件，无需重新发送")
+                return types.Part.from_uri(file_uri=entry["uri"], mime_type=entry["mime_type"]), digest
+
+            try:
+                entry = self._upload(client, video_path, mime_type, digest, log)
+            except Exception as e:
+                if is_upload_unsupported(e):
+                    print(f"[WARN] Files API 不可用，本进程内改为内联发送视频: {e}")
+                    self._upload_supported = False
+                else:
+                    self._retry_after = time.monotonic() + settings.VIDEO_UPLOAD_RETRY
+                    print(f"[WARN] 视频上传失败，{settings.VIDEO_UPLOAD_RETRY:.0f} 秒内回退为内联数据: {e}")
+                self.inline_fallbacks += 1
+                return self.inline_part(video_path, mime_type), None
+
+        return types.Part.from_uri(file_uri=entry["uri"], mime_type=entry["mime_type"]), digest
+
+    def _upload(self, client, video_path, mime_type, digest, log):
+        size_mb = os.path.getsize(video_path) / 1024 / 1024
+        log(f"正在上传视频文件 ({size_mb:.1f} MB)...")
+        uploaded = client.files.upload(
+            file=video_path,
+            config=types.UploadFileConfig(mime_type=mime_type, display_name=digest[:16])
+        )
+        # 视频需要服务端处理完成 (ACTIVE) 后才能引用；超时则删除远端文件，避免工作线程无限等待
+        deadline = time.monotonic() + settings.VIDEO_UPLOAD_TIMEOUT
+        while uploaded.state and uploaded.state.name == "PROCESSING":
+            if time.monotonic() >= deadline:
+                self._delete_remote(client, uploaded.name)
+                raise UploadTimeout(f"远端文件处理超时 ({settings.VIDEO_UPLOAD_TIMEOUT:.0f}s): {uploaded.name}")
+            time.sleep(min(2, max(0.0, deadline - time.monotonic())))
+            uploaded = client.files.get(name=uploaded.name)
+        if uploaded.state and uploaded.state.name == "FAILED":
+            raise Exception(f"远端文件处理失败: {uploaded.name}")
+
+        if uploaded.expiration_time:
+            expires_at = uploaded.expiration_time.timestamp()
+        else:
+            expires_at = time.time() + self.ttl
+        entry = {
+            "name": uploaded.name,
+            "uri": uploaded.uri,
+            "mime_type": uploaded.mime_type or mime_type,
+            "expires_at": expires_at,
+        }
+        with self._lock:
+            self._index[digest] = entry
+            self._save_index()
+        self.uploads += 1
+        log("视频上传完成")
+        return entry
+
+    @staticmethod
+    def _delete_remote(client, name):
+        try:
+            client.files.delete(name=name)
+        except Exception as e:
+            print(f"[WARN] 删除远端文件失败 {name}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": settings.VIDEO_TRANSFER_MODE if self._upload_supported else "inline",
+                "upload_cooling_down": time.monotonic() < self._retry_after,
+                "cached_handles": len(self._index),
+                "uploads": self.uploads,
+                "reuses": self.reuses,
+                "inline_fallbacks": self.inline_fallbacks,
+            }
+
+video_file_store = VideoFileStore(settings.VIDEO_FILE_INDEX, settings.VIDEO_FILE_TTL)
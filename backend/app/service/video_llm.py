@@ -1,30 +1,34 @@
+import os
+import copy
 import json
-from google import genai
+import time
+import asyncio
+import threading
+from collections import OrderedDict
 from google.genai import types
 from app.config import settings
 from app.core.rag_engine import rag_engine
+from app.core.llm_scheduler import llm_scheduler
+from app.core.singleflight import SingleFlight, AsyncSingleFlight
+from app.service.service_backend import create_genai_client, request_fingerprint
+from app.service.video_files import video_file_store
+from app.service.video_preprocess import preprocess_video
+from app.service.catalog_shortlist import catalog_shortlist
+from app.service.script_stream import SlideStreamParser, parse_slides_partial
+from app.service.context_cache import context_cache
 
-class VideoLLMService:
-    def __init__(self):
-        self.client = genai.Client(
-            api_key=settings.API_KEY,
-            http_options={"base_url": settings.GOOGLE_GENAI_BASE_URL}
-        )
-        # 使用 gemini-2.0-flash 或 gemini-1.5-pro
-        self.model_name = "gemini-2.0-flash" 
+# 脚本生成失败时返回的默认脚本
+DEFAULT_SCRIPT = {
+    "slides": [
+        {
+            "title": "康复动作分析",
+            "bullets": ["视频已分析完成", "请查看详细文字分析"],
+            "narration": "视频分析已完成，详细信息请参考文字描述。"
+        }
+    ]
+}
 
-    def chat(self, message: str, history: list = None, model_name: str = "gemini-2.0-flash", stream: bool = False):
-        """
-        普通 AI 对话功能
-        Role: 康复训练指导
-        支持流式输出
-        """
-        print(f"[INFO] 💬 收到用户消息: {message[:50]}{'...' if len(message) > 50 else ''}")
-        print(f"[INFO] 🤖 使用模型: {model_name}")
-        print(f"[INFO] 📚 历史消息数: {len(history) if history else 0}")
-        print(f"[INFO] ⚡ 流式输出: {'是' if stream else '否'}")
-        
-        system_instruction = """
+CHAT_SYSTEM_INSTRUCTION = """
         你是一名专业的康复训练指导教练。你的职责是：
         1. 以专业、亲切、鼓励的口吻与用户交流。
         2. 解答用户关于康复动作、身体恢复、运动健康方面的问题。
@@ -32,7 +36,128 @@ class VideoLLMService:
         4. 适当地与用户互动，例如询问他们目前的疼痛程度、康复进展或具体需求。
         5. 如果用户上传了视频（通过上下文得知），请结合视频内容进行指导。
         """
-        
+
+def _request_key(request: dict) -> str:
+    """请求去重键：模型 + 内容 + 配置的哈希"""
+    return request_fingerprint({name: request.get(name) for name in ("model", "contents", "config")})
+
+class VideoLLMService:
+    """
+    Gemini 调用封装。
+
+    每个功能都提供同步与异步两个版本，二者共用请求构造与结果解析：
+    - 同步版本 (chat / recommend_videos / ...) 供脚本和后台线程使用
+    - 异步版本 (achat / arecommend_videos / ...) 基于 client.aio，供 FastAPI 处理函数直接 await，
+      生成期间不阻塞事件循环，单个 worker 可同时服务多路流式对话
+    """
+
+    def __init__(self):
+        # 按 SERVICE_BACKEND 选择直连 / 录制 / 回放 / 合成客户端
+        self.client = create_genai_client()
+        # 使用 gemini-2.0-flash 或 gemini-1.5-pro
+        self.model_name = "gemini-2.0-flash"
+
+        # 相同请求合并：同步/异步调用方各自一个 single-flight，后面是短 TTL 的结果缓存
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        self._recent = OrderedDict()   # 请求键 -> (过期时间, 响应)
+        self._recent_lock = threading.Lock()
+        # 计数在事件循环与工作线程中都会更新
+        self._stats_lock = threading.Lock()
+        self._coalesce_counts = {"requests": 0, "upstream": 0, "cache_hits": 0}
+
+    # 所有请求经全局调度器限速排队；priority: chat（交互对话） / video（视频任务）
+    # coalesce=True 的请求（标题、推荐、视频分析）相同输入并发时只调用一次上游
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._coalesce_counts[name] += 1
+
+    def _recent_get(self, key: str):
+        self._count("requests")
+        with self._recent_lock:
+            entry = self._recent.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._count("cache_hits")
+            return entry[1]
+        return None
+
+    def _recent_put(self, key: str, response):
+        ttl = settings.LLM_COALESCE_TTL
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._recent_lock:
+            self._recent[key] = (now + ttl, response)
+            self._recent.move_to_end(key)
+            # 插入顺序即过期顺序，从头部清理过期项
+            while self._recent and (next(iter(self._recent.values()))[0] <= now or len(self._recent) > 256):
+                self._recent.popitem(last=False)
+
+    def _generate_content(self, request: dict, priority: str = "video", coalesce: bool = False):
+        def call():
+            return llm_scheduler.call(
+                request["model"], lambda: self.client.models.generate_content(**request), priority
+            )
+
+        if not (coalesce and settings.LLM_COALESCE):
+            return call()
+        key = _request_key(request)
+        response = self._recent_get(key)
+        if response is not None:
+            return response
+
+        def upstream():
+            self._count("upstream")
+            response = call()
+            self._recent_put(key, response)
+            return response
+        return self._flight.do(key, upstream)
+
+    async def _agenerate_content(self, request: dict, priority: str = "video", coalesce: bool = False):
+        async def call():
+            return await llm_scheduler.acall(
+                request["model"], lambda: self.client.aio.models.generate_content(**request), priority
+            )
+
+        if not (coalesce and settings.LLM_COALESCE):
+            return await call()
+        key = _request_key(request)
+        response = self._recent_get(key)
+        if response is not None:
+            return response
+
+        async def upstream():
+            self._count("upstream")
+            response = await call()
+            self._recent_put(key, response)
+            return response
+        return await self._aflight.do(key, upstream)
+
+    def coalesce_stats(self) -> dict:
+        with self._stats_lock:
+            counts = dict(self._coalesce_counts)
+        return {
+            **counts,
+            "coalesced": counts["requests"] - counts["upstream"] - counts["cache_hits"],
+            "inflight": self._flight.inflight_count() + self._aflight.inflight_count(),
+            "cached": len(self._recent),
+        }
+
+    async def _agenerate_content_stream(self, request: dict, priority: str = "video"):
+        return await llm_scheduler.acall(
+            request["model"], lambda: self.client.aio.models.generate_content_stream(**request), priority
+        )
+
+    # ---------------- 对话 ----------------
+
+    @staticmethod
+    def _chat_request(message: str, history: list, model_name: str, stream: bool) -> dict:
+        print(f"[INFO] 💬 收到用户消息: {message[:50]}{'...' if len(message) > 50 else ''}")
+        print(f"[INFO] 🤖 使用模型: {model_name}")
+        print(f"[INFO] 📚 历史消息数: {len(history) if history else 0}")
+        print(f"[INFO] ⚡ 流式输出: {'是' if stream else '否'}")
+
         # 构建对话历史
         contents = []
         if history:
@@ -41,100 +166,195 @@ class VideoLLMService:
                 # 过滤掉非文本内容（如视频占位符）
                 if isinstance(msg["content"], str) and not msg["content"].startswith("[系统"):
                      contents.append(types.Content(role=role, parts=[types.Part(text=msg["content"])]))
-        
+
         contents.append(types.Content(role="user", parts=[types.Part(text=message)]))
 
         print(f"[INFO] 🚀 开始调用 Gemini API...")
-        
         if stream:
-            # 流式返回生成器
             print(f"[INFO] 📡 使用流式模式生成回复")
-            return self.client.models.generate_content_stream(
-                model=model_name,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_instruction
-                )
+        return {
+            "model": model_name,
+            "contents": contents,
+            "config": types.GenerateContentConfig(
+                system_instruction=CHAT_SYSTEM_INSTRUCTION
             )
-        else:
-            # 非流式返回完整文本
-            response = self.client.models.generate_content(
-                model=model_name,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_instruction
-                )
+        }
+
+    @staticmethod
+    def _log_chat_response(response_text: str):
+        print(f"[INFO] ✅ API 调用成功，响应长度: {len(response_text)} 字符")
+        print(f"[INFO] 📄 响应预览: {response_text[:100]}{'...' if len(response_text) > 100 else ''}")
+
+    def chat(self, message: str, history: list = None, model_name: str = "gemini-2.0-flash", stream: bool = False):
+        """
+        普通 AI 对话功能
+        Role: 康复训练指导
+        支持流式输出（返回同步生成器）
+        """
+        request = self._chat_request(message, history, model_name, stream)
+        if stream:
+            return llm_scheduler.call(
+                model_name, lambda: self.client.models.generate_content_stream(**request), "chat"
             )
-            response_text = response.text
-            print(f"[INFO] ✅ API 调用成功，响应长度: {len(response_text)} 字符")
-            print(f"[INFO] 📄 响应预览: {response_text[:100]}{'...' if len(response_text) > 100 else ''}")
-            return response_text
 
-    def recommend_videos(self, analysis_text: str, available_videos: list, model_name: str = "gemini-2.0-flash"):
+        response_text = self._generate_content(request, "chat").text
+        self._log_chat_response(response_text)
+        return response_text
+
+    async def _conversation_request(self, message: str, conversation, model_name: str, stream: bool) -> dict:
+        """基于服务端对话状态构造请求：前缀（系统指令 + 摘要 + 较早轮次）走上下文缓存，只附带其余的最近轮次"""
+        print(f"[INFO] 💬 收到用户消息: {message[:50]}{'...' if len(message) > 50 else ''}")
+        print(f"[INFO] 🤖 使用模型: {model_name}")
+        print(f"[INFO] 📚 服务端历史: 最近 {len(conversation.recent_turns())} 轮 (约 {conversation.recent_tokens()} tokens), "
+              f"已摘要 {conversation.summarized} 轮")
+        print(f"[INFO] ⚡ 流式输出: {'是' if stream else '否'}")
+
+        prefix_config, contents = await context_cache.resolve(self.client, model_name, CHAT_SYSTEM_INSTRUCTION, conversation)
+        contents = list(contents)
+        contents.append(types.Content(role="user", parts=[types.Part(text=message)]))
+        return {
+            "model": model_name,
+            "contents": contents,
+            "config": types.GenerateContentConfig(**prefix_config)
+        }
+
+    async def achat(self, message: str, history: list = None, model_name: str = "gemini-2.0-flash",
+                    stream: bool = False, conversation=None):
         """
-        根据分析结果和可用视频列表，推荐最相关的范例视频
+        chat 的异步版本；stream=True 时返回异步迭代器，使用 async for 消费
+
+        Args:
+            conversation: 服务端对话状态 (Conversation)，提供时忽略 history
         """
+        if conversation is not None:
+            request = await self._conversation_request(message, conversation, model_name, stream)
+        else:
+            request = self._chat_request(message, history, model_name, stream)
+        if stream:
+            return await self._agenerate_content_stream(request, "chat")
+
+        response_text = (await self._agenerate_content(request, "chat")).text
+        self._log_chat_response(response_text)
+        return response_text
+
+    async def asummarize_conversation(self, conversation, pending_tokens: int = 0, budget: int = None) -> bool:
+        """
+        最近轮次超出 token 预算时，把较早的轮次与已有摘要合并为新的滚动摘要
+
+        Returns:
+            是否更新了摘要
+        """
+        budget = settings.CHAT_HISTORY_TOKEN_BUDGET if budget is None else budget
+        async with conversation.summary_lock:
+            count = conversation.turns_to_fold(budget, pending_tokens)
+            if not count:
+                return False
+            turns = conversation.recent_turns()[:count]
+            transcript = "\n".join(
+                f"{'用户' if turn['role'] == 'user' else '教练'}: {turn['text']}" for turn in turns
+            )
+            prompt = f"""
+            你在为一段康复训练指导对话维护摘要。请把[已有摘要]与[新增对话]合并为一份新的摘要。
+
+            要求：
+            1. 保留用户的身体状况、疼痛部位与程度、康复阶段、已上传视频的分析结论与教练给出的关键建议。
+            2. 删除寒暄与重复内容，使用第三人称陈述句，不超过 400 字。
+            3. 只输出摘要正文。
+
+            [已有摘要]:
+            {conversation.summary or "（无）"}
+
+            [新增对话]:
+            {transcript}
+            """
+            response = await self._agenerate_content({
+                "model": settings.CHAT_SUMMARY_MODEL,
+                "contents": types.Content(role="user", parts=[types.Part(text=prompt)])
+            }, "chat")
+            summary = (response.text or "").strip()
+            if not summary:
+                return False
+            conversation.summary = summary
+            conversation.summarized += count
+            print(f"[INFO] 🗜️ 对话 {conversation.id} 已折叠 {count} 轮进摘要 (共 {conversation.summarized} 轮), "
+                  f"摘要约 {len(summary)} 字")
+            return True
+
+    # ---------------- 范例视频推荐 ----------------
+
+    @staticmethod
+    def _recommend_request(analysis_text: str, available_videos: list, model_name: str) -> dict:
         print(f"[INFO] 🎬 开始智能推荐范例视频...")
-        
+
+        # 先在本地预筛选出候选短名单，LLM 只负责重排
+        available_videos = catalog_shortlist.select(analysis_text, available_videos)
+
         # 构造简化的视频列表字符串
         video_list_str = "\n".join([f"- ID: {v['filename']}, Tags: {', '.join(v['tags'])}" for v in available_videos])
-        
+
         prompt = f"""
         基于以下对用户上传视频的分析，从给定的范例视频列表中选择最相关的3-5个视频。
-        
+
         [用户视频分析]:
         {analysis_text}
-        
+
         [可用范例视频列表]:
         {video_list_str}
-        
+
         请返回一个 JSON 数组，包含选中的视频 ID (filename)。
         示例: ["动作A-1", "动作B-2"]
-        
+
         如果没有相关的视频，返回空数组 []。
         只返回 JSON，不要其他文本。
         """
-        
-        try:
-            response = self.client.models.generate_content(
-                model=model_name,
-                contents=types.Content(
-                    role="user",
-                    parts=[types.Part(text=prompt)]
-                ),
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
+        return {
+            "model": model_name,
+            "contents": types.Content(
+                role="user",
+                parts=[types.Part(text=prompt)]
+            ),
+            "config": types.GenerateContentConfig(
+                response_mime_type="application/json"
             )
-            
-            text = response.text.strip()
-            # 清理可能的 markdown 标记
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.endswith("```"):
-                text = text[:-3]
-                
-            recommended_ids = json.loads(text)
-            print(f"[INFO] ✅ 推荐结果: {recommended_ids}")
-            return recommended_ids
+        }
+
+    @staticmethod
+    def _parse_recommendations(text: str) -> list:
+        text = text.strip()
+        # 清理可能的 markdown 标记
+        if text.startswith("```json"):
+            text = text[7:]
+        if text.endswith("```"):
+            text = text[:-3]
+
+        recommended_ids = json.loads(text)
+        print(f"[INFO] ✅ 推荐结果: {recommended_ids}")
+        return recommended_ids
+
+    def recommend_videos(self, analysis_text: str, available_videos: list, model_name: str = "gemini-2.0-flash"):
+        """
+        根据分析结果和可用视频列表，推荐最相关的范例视频
+        """
+        try:
+            response = self._generate_content(self._recommend_request(analysis_text, available_videos, model_name), coalesce=True)
+            return self._parse_recommendations(response.text)
         except Exception as e:
             print(f"[ERROR] 推荐视频失败: {e}")
             return []
 
-    def process_video_pipeline(self, video_path: str, user_prompt: str = None, progress_callback=None, model_name: str = "gemini-3-pro-preview"):
-        def log(msg):
-            print(f"[INFO] {msg}")
-            if progress_callback:
-                progress_callback(msg)
+    async def arecommend_videos(self, analysis_text: str, available_videos: list, model_name: str = "gemini-2.0-flash"):
+        """recommend_videos 的异步版本"""
+        try:
+            response = await self._agenerate_content(self._recommend_request(analysis_text, available_videos, model_name), coalesce=True)
+            return self._parse_recommendations(response.text)
+        except Exception as e:
+            print(f"[ERROR] 推荐视频失败: {e}")
+            return []
 
-        # 1. 读取视频二进制
-        log("正在读取视频文件...")
-        with open(video_path, "rb") as f:
-            video_bytes = f.read()
+    # ---------------- 视频分析流水线 ----------------
 
-        # 2. 视频理解 (Video -> Text)
-        log(f"正在调用模型 ({model_name}) 进行视频理解，分析康复动作...")
-        
+    @staticmethod
+    def _analyze_prompt(user_prompt: str = None) -> str:
         base_analyze_prompt = """
         你是一名专业的康复训练专家。请详细分析这个视频中的康复动作。
         1. 识别具体的动作名称。
@@ -142,48 +362,32 @@ class VideoLLMService:
         3. 指出动作中可能存在的错误或需要改进的地方（如果有）。
         4. 语气要专业且具有指导性。
         """
-        
+
         if user_prompt:
-            analyze_prompt = f"{base_analyze_prompt}\n\n用户特别关注点/额外指令：{user_prompt}\n请在分析时重点结合用户的指令进行回答。"
-        else:
-            analyze_prompt = base_analyze_prompt
-        
-        response = self.client.models.generate_content(
-            model=model_name,
-            contents=types.Content(
-                parts=[
-                    types.Part(
-                        inline_data=types.Blob(
-                            data=video_bytes,
-                            mime_type="video/mp4"
-                        )
-                    ),
-                    types.Part(text=analyze_prompt)
-                ]
-            )
-        )
-        raw_description = response.text
-        log(f"初步识别完成: {raw_description[:30]}...")
+            return f"{base_analyze_prompt}\n\n用户特别关注点/额外指令：{user_prompt}\n请在分析时重点结合用户的指令进行回答。"
+        return base_analyze_prompt
 
-        # 3. RAG 检索增强
-        log("正在查询 RAG 知识库，获取相关专业建议...")
-        rag_context = rag_engine.query(raw_description)
+    @staticmethod
+    def _analyze_request(video_part, analyze_prompt: str, model_name: str) -> dict:
+        return {
+            "model": model_name,
+            "contents": types.Content(parts=[video_part, types.Part(text=analyze_prompt)])
+        }
 
-        # 4. 生成最终脚本 (Text + Context -> JSON)
-        log("正在生成最终的教学演示脚本...")
-        
+    @staticmethod
+    def _script_request(raw_description: str, rag_context: str, user_prompt: str, model_name: str) -> dict:
         final_prompt_template = f"""
         你是一名康复训练指导。基于视频的动作描述和检索到的专业知识，生成一份简洁的教学视频脚本。
 
         [动作描述]: {raw_description}
         [专业知识库]: {rag_context}
         """
-        
+
         if user_prompt:
             final_prompt_template += f"\n[用户额外指令]: {user_prompt}\n请确保生成的脚本内容回应了用户的指令。"
 
         final_prompt_template += """
-        
+
         请输出严格的 JSON 格式（不要包含 ```json 标记）。生成5-8页幻灯片，每页内容要详细充实，格式如下：
         {
             "slides": [
@@ -194,7 +398,7 @@ class VideoLLMService:
                 }
             ]
         }
-        
+
         要求：
         1. 每页幻灯片至少包含3-5个要点
         2. 每个要点要详细具体，不要太简略
@@ -202,88 +406,267 @@ class VideoLLMService:
         4. 内容要覆盖：动作准备、执行步骤、注意事项、常见错误、效果说明等多个维度
         5. 语言要专业但通俗易懂，适合患者理解
         """
-        
-        final_prompt = final_prompt_template
 
-        try:
-            log("正在调用模型生成脚本...")
-            script_response = self.client.models.generate_content(
-                model=model_name,
-                contents=types.Content(parts=[types.Part(text=final_prompt)]),
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.7,
-                    max_output_tokens=4096  # 增加到4096以支持更长内容
-                )
+        return {
+            "model": model_name,
+            "contents": types.Content(parts=[types.Part(text=final_prompt_template)]),
+            "config": types.GenerateContentConfig(
+                response_mime_type="application/json",
+                temperature=0.7,
+                max_output_tokens=4096  # 增加到4096以支持更长内容
             )
+        }
+
+    @staticmethod
+    def _parse_script(script_text: str, log):
+        """
+        解析脚本 JSON，失败时返回默认脚本
+
+        Returns:
+            (script_data, complete): complete 为 False 表示脚本被截断（只保留了部分页面）或使用了默认脚本，
+            这样的结果不应写入结果缓存
+        """
+        try:
             log("脚本生成成功，正在解析 JSON...")
-            script_data = json.loads(script_response.text)
-            log(f"脚本解析完成，共 {len(script_data.get('slides', []))} 页幻灯片")
-            return script_data, raw_description
+            script_data = json.loads(script_text)
+            slides = script_data.get("slides") if isinstance(script_data, dict) else None
+            if not slides:
+                log("脚本中没有幻灯片，使用默认脚本")
+                return copy.deepcopy(DEFAULT_SCRIPT), False
+            log(f"脚本解析完成，共 {len(slides)} 页幻灯片")
+            return script_data, True
         except json.JSONDecodeError as e:
             log(f"JSON 解析错误: {str(e)}")
-            log(f"原始响应: {script_response.text[:200]}")
-            # 返回一个默认的脚本
-            default_script = {
-                "slides": [
-                    {
-                        "title": "康复动作分析",
-                        "bullets": ["视频已分析完成", "请查看详细文字分析"],
-                        "narration": "视频分析已完成，详细信息请参考文字描述。"
-                    }
-                ]
-            }
-            return default_script, raw_description
+            log(f"原始响应: {script_text[:200]}")
+            # 输出被截断时保留已完整的幻灯片，全部无法解析才使用默认脚本
+            slides = parse_slides_partial(script_text)
+            if slides:
+                log(f"已保留解析成功的 {len(slides)} 页幻灯片")
+                return {"slides": slides}, False
+            return copy.deepcopy(DEFAULT_SCRIPT), False
+
+    @staticmethod
+    def _pipeline_logger(progress_callback):
+        def log(msg):
+            print(f"[INFO] {msg}")
+            if progress_callback:
+                progress_callback(msg)
+        return log
+
+    def process_video_pipeline(self, video_path: str, user_prompt: str = None, progress_callback=None, model_name: str = "gemini-3-pro-preview"):
+        log = self._pipeline_logger(progress_callback)
+
+        # 0. 预处理：压缩到分析所需的分辨率/帧率，减小上传体积与 token 消耗
+        video_path, _ = preprocess_video(video_path, os.path.dirname(video_path), progress_callback)
+
+        # 1. 获取视频引用（上传一次后复用远端文件句柄）
+        log("正在准备视频文件...")
+        video_part, video_digest = video_file_store.get_part(self.client, video_path, log=log)
+
+        # 2. 视频理解 (Video -> Text)
+        log(f"正在调用模型 ({model_name}) 进行视频理解，分析康复动作...")
+        analyze_prompt = self._analyze_prompt(user_prompt)
+        try:
+            # 远端文件引用才参与去重，内联视频数据不做哈希
+            response = self._generate_content(
+                self._analyze_request(video_part, analyze_prompt, model_name), coalesce=bool(video_digest)
+            )
+        except Exception as e:
+            if not video_digest:
+                raise
+            # 远端文件可能已被删除或提前过期：作废句柄后改用内联数据重试一次
+            log(f"视频文件引用失效，改为直接发送视频: {e}")
+            video_file_store.invalidate(video_digest)
+            response = self._generate_content(
+                self._analyze_request(video_file_store.inline_part(video_path), analyze_prompt, model_name)
+            )
+        raw_description = response.text
+        log(f"初步识别完成: {raw_description[:30]}...")
+
+        # 3. RAG 检索增强
+        log("正在查询 RAG 知识库，获取相关专业建议...")
+        rag_context = rag_engine.query(raw_description)
+
+        # 4. 生成最终脚本 (Text + Context -> JSON)
+        log("正在生成最终的教学演示脚本...")
+        try:
+            log("正在调用模型生成脚本...")
+            script_response = self._generate_content(self._script_request(raw_description, rag_context, user_prompt, model_name))
+            script_data, _ = self._parse_script(script_response.text, log)
+            return script_data, raw_description
         except Exception as e:
             log(f"生成脚本时出错: {str(e)}")
             # 返回一个默认的脚本
-            default_script = {
-                "slides": [
-                    {
-                        "title": "康复动作分析",
-                        "bullets": ["视频已分析完成", "请查看详细文字分析"],
-                        "narration": "视频分析已完成，详细信息请参考文字描述。"
-                    }
-                ]
-            }
-            return default_script, raw_description
+            return copy.deepcopy(DEFAULT_SCRIPT), raw_description
 
-    def generate_session_title(self, first_message: str, model_name: str = "gemini-2.0-flash"):
+    async def aanalyze_video(self, video_path: str, user_prompt: str = None, progress_callback=None, model_name: str = "gemini-3-pro-preview"):
+        """流水线第一段（异步）：预处理 + 视频理解，返回 raw_description"""
+        log = self._pipeline_logger(progress_callback)
+
+        # 0. 预处理（阻塞操作放到线程中执行）
+        video_path, _ = await asyncio.to_thread(preprocess_video, video_path, os.path.dirname(video_path), progress_callback)
+
+        # 1. 获取视频引用
+        log("正在准备视频文件...")
+        video_part, video_digest = await asyncio.to_thread(video_file_store.get_part, self.client, video_path, log=log)
+
+        # 2. 视频理解
+        log(f"正在调用模型 ({model_name}) 进行视频理解，分析康复动作...")
+        analyze_prompt = self._analyze_prompt(user_prompt)
+        try:
+            # 远端文件引用才参与去重，内联视频数据不做哈希
+            response = await self._agenerate_content(
+                self._analyze_request(video_part, analyze_prompt, model_name), coalesce=bool(video_digest)
+            )
+        except Exception as e:
+            if not video_digest:
+                raise
+            log(f"视频文件引用失效，改为直接发送视频: {e}")
+            video_file_store.invalidate(video_digest)
+            inline_part = await asyncio.to_thread(video_file_store.inline_part, video_path)
+            response = await self._agenerate_content(self._analyze_request(inline_part, analyze_prompt, model_name))
+        raw_description = response.text
+        log(f"初步识别完成: {raw_description[:30]}...")
+        return raw_description
+
+    async def aquery_knowledge(self, raw_description: str, progress_callback=None):
+        """流水线第二段（异步）：RAG 检索增强"""
+        self._pipeline_logger(progress_callback)("正在查询 RAG 知识库，获取相关专业建议...")
+        return await rag_engine.aquery(raw_description)
+
+    async def agenerate_script(self, raw_description: str, rag_context: str, user_prompt: str = None, progress_callback=None,
+                               model_name: str = "gemini-3-pro-preview", status: dict = None):
         """
-        基于对话的第一条消息，生成简洁的会话标题
+        流水线第三段（异步）：生成教学脚本，失败时返回默认脚本
+
+        Args:
+            status: 可选，返回前写入 status["complete"]（脚本完整解析，可以缓存）
         """
+        log = self._pipeline_logger(progress_callback)
+        log("正在生成最终的教学演示脚本...")
+        try:
+            log("正在调用模型生成脚本...")
+            script_response = await self._agenerate_content(self._script_request(raw_description, rag_context, user_prompt, model_name))
+            script_data, complete = self._parse_script(script_response.text, log)
+        except Exception as e:
+            log(f"生成脚本时出错: {str(e)}")
+            script_data, complete = copy.deepcopy(DEFAULT_SCRIPT), False
+        if status is not None:
+            status["complete"] = complete
+        return script_data
+
+    async def astream_script(self, raw_description: str, rag_context: str, user_prompt: str = None, progress_callback=None,
+                             model_name: str = "gemini-3-pro-preview", status: dict = None):
+        """
+        流式生成教学脚本，每解析出一页完整的幻灯片就立即产出，下游可在脚本生成期间开始渲染。
+        中途出错或输出被截断时保留已产出的页面；一页都没有时产出默认脚本。
+
+        Args:
+            status: 可选，迭代结束时写入 status["complete"]：流正常结束、slides 数组完整闭合且没有跳过的页面。
+                中途出错或被截断的脚本为 False，不应写入结果缓存
+        """
+        log = self._pipeline_logger(progress_callback)
+        log("正在流式生成教学演示脚本...")
+        parser = SlideStreamParser()
+        count = 0
+        failed = False
+        if status is not None:
+            status["complete"] = False
+        try:
+            stream = await self._agenerate_content_stream(
+                self._script_request(raw_description, rag_context, user_prompt, model_name)
+            )
+            async for chunk in stream:
+                for slide in parser.feed(chunk.text or ""):
+                    count += 1
+                    log(f"📝 第 {count} 页脚本已生成: {slide['title'][:30]}")
+                    yield slide
+        except Exception as e:
+            failed = True
+            log(f"生成脚本时出错: {str(e)}")
+
+        if parser.skipped:
+            log(f"⚠️ {parser.skipped} 页脚本格式错误，已跳过")
+        complete = not failed and count > 0 and parser.complete
+        if count > 0 and not complete:
+            log(f"⚠️ 脚本不完整，只保留了 {count} 页幻灯片")
+        if status is not None:
+            status["complete"] = complete
+        if count == 0:
+            for slide in copy.deepcopy(DEFAULT_SCRIPT)["slides"]:
+                yield slide
+        else:
+            log(f"脚本生成完成，共 {count} 页幻灯片")
+
+    async def aprocess_video_pipeline(self, video_path: str, user_prompt: str = None, progress_callback=None, model_name: str = "gemini-3-pro-preview"):
+        """
+        process_video_pipeline 的异步版本：模型调用走 client.aio，
+        预处理、上传与 RAG 检索等阻塞操作放到线程中执行。
+        各段也可单独调用，以便与其他任务重叠执行。
+        """
+        raw_description = await self.aanalyze_video(video_path, user_prompt, progress_callback, model_name)
+        rag_context = await self.aquery_knowledge(raw_description, progress_callback)
+        script_data = await self.agenerate_script(raw_description, rag_context, user_prompt, progress_callback, model_name)
+        return script_data, raw_description
+
+    # ---------------- 会话标题 ----------------
+
+    @staticmethod
+    def _title_request(first_message: str, model_name: str) -> dict:
         prompt = f"""
         请为以下对话生成一个简洁的标题（不超过15个字）。
         标题要能概括对话的主要内容，使用专业但易懂的语言。
-        
+
         对话内容：{first_message}
-        
+
         只返回标题文本，不要包含引号、标点或其他说明。
         示例格式：
         - 腰椎康复动作分析
         - 膝关节疼痛咨询
         - 核心肌群训练指导
         """
-        
-        try:
-            response = self.client.models.generate_content(
-                model=model_name,
-                contents=types.Content(parts=[types.Part(text=prompt)]),
-                config=types.GenerateContentConfig(
-                    temperature=0.3,  # 较低的温度以获得更稳定的结果
-                    max_output_tokens=50
-                )
+        return {
+            "model": model_name,
+            "contents": types.Content(parts=[types.Part(text=prompt)]),
+            "config": types.GenerateContentConfig(
+                temperature=0.3,  # 较低的温度以获得更稳定的结果
+                max_output_tokens=50
             )
-            title = response.text.strip()
-            # 移除可能的引号
-            title = title.strip('"').strip("'").strip('《》')
-            # 限制长度
-            if len(title) > 20:
-                title = title[:20] + "..."
-            return title
+        }
+
+    @staticmethod
+    def _parse_title(text: str) -> str:
+        title = text.strip()
+        # 移除可能的引号
+        title = title.strip('"').strip("'").strip('《》')
+        # 限制长度
+        if len(title) > 20:
+            title = title[:20] + "..."
+        return title
+
+    @staticmethod
+    def _default_title(first_message: str) -> str:
+        return first_message[:15] + ("..." if len(first_message) > 15 else "")
+
+    def generate_session_title(self, first_message: str, model_name: str = "gemini-2.0-flash"):
+        """
+        基于对话的第一条消息，生成简洁的会话标题
+        """
+        try:
+            response = self._generate_content(self._title_request(first_message, model_name), "chat", coalesce=True)
+            return self._parse_title(response.text)
         except Exception as e:
             print(f"[WARN] 生成标题失败: {e}")
             # 返回默认标题
-            return first_message[:15] + ("..." if len(first_message) > 15 else "")
+            return self._default_title(first_message)
+
+    async def agenerate_session_title(self, first_message: str, model_name: str = "gemini-2.0-flash"):
+        """generate_session_title 的异步版本"""
+        try:
+            response = await self._agenerate_content(self._title_request(first_message, model_name), "chat", coalesce=True)
+            return self._parse_title(response.text)
+        except Exception as e:
+            print(f"[WARN] 生成标题失败: {e}")
+            return self._default_title(first_message)
 
-video_llm = VideoLLMService()
\ No newline at end of file
+video_llm = VideoLLMService()
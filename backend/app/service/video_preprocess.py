@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from app.config import settings
+from app.core.disk_cache import DiskCache, hash_file
+
+# 按源视频内容 + 预处理参数寻址，同一视频重复分析时直接复用压缩结果
+preprocess_cache = DiskCache(settings.PREPROCESS_CACHE_DIR, settings.PREPROCESS_CACHE_MAX_BYTES, name="preprocess")
+
+_preprocess_pool = None
+
+def _get_preprocess_pool():
+    global _preprocess_pool
+    if _preprocess_pool is None:
+        _preprocess_pool = ProcessPoolExecutor(max_workers=settings.PREPROCESS_MAX_WORKERS)
+    return _preprocess_pool
+
+class VideoRejectedError(Exception):
+    """视频不满足分析要求（如超过最大时长）"""
+
+def probe_video(path):
+    """
+    用 ffprobe 读取视频元数据（只读容器信息，不解码）
+
+    Returns:
+        {"duration": 秒, "width": int, "height": int, "fps": float, "has_audio": bool, "size": 字节}
+    """
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-print_format", "json",
+            "-show_entries", "format=duration:stream=codec_type,width,height,avg_frame_rate",
+            path
+        ],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffprobe 执行失败: {result.stderr[-300:]}")
+    data = json.loads(result.stdout or "{}")
+
+    info = {
+        "duration": float(data.get("format", {}).get("duration") or 0),
+        "width": 0,
+        "height": 0,
+        "fps": 0.0,
+        "has_audio": False,
+        "size": os.path.getsize(path),
+    }
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and not info["width"]:
+            info["width"] = int(stream.get("width") or 0)
+            info["height"] = int(stream.get("height") or 0)
+            num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+            info["fps"] = float(num) / float(den) if float(den or 0) else 0.0
+        elif stream.get("codec_type") == "audio":
+            info["has_audio"] = True
+    return info
+
+def _transcode(src_path, dst_path, params):
+    """在进程池中执行：按分析参数重新编码（缩放、降帧率、可选去除音轨）"""
+    args = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", src_path]
+    if params["max_duration"]:
+        args += ["-t", str(params["max_duration"])]
+    # 只缩小不放大，宽度保持偶数以满足 yuv420p
+    height = params["height"]
+    args += [
+        "-vf", f"scale=-2:'min({height},ih)',fps={params['fps']},format=yuv420p",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(params["crf"]),
+    ]
+    if params["keep_audio"]:
+        args += ["-c:a", "aac", "-b:a", "48k", "-ac", "1"]
+    else:
+        args += ["-an"]
+    args += ["-movflags", "+faststart", dst_path]
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg 执行失败 ({result.returncode}): {result.stderr[-500:]}")
+    return dst_path
+
+def _preprocess_params(duration):
+    params = {
+        "height": settings.PREPROCESS_HEIGHT,
+        "fps": settings.PREPROCESS_FPS,
+        "crf": settings.PREPROCESS_CRF,
+        "keep_audio": settings.PREPROCESS_KEEP_AUDIO,
+        "max_duration": None,
+    }
+    if settings.PREPROCESS_MAX_DURATION and duration > settings.PREPROCESS_MAX_DURATION:
+        params["max_duration"] = settings.PREPROCESS_MAX_DURATION
+    return params
+
+def preprocess_video(video_path, work_dir, progress_callback=None):
+    """
+    在调用模型前压缩视频：ffprobe 探测 -> 超长视频截断或拒绝 -> 缩放/降帧率/去音轨重新编码。
+    ffmpeg 不可用或压缩后反而更大时返回原视频。
+
+    Returns:
+        (用于分析的视频路径, 各阶段统计 dict)
+    """
+    def log(msg):
+        print(f"[INFO] {msg}")
+        if progress_callback:
+            progress_callback(msg)
+
+    stats = {"original_bytes": os.path.getsize(video_path)}
+    if not settings.VIDEO_PREPROCESS:
+        return video_path, stats
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        print("[WARN] 未找到 ffmpeg/ffprobe，跳过视频预处理")
+        return video_path, stats
+
+    start = time.perf_counter()
+    info = probe_video(video_path)
+    stats["probe_seconds"] = round(time.perf_counter() - start, 3)
+    stats["source"] = info
+
+    max_duration = settings.PREPROCESS_MAX_DURATION
+    if max_duration and info["duration"] > max_duration:
+        if settings.PREPROCESS_OVER_LIMIT == "reject":
+            raise VideoRejectedError(
+                f"视频时长 {info['duration']:.0f} 秒超过上限 {max_duration:.0f} 秒，请剪辑后重新上传"
+            )
+        log(f"视频时长 {info['duration']:.0f} 秒超过上限，仅分析前 {max_duration:.0f} 秒")
+
+    params = _preprocess_params(info["duration"])
+    source_hash = hash_file(video_path)
+    key = hashlib.sha256(
+        (source_hash + json.dumps(params, sort_keys=True)).encode("utf-8")
+    ).hexdigest() + ".mp4"
+    output_path = os.path.join(work_dir, "analysis_input.mp4")
+
+    start = time.perf_counter()
+    if preprocess_cache.fetch(key, output_path):
+        stats["cache_hit"] = True
+    else:
+        stats["cache_hit"] = False
+        log(f"正在压缩视频 ({info['width']}x{info['height']}, {info['fps']:.0f}fps -> {params['height']}p, {params['fps']}fps)...")
+        future = _get_preprocess_pool().submit(_transcode, video_path, output_path, params)
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[WARN] 视频预处理失败，使用原视频: {e}")
+            return video_path, stats
+    stats["transcode_seconds"] = round(time.perf_counter() - start, 3)
+
+    output_bytes = os.path.getsize(output_path)
+    if output_bytes >= stats["original_bytes"] and not params["max_duration"]:
+        # 原视频已足够小，压缩没有收益
+        os.remove(output_path)
+        log("视频已足够小，跳过压缩")
+        return video_path, stats
+    if not stats["cache_hit"]:
+        preprocess_cache.put_file(key, output_path)
+
+    stats["output_bytes"] = output_bytes
+    saved = stats["original_bytes"] - output_bytes
+    log(
+        f"视频预处理完成：{stats['original_bytes'] / 1024 / 1024:.1f} MB -> {output_bytes / 1024 / 1024:.1f} MB"
+        f"（节省 {max(saved, 0) / 1024 / 1024:.1f} MB，探测 {stats['probe_seconds']:.2f}s，"
+        f"{'命中缓存' if stats['cache_hit'] else '编码'} {stats['transcode_seconds']:.2f}s）"
+    )
+    return output_path, stats
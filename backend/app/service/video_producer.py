@@ -2,11 +2,20 @@ import os
 import subprocess
 import shutil
 import asyncio
-import edge_tts
+import hashlib
+import json
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from jinja2 import Template
 from app.config import settings
+from app.core.disk_cache import DiskCache
+from app.core.singleflight import AsyncSingleFlight
+from app.service.audio_timing import build_cues, mp3_duration, mp3_frames, to_webvtt
+from app.service.tts_provider import tts_router
+from app.service.ffmpeg_encoder import HLSPublisher, SegmentEncoder, ffmpeg_available, mux_subtitles
 from PIL import Image 
 
 # LaTeX 特殊字符转义函数
@@ -34,6 +43,8 @@ def escape_latex(text):
 
 # --- LaTeX 模版配置 ---
 # 使用简化的现代模板，避免复杂的 beamer 主题配置
+# 每个 slide 渲染为一个 frame，单页编译时 slides 只包含一项
+# \endofdump 之前的导言区对所有幻灯片都相同，会被预编译为 XeLaTeX 格式文件
 LATEX_TEMPLATE = r"""
 \documentclass[aspectratio=169,14pt]{beamer}
 \usepackage{fontspec}
@@ -43,19 +54,6 @@ LATEX_TEMPLATE = r"""
 % 禁用导航符号
 \setbeamertemplate{navigation symbols}{}
 
-% 字体配置
-\setmainfont[
-    Path = {{ font_dir }}/,
-    BoldFont = Times-New-Roman-Bold.ttf,
-    Extension = .ttf
-]{Times-New-Roman}
-
-\setCJKmainfont[
-    Path = {{ font_dir }}/,
-    BoldFont = NotoSerifSC-SemiBold.ttf,
-    Extension = .ttf
-]{NotoSerifSC-Regular}
-
 % 定义配色
 \definecolor{primaryblue}{RGB}{25, 25, 112}
 \definecolor{accentorange}{RGB}{255, 140, 0}
@@ -71,71 +69,267 @@ LATEX_TEMPLATE = r"""
 % 添加圆角阴影框架
 \setbeamertemplate{blocks}[rounded][shadow=true]
 
+% 以上部分可预编译进格式文件；XeTeX 不能 dump 字体，字体配置必须放在之后
+\csname endofdump\endcsname
+
+% 字体配置
+\setmainfont[
+    Path = {{ font_dir }}/,
+    BoldFont = Times-New-Roman-Bold.ttf,
+    Extension = .ttf
+]{Times-New-Roman}
+
+\setCJKmainfont[
+    Path = {{ font_dir }}/,
+    BoldFont = NotoSerifSC-SemiBold.ttf,
+    Extension = .ttf
+]{NotoSerifSC-Regular}
+
 \begin{document}
 
+{% for slide in slides %}
 \begin{frame}
-    \frametitle{ {{ title }} }
+    \frametitle{ {{ slide.title }} }
     \begin{itemize}
         \setlength\itemsep{1.8em}
-        {% for bullet in bullets %}
+        {% for bullet in slide.bullets %}
         \item \large {{ bullet }}
         {% endfor %}
     \end{itemize}
 \end{frame}
+{% endfor %}
 
 \end{document}
 """
 
-async def generate_audio(text, output_file, progress_callback=None, max_retries=3):
-    """使用 Edge-TTS 生成语音文件，带重试机制"""
+# --- TTS 音频缓存 ---
+tts_cache = DiskCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES, name="tts")
+# 相同讲解词的并发合成只请求一次 TTS 服务
+_tts_flight = AsyncSingleFlight()
+
+def tts_cache_key(text, voice, rate):
+    """TTS 缓存键：讲解词、音色与语速的哈希"""
+    payload = json.dumps([text, voice, rate], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest() + ".mp3"
+
+def _meta_key(cache_key):
+    # 语音元数据（时长、WordBoundary）与 MP3 并列存放
+    return cache_key[:-len(".mp3")] + ".json"
+
+def _build_audio_meta(text, audio, boundaries):
+    """语音元数据：时长由 MP3 帧头计算，无需解码"""
+    duration = mp3_duration(audio)
+    if boundaries:
+        duration = max(duration, boundaries[-1]["offset"] + boundaries[-1]["duration"])
+    return {"text": text, "duration": duration, "boundaries": boundaries}
+
+async def _synthesize_audio(text, voice, rate, progress_callback=None, max_retries=3, allow_fallback=True):
+    """
+    通过 TTS 服务层合成语音（熔断、重试与离线兜底由 tts_router 负责）
+
+    Returns:
+        (MP3 数据, 元数据, 是否可写入缓存)
+    """
+    audio, boundaries, provider = await tts_router.synthesize(
+        text, voice, rate,
+        progress_callback=progress_callback,
+        max_retries=max_retries,
+        allow_fallback=allow_fallback
+    )
+    return audio, _build_audio_meta(text, audio, boundaries), provider.cacheable
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _load_cached_audio(cache_key, output_file, text):
+    """从缓存复制语音并读取元数据，未命中返回 None"""
+    if not tts_cache.fetch(cache_key, output_file):
+        return None
+    meta_path = tts_cache.get(_meta_key(cache_key), track=False)
+    if meta_path:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    # 缺少元数据时由帧头补算时长
+    with open(output_file, "rb") as f:
+        meta = _build_audio_meta(text, f.read(), [])
+    tts_cache.put_bytes(_meta_key(cache_key), json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    return meta
+
+def _store_cached_audio(cache_key, audio, meta):
+    tts_cache.put_bytes(cache_key, audio)
+    tts_cache.put_bytes(_meta_key(cache_key), json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+async def generate_audio(text, output_file, progress_callback=None, max_retries=3, voice=None, rate=None):
+    """
+    生成语音文件（默认 Edge-TTS，服务熔断时自动使用离线引擎）
+    - 先查持久化缓存，命中时完全不访问网络
+    - 相同 (讲解词, 音色, 语速) 的并发请求合并为一次合成
+
+    Returns:
+        dict: 语音元数据 {"text", "duration", "boundaries"}，用于确定片段时长和生成字幕
+    """
+    voice = voice or settings.TTS_VOICE
+    rate = rate or settings.TTS_RATE
     text_preview = text[:30] + "..." if len(text) > 30 else text
+
+    cache_key = tts_cache_key(text, voice, rate)
+    meta = await asyncio.to_thread(_load_cached_audio, cache_key, output_file, text)
+    if meta is not None:
+        print(f"[INFO] 音频命中缓存: {output_file}")
+        if progress_callback:
+            progress_callback(f"♻️ 语音命中缓存: {text_preview}")
+        return meta
     
     if progress_callback:
         progress_callback(f"🎤 生成语音: {text_preview}")
-        
-    for attempt in range(max_retries):
+
+    async def synthesize():
+        audio, meta, cacheable = await _synthesize_audio(text, voice, rate, progress_callback, max_retries)
+        if cacheable:
+            await asyncio.to_thread(_store_cached_audio, cache_key, audio, meta)
+        return audio, meta
+
+    audio, meta = await _tts_flight.do(cache_key, synthesize)
+    await asyncio.to_thread(_write_bytes, output_file, audio)
+    print(f"[INFO] 音频生成成功: {output_file} ({meta['duration']:.1f}s)")
+    
+    if progress_callback:
+        progress_callback(f"✅ 语音完成: {text_preview}")
+    return meta
+
+# --- 批量语音合成 ---
+# 批量合成时各页讲解词之间的分隔，保证页间有自然停顿
+_BATCH_SEPARATOR = "\n\n"
+_SENTENCE_END = "。！？.!?…"
+
+def _normalize_for_alignment(text):
+    """对齐时只比较文字与数字，忽略标点和空白"""
+    return "".join(ch.lower() for ch in text if ch.isalnum())
+
+def _split_batched_audio(audio, boundaries, narrations):
+    """
+    根据 WordBoundary 将整段音频切分为逐页音频。
+    逐词把边界文本与各页讲解词对齐，在相邻两页的词间停顿处切分，
+    切点对齐到 MP3 帧边界，切出的每段都是合法的 MP3。
+
+    Returns:
+        [(audio_bytes, boundaries), ...]，无法对齐时返回 None
+    """
+    targets = [_normalize_for_alignment(text) for text in narrations]
+    words_per_slide = [[] for _ in narrations]
+    slide, pos = 0, 0
+    for boundary in boundaries:
+        word = _normalize_for_alignment(boundary["text"])
+        if not word:
+            continue
+        # 跳过已对齐完毕的页面
+        while slide < len(targets) and pos >= len(targets[slide]):
+            slide, pos = slide + 1, 0
+        if slide >= len(targets) or targets[slide][pos:pos + len(word)] != word:
+            return None
+        words_per_slide[slide].append(boundary)
+        pos += len(word)
+    if slide != len(targets) - 1 or pos != len(targets[-1]) or not all(words_per_slide):
+        return None
+
+    # 每页之间的切分时间：上一页最后一个词结束与下一页第一个词开始的中点
+    cut_times = []
+    for prev_words, next_words in zip(words_per_slide, words_per_slide[1:]):
+        prev_end = prev_words[-1]["offset"] + prev_words[-1]["duration"]
+        cut_times.append((prev_end + next_words[0]["offset"]) / 2)
+
+    frames = mp3_frames(audio)
+    if not frames:
+        return None
+    # 切点对齐到帧边界：记录每段起始帧的字节偏移与时间
+    cuts = [(frames[0][0], 0.0)]
+    elapsed = 0.0
+    cut_iter = iter(cut_times)
+    next_cut = next(cut_iter, None)
+    for offset, _, duration in frames:
+        if next_cut is not None and elapsed >= next_cut:
+            cuts.append((offset, elapsed))
+            next_cut = next(cut_iter, None)
+        elapsed += duration
+    if len(cuts) != len(narrations):
+        return None
+    cuts.append((frames[-1][0] + frames[-1][1], elapsed))
+
+    pieces = []
+    for idx, words in enumerate(words_per_slide):
+        start_byte, start_time = cuts[idx]
+        end_byte, _ = cuts[idx + 1]
+        shifted = [dict(word, offset=word["offset"] - start_time) for word in words]
+        pieces.append((audio[start_byte:end_byte], shifted))
+    return pieces
+
+async def generate_audio_batch(narrations, output_files, progress_callback=None, voice=None, rate=None):
+    """
+    在一次 Edge-TTS 会话中合成整份脚本的讲解词，再按页切分，
+    省去每页一次的 WebSocket 握手（503/握手失败的主要来源）。
+    已缓存的页面直接复用；批量合成或切分失败时自动回退为逐页合成。
+
+    Returns:
+        list[dict]: 与 narrations 一一对应的语音元数据
+    """
+    voice = voice or settings.TTS_VOICE
+    rate = rate or settings.TTS_RATE
+    metas = [None] * len(narrations)
+
+    cache_keys = [tts_cache_key(text, voice, rate) for text in narrations]
+    for idx, (text, output_file) in enumerate(zip(narrations, output_files)):
+        metas[idx] = await asyncio.to_thread(_load_cached_audio, cache_keys[idx], output_file, text)
+    pending = [idx for idx, meta in enumerate(metas) if meta is None and narrations[idx].strip()]
+    if progress_callback and len(pending) < len(narrations):
+        progress_callback(f"♻️ {len(narrations) - len(pending)} 段语音命中缓存")
+
+    if len(pending) > 1:
+        if progress_callback:
+            progress_callback(f"🎤 批量合成 {len(pending)} 段讲解词...")
+        texts = [narrations[idx] for idx in pending]
+        # 每段补全句末标点，保证切分处有停顿
+        joined = _BATCH_SEPARATOR.join(
+            text if text.rstrip()[-1:] in _SENTENCE_END else text.rstrip() + "。"
+            for text in texts
+        )
         try:
-            if progress_callback and attempt > 0:
-                progress_callback(f"🔄 语音生成重试 ({attempt + 1}/{max_retries}): {text_preview}")
-                
-            communicate = edge_tts.Communicate(text, "zh-CN-YunxiNeural")
-            await communicate.save(output_file)
-            print(f"[INFO] 音频生成成功: {output_file}")
-            
-            if progress_callback:
-                progress_callback(f"✅ 语音完成: {text_preview}")
-            return
-            
-        except Exception as e:
-            wait_time = (attempt + 1) * 2  # 递增等待时间：2秒、4秒、6秒
-            print(f"[WARN] 音频生成失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            
-            if attempt < max_retries - 1:
-                if progress_callback:
-                    progress_callback(f"⚠️ 语音失败，{wait_time}秒后重试: {text_preview}")
-                print(f"[INFO] {wait_time}秒后重试...")
-                await asyncio.sleep(wait_time)
+            # 批量只尝试一次主服务，失败直接走逐页合成（逐页合成自带重试与离线兜底）
+            audio, batch_meta, _ = await _synthesize_audio(joined, voice, rate, max_retries=1, allow_fallback=False)
+            pieces = _split_batched_audio(audio, batch_meta["boundaries"], texts)
+            if pieces is None:
+                print("[WARN] 批量语音无法按页对齐，回退为逐页合成")
             else:
-                print(f"[ERROR] 音频生成最终失败，已重试 {max_retries} 次")
+                for idx, (piece, boundaries) in zip(pending, pieces):
+                    meta = _build_audio_meta(narrations[idx], piece, boundaries)
+                    await asyncio.to_thread(_store_cached_audio, cache_keys[idx], piece, meta)
+                    await asyncio.to_thread(_write_bytes, output_files[idx], piece)
+                    metas[idx] = meta
+                print(f"[INFO] 批量语音合成成功，共 {len(pending)} 段")
                 if progress_callback:
-                    progress_callback(f"❌ 语音生成失败")
-                raise Exception(f"Edge TTS 服务不可用，请稍后再试: {e}")
+                    progress_callback(f"✅ 批量语音完成: {len(pending)} 段")
+        except Exception as e:
+            print(f"[WARN] 批量语音合成失败，回退为逐页合成: {e}")
+            if progress_callback:
+                progress_callback(f"⚠️ 批量语音失败，改为逐页合成...")
 
-def compile_latex_slide(title, bullets, output_image_path, session_dir, progress_callback=None):
-    """
-    使用 XeLaTeX 编译幻灯片，支持自定义学术字体
-    
-    Args:
-        title: 幻灯片标题
-        bullets: 要点列表
-        output_image_path: 输出图片路径
-        session_dir: 会话目录
-        progress_callback: 进度回调函数
-    """
-    if progress_callback:
-        progress_callback(f"📝 准备编译幻灯片: {title[:20]}...")
-    
-    # 1. 准备字体路径
+    # 回退：剩余页面逐页合成
+    for idx, meta in enumerate(metas):
+        if meta is None:
+            metas[idx] = await generate_audio(
+                narrations[idx], output_files[idx],
+                progress_callback=progress_callback, voice=voice, rate=rate
+            )
+    return metas
+
+# 目标视频分辨率
+SLIDE_SIZE = (1920, 1080)
+
+def _latex_font_dir():
+    """返回 LaTeX 可用的字体目录路径，并检查字体是否齐全"""
     font_dir = settings.FONTS_DIR
     
     # LaTeX 对路径要求比较严格：
@@ -155,23 +349,180 @@ def compile_latex_slide(title, bullets, output_image_path, session_dir, progress
     for font in required_fonts:
         if not os.path.exists(os.path.join(settings.FONTS_DIR, font)):
             print(f"[WARNING] 字体文件缺失: {font} (在 {settings.FONTS_DIR})")
+    return font_dir
 
-    # 2. 渲染模板
-    if progress_callback:
-        progress_callback(f"🎨 渲染 LaTeX 模板...")
-    
+def _render_tex(slides):
+    """将幻灯片列表渲染为 LaTeX 源码，每个 slide 一个 frame"""
     # 转义 LaTeX 特殊字符
-    escaped_title = escape_latex(title)
-    escaped_bullets = [escape_latex(bullet) for bullet in bullets]
-        
+    escaped_slides = [
+        {
+            "title": escape_latex(slide["title"]),
+            "bullets": [escape_latex(bullet) for bullet in slide["bullets"]],
+        }
+        for slide in slides
+    ]
     template = Template(LATEX_TEMPLATE)
-    tex_content = template.render(
-        title=escaped_title,
-        bullets=escaped_bullets,
-        font_dir=font_dir
+    return template.render(slides=escaped_slides, font_dir=_latex_font_dir())
+
+# --- 预编译导言区格式缓存 ---
+LATEX_FORMAT_NAME = "slide_preamble"
+
+# 当前进程已确认的格式目录，避免每次编译重复检查
+_format_dir_cache = {}
+# 构建失败的格式键 -> 失败时间，LATEX_FORMAT_RETRY 秒内不再重试
+_format_failed_at = {}
+# 字体目录指纹，每个进程只计算一次（更换字体后重启服务生效）
+_fonts_fp = None
+
+def _fonts_fingerprint():
+    """字体目录指纹：文件名、大小与修改时间，字体变化时自动失效"""
+    global _fonts_fp
+    if _fonts_fp is None:
+        entries = []
+        if os.path.isdir(settings.FONTS_DIR):
+            for name in sorted(os.listdir(settings.FONTS_DIR)):
+                stat = os.stat(os.path.join(settings.FONTS_DIR, name))
+                entries.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+        _fonts_fp = "|".join(entries)
+    return _fonts_fp
+
+def ensure_latex_format():
+    """
+    确保导言区格式文件已构建，返回格式文件所在目录；不可用时返回 None。
+
+    使用 mylatexformat 将 endofdump 标记之前的导言区 (beamer、fontspec、xeCJK、配色)
+    dump 为 .fmt 文件。缓存键由模板文本和字体目录内容决定，任一变化都会重新构建。
+    构建失败只在当前进程内记住一段时间 (LATEX_FORMAT_RETRY)，期间回退为普通编译，之后重新尝试。
+    """
+    if not settings.LATEX_FORMAT_CACHE:
+        return None
+
+    key = hashlib.sha256(
+        (LATEX_TEMPLATE + "\0" + _fonts_fingerprint()).encode("utf-8")
+    ).hexdigest()[:16]
+    if key in _format_dir_cache:
+        return _format_dir_cache[key]
+    failed_at = _format_failed_at.get(key)
+    if failed_at is not None and time.monotonic() - failed_at < settings.LATEX_FORMAT_RETRY:
+        return None
+
+    format_dir = os.path.join(settings.LATEX_FORMAT_DIR, key)
+    fmt_path = os.path.join(format_dir, f"{LATEX_FORMAT_NAME}.fmt")
+    if os.path.exists(fmt_path):
+        _format_dir_cache[key] = format_dir
+        return format_dir
+    if os.path.exists(os.path.join(format_dir, "FAILED")):
+        # 旧版本留下的失败标记，清理后重新构建
+        shutil.rmtree(format_dir, ignore_errors=True)
+
+    # 在临时目录中构建，完成后原子替换，允许多个进程同时构建
+    print(f"[INFO] 正在预编译 LaTeX 导言区格式: {key}")
+    os.makedirs(settings.LATEX_FORMAT_DIR, exist_ok=True)
+    build_dir = os.path.join(settings.LATEX_FORMAT_DIR, f"tmp-{uuid.uuid4().hex}")
+    os.makedirs(build_dir)
+    with open(os.path.join(build_dir, "preamble.tex"), "w", encoding="utf-8") as f:
+        f.write(_render_tex([]))
+
+    try:
+        subprocess.run(
+            [
+                "xelatex", "-ini", "-interaction=nonstopmode",
+                f"-jobname={LATEX_FORMAT_NAME}",
+                "&xelatex", "mylatexformat.ltx", "preamble.tex"
+            ],
+            cwd=build_dir,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        built = os.path.exists(os.path.join(build_dir, f"{LATEX_FORMAT_NAME}.fmt"))
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"[WARNING] 导言区格式预编译失败，回退为普通编译: {e}")
+        built = False
+
+    if not built:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        _format_failed_at[key] = time.monotonic()
+        return None
+    try:
+        os.replace(build_dir, format_dir)
+    except OSError:
+        # 其他进程已完成构建
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    result = format_dir if os.path.exists(fmt_path) else None
+    if result:
+        _format_dir_cache[key] = result
+        print(f"[INFO] ✅ 导言区格式已就绪: {fmt_path}")
+    else:
+        _format_failed_at[key] = time.monotonic()
+    return result
+
+def _run_xelatex(tex_filename, cwd):
+    """调用 xelatex 编译，可用时加载预编译的导言区格式"""
+    # -interaction=nonstopmode 防止编译错误时卡住进程
+    cmd = ["xelatex", "-interaction=nonstopmode"]
+    env = None
+    format_dir = ensure_latex_format()
+    if format_dir:
+        cmd.append(f"-fmt={LATEX_FORMAT_NAME}")
+        # 末尾的分隔符表示继续搜索 TeX 默认路径
+        env = dict(os.environ, TEXFORMATS=format_dir + os.pathsep)
+    cmd.append(tex_filename)
+    return subprocess.run(
+        cmd,
+        cwd=cwd,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+
+# --- 幻灯片图片缓存 ---
+# 跨会话共享，相同标题与要点的幻灯片只编译一次
+slide_cache = DiskCache(settings.SLIDE_CACHE_DIR, settings.SLIDE_CACHE_MAX_BYTES, name="slides")
+
+def slide_cache_key(title, bullets):
+    """幻灯片缓存键：转义后的标题、要点、模板文本、字体集合与输出尺寸的哈希"""
+    payload = json.dumps(
+        [escape_latex(title), [escape_latex(b) for b in bullets], LATEX_TEMPLATE, _fonts_fingerprint(), SLIDE_SIZE],
+        ensure_ascii=False
     )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest() + ".png"
+
+def compile_latex_slide(title, bullets, output_image_path, session_dir, progress_callback=None, use_cache=True):
+    """
+    使用 XeLaTeX 编译幻灯片，支持自定义学术字体
+    
+    Args:
+        title: 幻灯片标题
+        bullets: 要点列表
+        output_image_path: 输出图片路径
+        session_dir: 编译工作目录（并发编译时每页使用独立目录）
+        progress_callback: 进度回调函数
+        use_cache: 是否读写幻灯片缓存（进程池中由主进程统一处理缓存）
+
+    Returns:
+        bool: 是否成功编译（False 表示使用了占位图）
+    """
+    cache_key = slide_cache_key(title, bullets) if use_cache else None
+    if cache_key and slide_cache.fetch(cache_key, output_image_path):
+        if progress_callback:
+            progress_callback(f"♻️ 幻灯片命中缓存: {title[:20]}...")
+        return True
+
+    if progress_callback:
+        progress_callback(f"📝 准备编译幻灯片: {title[:20]}...")
+
+    # 1-2. 准备字体路径并渲染模板
+    if progress_callback:
+        progress_callback(f"🎨 渲染 LaTeX 模板...")
+    tex_content = _render_tex([{"title": title, "bullets": bullets}])
 
     # 3. 写入 .tex 文件
+    os.makedirs(session_dir, exist_ok=True)
     tex_filename = "slide.tex"
     tex_path = os.path.join(session_dir, tex_filename)
     with open(tex_path, "w", encoding="utf-8") as f:
@@ -181,17 +532,9 @@ def compile_latex_slide(title, bullets, output_image_path, session_dir, progress
     if progress_callback:
         progress_callback(f"📝 正在编译 LaTeX: {title[:20]}...")
         
-    # -interaction=nonstopmode 防止编译错误时卡住进程
     print(f"[INFO] 正在编译 LaTeX: {title[:20]}...")
     try:
-        result = subprocess.run(
-            ["xelatex", "-interaction=nonstopmode", tex_filename],
-            cwd=session_dir, # 在临时目录下执行
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        result = _run_xelatex(tex_filename, session_dir) # 在临时目录下执行
         
         # 检查是否有警告或错误
         if "Warning" in result.stdout:
@@ -205,8 +548,8 @@ def compile_latex_slide(title, bullets, output_image_path, session_dir, progress
         if progress_callback:
             progress_callback(f"❌ LaTeX 编译失败: {title[:20]}...")
         # 失败回退：生成一张纯色错误图片，防止程序崩溃
-        Image.new('RGB', (1920, 1080), color=(200, 200, 200)).save(output_image_path)
-        return
+        Image.new('RGB', SLIDE_SIZE, color=(200, 200, 200)).save(output_image_path)
+        return False
 
     # 5. 将生成的 PDF 转为 PNG
     if progress_callback:
@@ -214,61 +557,377 @@ def compile_latex_slide(title, bullets, output_image_path, session_dir, progress
         
     pdf_path = os.path.join(session_dir, "slide.pdf")
     if os.path.exists(pdf_path):
-        # dpi=200 约等于 1080p 分辨率
-        images = convert_from_path(pdf_path, dpi=200) 
+        # 与批量路径一致，直接栅格化为 1920x1080
+        images = convert_from_path(pdf_path, size=SLIDE_SIZE)
         if images:
             # 直接保存第一页
             images[0].save(output_image_path, "PNG")
             if progress_callback:
                 progress_callback(f"✅ 图片生成: {title[:20]}...")
+            if cache_key:
+                slide_cache.put_file(cache_key, output_image_path)
+            return True
+        return False
     else:
         print("[ERROR] PDF 文件未生成")
         if progress_callback:
             progress_callback(f"❌ PDF 转换失败: {title[:20]}...")
         # 生成空白图兜底
-        Image.new('RGB', (1920, 1080), color=(255, 255, 255)).save(output_image_path)
+        Image.new('RGB', SLIDE_SIZE, color=(255, 255, 255)).save(output_image_path)
+        return False
 
-async def render_final_video(script_data, session_id, progress_callback=None):
-    """合成最终视频"""
-    session_dir = os.path.join(settings.TEMP_DIR, session_id)
-    os.makedirs(session_dir, exist_ok=True)
-    
-    clips = []
-    slides = script_data.get("slides", [])
+def compile_latex_slides_batch(slides, output_image_paths, build_dir, progress_callback=None):
+    """
+    将整份脚本的所有幻灯片渲染为一个多 frame 的 Beamer 文档：
+    只启动一次 xelatex，并由 pdftoppm 一次性按 1920x1080 栅格化所有页面。
+
+    整体编译失败或页数与幻灯片数不一致时，逐页回退到 compile_latex_slide，
+    出错的页面各自使用占位图，不影响其他页面。
 
+    Args:
+        slides: 幻灯片列表 [{"title": ..., "bullets": [...]}, ...]
+        output_image_paths: 与 slides 一一对应的输出图片路径
+        build_dir: 编译工作目录
+        progress_callback: 进度回调函数
+
+    Returns:
+        list[bool]: 每页是否成功编译（不读写缓存，由调用方处理）
+    """
+    if not slides:
+        return []
+
+    os.makedirs(build_dir, exist_ok=True)
+    total = len(slides)
+
+    if progress_callback:
+        progress_callback(f"📝 批量编译 {total} 页幻灯片...")
+
+    tex_filename = "slides.tex"
+    with open(os.path.join(build_dir, tex_filename), "w", encoding="utf-8") as f:
+        f.write(_render_tex(slides))
+
+    print(f"[INFO] 正在批量编译 LaTeX，共 {total} 页...")
+    pdf_path = os.path.join(build_dir, "slides.pdf")
+    batch_ok = False
     try:
-        total_slides = len(slides)
-        print(f"[INFO] 开始渲染视频，共 {total_slides} 页...")
-        
+        _run_xelatex(tex_filename, build_dir)
+        page_count = pdfinfo_from_path(pdf_path).get("Pages", 0)
+        if page_count == total:
+            batch_ok = True
+        else:
+            print(f"[WARNING] 批量编译页数不一致: 期望 {total}，实际 {page_count}")
+    except subprocess.CalledProcessError as e:
+        print(f"[ERROR] 批量 LaTeX 编译失败: {e.stderr}")
+    except Exception as e:
+        print(f"[ERROR] 读取批量编译结果失败: {e}")
+
+    if batch_ok:
         if progress_callback:
-            progress_callback(f"🎬 开始视频制作流程 (共 {total_slides} 页)")
-        
-        for idx, slide in enumerate(slides):
-            slide_num = idx + 1
+            progress_callback(f"🖼️ 批量转换 {total} 页为图片...")
+        # 一次 pdftoppm 调用输出全部页面，直接写 PNG 文件，不经过 PIL
+        page_paths = convert_from_path(
+            pdf_path,
+            size=SLIDE_SIZE,
+            fmt="png",
+            output_folder=build_dir,
+            output_file="page",
+            paths_only=True
+        )
+        if len(page_paths) == total:
+            for page_path, output_image_path in zip(page_paths, output_image_paths):
+                os.replace(page_path, output_image_path)
             if progress_callback:
-                progress_callback(f"📄 处理第 {slide_num}/{total_slides} 页: {slide['title'][:30]}...")
-            
-            img_path = os.path.join(session_dir, f"slide_{idx}.png")
-            audio_path = os.path.join(session_dir, f"audio_{idx}.mp3")
-            
-            # --- 步骤 1: 生成素材 ---
-            # 使用 LaTeX 生成图片
+                progress_callback(f"✅ 批量编译完成: {total} 页")
+            return [True] * total
+        print(f"[WARNING] 栅格化页数不一致: 期望 {total}，实际 {len(page_paths)}")
+
+    # 回退：逐页编译，失败的页面各自使用占位图
+    if progress_callback:
+        progress_callback(f"⚠️ 批量编译失败，改为逐页编译...")
+    return [
+        compile_latex_slide(
+            slide["title"],
+            slide["bullets"],
+            output_image_path,
+            os.path.join(build_dir, f"frame_{idx}"),
+            progress_callback=progress_callback,
+            use_cache=False
+        )
+        for idx, (slide, output_image_path) in enumerate(zip(slides, output_image_paths))
+    ]
+
+def _fetch_cached_slides(slides, img_paths):
+    """从缓存复制已渲染的幻灯片，返回未命中的页面下标"""
+    return [
+        idx for idx, slide in enumerate(slides)
+        if not slide_cache.fetch(slide_cache_key(slide["title"], slide["bullets"]), img_paths[idx])
+    ]
+
+def _store_compiled_slides(slides, img_paths, indices, results):
+    """将编译成功的幻灯片写入缓存，占位图不缓存"""
+    for idx, ok in zip(indices, results):
+        if ok:
+            slide_cache.put_file(slide_cache_key(slides[idx]["title"], slides[idx]["bullets"]), img_paths[idx])
+
+# LaTeX 编译进程池（懒加载，整个服务进程共享）
+_latex_pool = None
+
+def _get_latex_pool():
+    global _latex_pool
+    if _latex_pool is None:
+        _latex_pool = ProcessPoolExecutor(max_workers=settings.LATEX_MAX_WORKERS)
+    return _latex_pool
+
+async def _prepare_assets_sequential(slides, session_dir, progress_callback=None, on_slide_ready=None):
+    """逐页生成图片和语音（旧流程）；on_slide_ready(idx, img_path, audio_path, audio_meta) 在每页素材就绪时调用"""
+    total_slides = len(slides)
+    img_paths = [os.path.join(session_dir, f"slide_{idx}.png") for idx in range(total_slides)]
+    batch_mode = settings.SLIDE_COMPILE_MODE == "batch"
+
+    if batch_mode:
+        missing = _fetch_cached_slides(slides, img_paths)
+        if progress_callback and len(missing) < total_slides:
+            progress_callback(f"♻️ {total_slides - len(missing)} 页幻灯片命中缓存")
+        results = compile_latex_slides_batch(
+            [slides[idx] for idx in missing],
+            [img_paths[idx] for idx in missing],
+            os.path.join(session_dir, "build"),
+            progress_callback=progress_callback
+        )
+        _store_compiled_slides(slides, img_paths, missing, results)
+
+    batch_audio = settings.TTS_BATCH and total_slides > 1
+    if batch_audio:
+        batch_metas = await generate_audio_batch(
+            [slide['narration'] for slide in slides],
+            [os.path.join(session_dir, f"audio_{idx}.mp3") for idx in range(total_slides)],
+            progress_callback=progress_callback
+        )
+
+    assets = []
+    for idx, slide in enumerate(slides):
+        slide_num = idx + 1
+        if progress_callback:
+            progress_callback(f"📄 处理第 {slide_num}/{total_slides} 页: {slide['title'][:30]}...")
+
+        img_path = img_paths[idx]
+        audio_path = os.path.join(session_dir, f"audio_{idx}.mp3")
+
+        # 使用 LaTeX 生成图片
+        if not batch_mode:
             compile_latex_slide(
-                slide['title'], 
-                slide['bullets'], 
-                img_path, 
+                slide['title'],
+                slide['bullets'],
+                img_path,
                 session_dir,
                 progress_callback=progress_callback
             )
-            
-            # 生成语音
-            await generate_audio(
-                slide['narration'], 
+
+        # 生成语音
+        if batch_audio:
+            audio_meta = batch_metas[idx]
+        else:
+            audio_meta = await generate_audio(
+                slide['narration'],
                 audio_path,
                 progress_callback=progress_callback
             )
+        assets.append((idx, img_path, audio_path, audio_meta))
+        if on_slide_ready:
+            await on_slide_ready(idx, img_path, audio_path, audio_meta)
+    return assets
+
+async def _prepare_assets_concurrent(slides, session_dir, progress_callback=None, on_slide_ready=None):
+    """
+    并发生成图片和语音：
+    - LaTeX 编译在进程池中执行，每页使用独立的编译目录，避免 slide.tex 互相覆盖；
+      batch 模式下整份脚本作为一个任务提交，只编译一次
+    - 所有讲解词通过有界的 asyncio 并发池同时合成；TTS_BATCH 开启时改为一次会话批量合成
+    事件循环全程不被阻塞
+
+    on_slide_ready(idx, img_path, audio_path, audio_meta) 在某页图片与语音都就绪时立即调用，
+    便于后续编码与前面页面的素材生成重叠进行。
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_latex_pool()
+    tts_semaphore = asyncio.Semaphore(settings.TTS_MAX_CONCURRENCY)
+    total_slides = len(slides)
+    img_paths = [os.path.join(session_dir, f"slide_{idx}.png") for idx in range(total_slides)]
+    audio_paths = [os.path.join(session_dir, f"audio_{idx}.mp3") for idx in range(total_slides)]
+    audio_metas = [None] * total_slides
+    # 每页还差几项素材 (图片、语音)
+    remaining = [2] * total_slides
+
+    async def mark_ready(idx):
+        remaining[idx] -= 1
+        if remaining[idx] == 0 and on_slide_ready:
+            await on_slide_ready(idx, img_paths[idx], audio_paths[idx], audio_metas[idx])
+
+    async def build_image(idx, slide):
+        img_path = os.path.join(session_dir, f"slide_{idx}.png")
+        build_dir = os.path.join(session_dir, f"build_{idx}")
+        cache_key = slide_cache_key(slide['title'], slide['bullets'])
+        if await asyncio.to_thread(slide_cache.fetch, cache_key, img_path):
+            if progress_callback:
+                progress_callback(f"♻️ 第 {idx + 1}/{total_slides} 页命中缓存")
+            await mark_ready(idx)
+            return
+        # 进度回调无法跨进程传递，缓存统计也只在主进程中记录
+        ok = await loop.run_in_executor(
+            pool, compile_latex_slide,
+            slide['title'], slide['bullets'], img_path, build_dir, None, False
+        )
+        if ok:
+            await asyncio.to_thread(slide_cache.put_file, cache_key, img_path)
+        if progress_callback:
+            progress_callback(f"🖼️ 第 {idx + 1}/{total_slides} 页幻灯片完成")
+        await mark_ready(idx)
+
+    async def build_audio(idx, slide):
+        async with tts_semaphore:
+            audio_metas[idx] = await generate_audio(
+                slide['narration'],
+                audio_paths[idx],
+                progress_callback=progress_callback
+            )
+        await mark_ready(idx)
+
+    async def build_audio_batch():
+        metas = await generate_audio_batch(
+            [slide['narration'] for slide in slides],
+            audio_paths,
+            progress_callback=progress_callback
+        )
+        for idx, meta in enumerate(metas):
+            audio_metas[idx] = meta
+            await mark_ready(idx)
+
+    async def build_images_batch():
+        missing = await asyncio.to_thread(_fetch_cached_slides, slides, img_paths)
+        if progress_callback and len(missing) < total_slides:
+            progress_callback(f"♻️ {total_slides - len(missing)} 页幻灯片命中缓存")
+        if missing:
+            results = await loop.run_in_executor(
+                pool, compile_latex_slides_batch,
+                [slides[idx] for idx in missing],
+                [img_paths[idx] for idx in missing],
+                os.path.join(session_dir, "build")
+            )
+            await asyncio.to_thread(_store_compiled_slides, slides, img_paths, missing, results)
+        if progress_callback:
+            progress_callback(f"🖼️ {total_slides} 页幻灯片全部完成")
+        for idx in range(total_slides):
+            await mark_ready(idx)
+
+    if progress_callback:
+        progress_callback(f"⚡ 并发生成 {total_slides} 页幻灯片与语音...")
+
+    # 先在主进程中确保导言区格式可用，避免多个工作进程重复构建
+    await asyncio.to_thread(ensure_latex_format)
+
+    if settings.SLIDE_COMPILE_MODE == "batch":
+        tasks = [asyncio.ensure_future(build_images_batch())]
+    else:
+        tasks = [asyncio.ensure_future(build_image(idx, slide)) for idx, slide in enumerate(slides)]
+    if settings.TTS_BATCH and total_slides > 1:
+        tasks.append(asyncio.ensure_future(build_audio_batch()))
+    else:
+        tasks += [asyncio.ensure_future(build_audio(idx, slide)) for idx, slide in enumerate(slides)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一任务失败时取消其余任务，避免后台继续消耗 TTS 配额
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return [(idx, img_paths[idx], audio_paths[idx], audio_metas[idx]) for idx in range(total_slides)]
 
-            # --- 步骤 2: 合成 Clip ---
+async def _prepare_assets_streaming(slide_source, session_dir, progress_callback=None, on_slide_ready=None):
+    """
+    边接收边生成素材：slide_source 为异步迭代器，每到达一页就提交该页的 LaTeX 编译与 TTS，
+    与后续页面的脚本生成重叠进行。总页数事先未知，因此只能逐页编译/合成（不使用 batch 模式）。
+
+    Returns:
+        (assets, slides) 素材列表与实际收到的幻灯片
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_latex_pool()
+    tts_semaphore = asyncio.Semaphore(settings.TTS_MAX_CONCURRENCY)
+    slides = []
+    assets = {}
+    tasks = []
+
+    async def build_slide(idx, slide):
+        img_path = os.path.join(session_dir, f"slide_{idx}.png")
+        audio_path = os.path.join(session_dir, f"audio_{idx}.mp3")
+
+        async def build_image():
+            cache_key = slide_cache_key(slide['title'], slide['bullets'])
+            if await asyncio.to_thread(slide_cache.fetch, cache_key, img_path):
+                return
+            ok = await loop.run_in_executor(
+                pool, compile_latex_slide,
+                slide['title'], slide['bullets'], img_path, os.path.join(session_dir, f"build_{idx}"), None, False
+            )
+            if ok:
+                await asyncio.to_thread(slide_cache.put_file, cache_key, img_path)
+
+        async def build_audio():
+            async with tts_semaphore:
+                return await generate_audio(slide['narration'], audio_path, progress_callback=progress_callback)
+
+        _, audio_meta = await asyncio.gather(build_image(), build_audio())
+        assets[idx] = (idx, img_path, audio_path, audio_meta)
+        if progress_callback:
+            progress_callback(f"🖼️ 第 {idx + 1} 页素材完成")
+        if on_slide_ready:
+            await on_slide_ready(idx, img_path, audio_path, audio_meta)
+
+    # 先在主进程中确保导言区格式可用，避免多个工作进程重复构建
+    await asyncio.to_thread(ensure_latex_format)
+
+    try:
+        async for slide in slide_source:
+            idx = len(slides)
+            slides.append(slide)
+            tasks.append(asyncio.ensure_future(build_slide(idx, slide)))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return [assets[idx] for idx in range(len(slides))], slides
+
+def _write_captions(assets, session_dir):
+    """
+    按页拼接 WordBoundary 生成 WebVTT 字幕，返回字幕文件路径
+    缺少逐词时间的页面整页显示讲解词
+    """
+    cues = []
+    start = 0.0
+    for _, img_path, audio_path, audio_meta in assets:
+        # 与视频片段保持一致：素材缺失的页面不占时间轴
+        if not audio_meta or not os.path.exists(img_path) or not os.path.exists(audio_path):
+            continue
+        if audio_meta["boundaries"]:
+            cues.extend(build_cues(audio_meta["boundaries"], start=start))
+        else:
+            cues.append({"start": start, "end": start + audio_meta["duration"], "text": audio_meta["text"]})
+        start += audio_meta["duration"]
+
+    captions_path = os.path.join(session_dir, "captions.vtt")
+    with open(captions_path, "w", encoding="utf-8") as f:
+        f.write(to_webvtt(cues))
+    return captions_path
+
+def _compose_video(assets, output_path, total_slides, progress_callback=None):
+    """使用 MoviePy 将图片与语音合成为最终视频（阻塞操作，应在线程中调用）"""
+    clips = []
+    try:
+        for idx, img_path, audio_path, audio_meta in assets:
+            slide_num = idx + 1
             # 检查素材是否生成成功
             if not os.path.exists(img_path) or not os.path.exists(audio_path):
                 print(f"[WARNING] 片段 {idx} 素材缺失，跳过。")
@@ -278,49 +937,41 @@ async def render_final_video(script_data, session_id, progress_callback=None):
 
             if progress_callback:
                 progress_callback(f"🎞️ 合成第 {slide_num} 页视频片段...")
-                
+
             audio_clip = AudioFileClip(audio_path)
-            # 关键：设置图片时长与音频一致，并指定 fps
-            image_clip = ImageClip(img_path).set_duration(audio_clip.duration).set_fps(24)
+            # 关键：设置图片时长与音频一致，并指定 fps（时长取自 TTS 元数据）
+            duration = audio_meta["duration"] if audio_meta else audio_clip.duration
+            image_clip = ImageClip(img_path).set_duration(duration).set_fps(24)
             # 将音频合入视频片段
             video_clip = image_clip.set_audio(audio_clip)
             clips.append(video_clip)
-            
+
             if progress_callback:
                 progress_callback(f"✅ 第 {slide_num}/{total_slides} 页完成")
 
         if not clips:
             raise Exception("没有生成任何视频片段")
 
-        # --- 步骤 3: 拼接 ---
+        # --- 拼接 ---
         if progress_callback:
             progress_callback(f"🔗 正在拼接 {len(clips)} 个视频片段...")
-            
+
         print("[INFO] 正在拼接最终视频...")
         # compose 方法通常更稳定
         final_video = concatenate_videoclips(clips, method="compose")
-        output_path = os.path.join(session_dir, "final_output.mp4")
-        
+
         if progress_callback:
             progress_callback(f"💾 正在导出最终视频文件...")
-        
+
         # 写入文件
         final_video.write_videofile(
-            output_path, 
-            fps=24, 
-            codec='libx264', 
+            output_path,
+            fps=24,
+            codec='libx264',
             audio_codec='aac', # 确保音频编码正确
             threads=4,
             logger=None # 减少控制台刷屏
         )
-        
-        print(f"[SUCCESS] 视频生成完毕: {output_path}")
-        
-        if progress_callback:
-            progress_callback(f"🎉 视频制作完成！")
-            
-        return output_path
-
     finally:
         # 资源清理，防止内存泄漏
         try:
@@ -328,4 +979,87 @@ async def render_final_video(script_data, session_id, progress_callback=None):
                 if clip.audio: clip.audio.close()
                 clip.close()
         except Exception:
-            pass
\ No newline at end of file
+            pass
+
+async def render_final_video(script_data, session_id, progress_callback=None, concurrent=None, segment_callback=None):
+    """
+    合成最终视频
+
+    Args:
+        script_data: 视频脚本 {"slides": [...]}，或逐页产出幻灯片的异步迭代器
+            （流式脚本生成时使用，素材生成与脚本生成重叠进行）
+        session_id: 会话 ID
+        progress_callback: 进度回调函数
+        concurrent: 是否并发渲染素材，默认读取 settings.RENDER_CONCURRENT
+        segment_callback: 渐进式输出回调，每发布一个 HLS 片段调用一次，参数为片段信息 dict
+    """
+    if concurrent is None:
+        concurrent = settings.RENDER_CONCURRENT
+
+    session_dir = os.path.join(settings.TEMP_DIR, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+
+    streaming = not isinstance(script_data, dict)
+    if streaming and not concurrent:
+        # 串行模式无法与脚本生成重叠，先收齐所有页面
+        script_data = {"slides": [slide async for slide in script_data]}
+        streaming = False
+
+    if streaming:
+        slides = None
+        total_slides = None  # 总页数在脚本生成结束后才能确定
+        print(f"[INFO] 开始渲染视频 (流式脚本，边生成边渲染)...")
+        if progress_callback:
+            progress_callback(f"🎬 开始视频制作流程 (边生成脚本边渲染)")
+    else:
+        slides = script_data.get("slides", [])
+        total_slides = len(slides)
+        print(f"[INFO] 开始渲染视频，共 {total_slides} 页 ({'并发' if concurrent else '串行'}模式)...")
+        if progress_callback:
+            progress_callback(f"🎬 开始视频制作流程 (共 {total_slides} 页)")
+
+    output_path = os.path.join(session_dir, "final_output.mp4")
+    encoder = None
+    if settings.VIDEO_ENCODER == "ffmpeg" and ffmpeg_available():
+        publisher = None
+        if settings.PROGRESSIVE_OUTPUT:
+            publisher = HLSPublisher(session_dir, session_id, total_slides, segment_callback)
+        # 每页素材就绪后立即编码片段，与其余页面的素材生成重叠
+        encoder = SegmentEncoder(output_path, total_slides, progress_callback, publisher)
+
+    # --- 步骤 1: 生成素材 ---
+    on_slide_ready = encoder.submit if encoder else None
+    try:
+        if streaming:
+            assets, slides = await _prepare_assets_streaming(script_data, session_dir, progress_callback, on_slide_ready)
+            total_slides = len(slides)
+            if encoder:
+                encoder.set_total(total_slides)
+        elif concurrent:
+            assets = await _prepare_assets_concurrent(slides, session_dir, progress_callback, on_slide_ready)
+        else:
+            assets = await _prepare_assets_sequential(slides, session_dir, progress_callback, on_slide_ready)
+    except BaseException:
+        if encoder:
+            encoder.cancel()
+        raise
+
+    # 由 WordBoundary 元数据生成整条视频的字幕
+    captions_path = await asyncio.to_thread(_write_captions, assets, session_dir)
+
+    # --- 步骤 2: 合成与拼接 ---
+    if encoder:
+        # 字幕作为软字幕流随拼接一起封装，无需重编码
+        await encoder.finish(subtitle_path=captions_path)
+    else:
+        # MoviePy 逐帧合成，放到线程中执行，避免阻塞事件循环
+        await asyncio.to_thread(_compose_video, assets, output_path, total_slides, progress_callback)
+        if ffmpeg_available():
+            await mux_subtitles(output_path, captions_path)
+
+    print(f"[SUCCESS] 视频生成完毕: {output_path}")
+
+    if progress_callback:
+        progress_callback(f"🎉 视频制作完成！")
+
+    return output_path
@@ -0,0 +1,71 @@
+"""
+对话流式协议对比
+用模拟的模型输出（固定片段大小与间隔）分别走 v1 / v2 协议，输出传输字节数、消息条数与末个片段耗时。
+
+用法: python scripts/bench_chat_stream.py [回复字数] [片段间隔ms]
+"""
+import os
+import sys
+import asyncio
+
+# Add parent directory to path to allow importing app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.chat_stream import ChatStreamWriter, ChatStreamLog
+
+SAMPLE_TEXT = (
+    "做桥式运动时，先仰卧屈膝，双脚与肩同宽平放地面。呼气时收紧腹部和臀部，"
+    "将骨盆缓慢抬起，使肩、髋、膝成一条直线，保持两到三秒后吸气慢慢放下。"
+    "注意不要用腰部发力顶起，也不要耸肩憋气。每组十到十五次，做三组，组间休息三十秒。"
+)
+
+async def fake_model_stream(total_chars, interval):
+    """模拟模型输出：每次产生 2-6 个字符"""
+    text = (SAMPLE_TEXT * (total_chars // len(SAMPLE_TEXT) + 1))[:total_chars]
+    pos = 0
+    sizes = [2, 4, 6, 3, 5]
+    i = 0
+    while pos < len(text):
+        await asyncio.sleep(interval)
+        size = sizes[i % len(sizes)]
+        yield text[pos:pos + size]
+        pos += size
+        i += 1
+
+async def run(protocol, total_chars, interval):
+    received = []
+
+    async def send(message):
+        received.append(message)
+
+    writer = ChatStreamWriter(send, "bench", protocol=protocol, log=ChatStreamLog())
+    async for chunk in fake_model_stream(total_chars, interval):
+        await writer.write(chunk)
+    await writer.close()
+
+    # 校验客户端能还原出完整文本
+    if protocol >= 2:
+        text = "".join(m["delta"] for m in received if m["type"] == "chat_delta")
+    else:
+        text = received[-2]["full_text"]
+    assert text == writer.full_text, "还原文本不一致"
+    return writer.stats()
+
+if __name__ == "__main__":
+    total_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    interval = (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    print(f"模拟回复 {total_chars} 字，片段间隔 {interval * 1000:.0f} ms")
+
+    results = {}
+    for protocol in (1, 2):
+        stats = asyncio.run(run(protocol, total_chars, interval))
+        results[protocol] = stats
+        print(
+            f"v{protocol}: 消息 {stats['messages']:5d} 条  传输 {stats['wire_bytes']:9d} 字节  "
+            f"末个片段耗时 {stats['time_to_last_token_ms']:9.1f} ms"
+        )
+
+    print(
+        f"传输字节减少 {1 - results[2]['wire_bytes'] / results[1]['wire_bytes']:.1%}，"
+        f"末个片段耗时减少 {1 - results[2]['time_to_last_token_ms'] / results[1]['time_to_last_token_ms']:.1%}"
+    )
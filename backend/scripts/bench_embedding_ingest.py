@@ -0,0 +1,38 @@
+"""
+文档向量化吞吐量：逐条串行 vs 分批并发
+使用 synthetic 后端（固定中位数延迟的模拟 Embedding 接口），无需 API 密钥与网络；
+默认关闭持久化向量缓存，各组配置都真实请求（模拟）接口。
+
+用法: python scripts/bench_embedding_ingest.py [片段数]
+"""
+import os
+import sys
+import time
+
+# synthetic 后端与缓存开关需在导入 app 之前设置
+os.environ.setdefault("SERVICE_BACKEND", "synthetic")
+os.environ.setdefault("EMBED_CACHE", "0")
+
+# Add parent directory to path to allow importing app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.service.custom_embedding import AiHubMixEmbeddings
+
+TEXT = "直腿抬高训练时保持膝关节伸直，缓慢抬起至约三十度，停留五秒后缓慢放下。"
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    # 每个片段内容不同，避免同批去重影响结果
+    texts = [f"{TEXT}（片段 {i}）" for i in range(count)]
+    print(f"后端: {settings.SERVICE_BACKEND}, 模拟单次请求延迟中位数 {settings.SYNTHETIC_EMBED_LATENCY_MS:.0f} ms, 片段数 {count}")
+    print(f"{'批大小':>6} {'并发':>4} {'请求数':>6} {'耗时':>8} {'片段/秒':>8}")
+
+    for batch_size, concurrency in ((1, 1), (16, 1), (64, 1), (64, 4), (16, 8)):
+        embeddings = AiHubMixEmbeddings(batch_size=batch_size, max_concurrency=concurrency)
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        assert len(vectors) == count
+        stats = embeddings.stats()
+        print(f"{batch_size:>6} {concurrency:>4} {stats['requests']:>6} {elapsed:>7.2f}s {count / elapsed:>8.1f}")
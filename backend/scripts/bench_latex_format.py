@@ -0,0 +1,57 @@
+"""
+LaTeX 幻灯片编译耗时对比
+分别在关闭/开启预编译导言区格式的情况下编译同一页幻灯片，输出单页平均耗时。
+
+用法: python scripts/bench_latex_format.py [重复次数]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Add parent directory to path to allow importing app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.service.video_producer import compile_latex_slide, ensure_latex_format
+
+SAMPLE_TITLE = "腰椎稳定性训练：死虫式"
+SAMPLE_BULLETS = [
+    "仰卧屈髋屈膝 90 度，双臂垂直向上",
+    "呼气时对侧手脚缓慢伸展，腰背始终贴地",
+    "避免憋气与骨盆前倾，动作全程保持核心收紧",
+    "每侧 8-12 次，组间休息 30 秒",
+]
+
+def bench(label, rounds):
+    work_dir = tempfile.mkdtemp(prefix="bench_latex_")
+    try:
+        # 预热一次，排除首次构建格式文件的开销
+        compile_latex_slide(SAMPLE_TITLE, SAMPLE_BULLETS, os.path.join(work_dir, "warmup.png"), os.path.join(work_dir, "warmup"))
+        timings = []
+        for i in range(rounds):
+            start = time.perf_counter()
+            compile_latex_slide(SAMPLE_TITLE, SAMPLE_BULLETS, os.path.join(work_dir, f"slide_{i}.png"), os.path.join(work_dir, f"build_{i}"))
+            timings.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    avg = sum(timings) / len(timings)
+    print(f"{label:<12} 平均 {avg * 1000:8.1f} ms  最快 {min(timings) * 1000:8.1f} ms  最慢 {max(timings) * 1000:8.1f} ms")
+    return avg
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"单页编译耗时 (xelatex + pdftoppm)，每组 {rounds} 次")
+
+    settings.LATEX_FORMAT_CACHE = False
+    before = bench("普通编译", rounds)
+
+    settings.LATEX_FORMAT_CACHE = True
+    if not ensure_latex_format():
+        print("⚠️ 导言区格式构建失败 (需要 mylatexformat 宏包)，无法对比")
+        sys.exit(1)
+    after = bench("预编译格式", rounds)
+
+    print(f"加速比: {before / after:.2f}x")
@@ -0,0 +1,98 @@
+"""
+范例视频预筛选的召回率与耗时
+用合成的范例视频库（部位 × 动作 × 变体）与模拟的视频分析文本，
+对比不同短名单大小 N 下的召回率、预筛选耗时与推荐提示词长度。
+
+用法: python scripts/bench_recommend_shortlist.py [视频库规模]
+"""
+import os
+import sys
+import time
+import random
+
+# Add parent directory to path to allow importing app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.service.catalog_shortlist import CatalogShortlist
+
+MOVEMENTS = {
+    "腰背": [("桥式运动", ["臀肌", "核心", "骨盆稳定"]), ("猫牛式", ["脊柱灵活性", "呼吸"]),
+             ("死虫式", ["核心", "抗伸展"]), ("鸟狗式", ["核心", "平衡", "多裂肌"]),
+             ("麦肯基伸展", ["腰椎", "椎间盘", "后伸"])],
+    "膝关节": [("直腿抬高", ["股四头肌", "术后早期"]), ("靠墙静蹲", ["股四头肌", "髌骨"]),
+               ("侧卧蚌式", ["臀中肌", "膝内扣"]), ("台阶训练", ["功能性", "下楼梯"]),
+               ("终末伸膝", ["股内侧肌", "伸膝"])],
+    "肩颈": [("下颌回缩", ["颈椎", "头前伸"]), ("肩胛后缩", ["菱形肌", "圆肩"]),
+             ("钟摆运动", ["肩周炎", "被动活动"]), ("弹力带外旋", ["肩袖", "冈下肌"]),
+             ("爬墙训练", ["肩关节活动度", "前屈"])],
+    "踝足": [("提踵训练", ["小腿三头肌", "跟腱"]), ("单腿平衡", ["本体感觉", "踝扭伤"]),
+             ("毛巾抓取", ["足底筋膜", "足内在肌"]), ("踝泵运动", ["血液循环", "术后"])],
+}
+VARIANTS = ["初级", "进阶", "站姿", "坐姿", "卧位", "弹力带", "徒手", "器械"]
+FILLER = (
+    "视频中患者动作节奏偏快，呼吸配合不充分，建议放慢速度并在发力时呼气。"
+    "整体姿态基本正确，但末端控制不足，回到起始位置时有代偿。"
+)
+
+def build_catalog(size, rng):
+    base = [(region, name, tags) for region, items in MOVEMENTS.items() for name, tags in items]
+    catalog = []
+    i = 0
+    while len(catalog) < size:
+        region, name, tags = base[i % len(base)]
+        variant = VARIANTS[(i // len(base)) % len(VARIANTS)]
+        serial = i // (len(base) * len(VARIANTS)) + 1
+        catalog.append({
+            "filename": f"{name}-{variant}-{serial}",
+            "category": region,
+            "tags": [region, name, variant] + rng.sample(tags, k=min(2, len(tags))),
+            "relative_path": f"{region}/{name}-{variant}-{serial}.mp4",
+            "movement": name,
+        })
+        i += 1
+    return catalog
+
+def build_queries(rng, count=60):
+    base = [(region, name, tags) for region, items in MOVEMENTS.items() for name, tags in items]
+    queries = []
+    for _ in range(count):
+        region, name, tags = rng.choice(base)
+        # 一半的分析文本不出现动作名称，只描述部位与训练目标，模拟模型换了说法
+        subject = f"{name}动作" if rng.random() < 0.5 else "一个康复动作"
+        text = (
+            f"该视频展示的是{region}康复训练中的{subject}，主要锻炼{'、'.join(tags)}。"
+            f"{FILLER}"
+        )
+        queries.append((text, name))
+    return queries
+
+def prompt_chars(videos):
+    return sum(len(f"- ID: {v['filename']}, Tags: {', '.join(v['tags'])}\n") for v in videos)
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(42)
+    catalog = build_catalog(size, rng)
+    queries = build_queries(rng)
+    shortlist = CatalogShortlist()
+
+    start = time.perf_counter()
+    shortlist.rank("预热", catalog, 1)
+    print(f"视频库 {len(catalog)} 个视频，索引构建 {(time.perf_counter() - start) * 1000:.1f} ms，查询 {len(queries)} 条")
+    print(f"全量提示词视频列表长度: {prompt_chars(catalog)} 字符")
+    print(f"{'N':>5} {'召回率':>8} {'平均耗时':>10} {'提示词长度':>10}")
+
+    for top_n in (5, 10, 20, 30, 50, 100):
+        recalls, timings, chars = [], [], []
+        for text, movement in queries:
+            relevant = {v["filename"] for v in catalog if v["movement"] == movement}
+            start = time.perf_counter()
+            picked = [catalog[idx] for idx in shortlist.rank(text, catalog, top_n)]
+            timings.append(time.perf_counter() - start)
+            hits = sum(1 for v in picked if v["filename"] in relevant)
+            recalls.append(hits / min(len(relevant), top_n))
+            chars.append(prompt_chars(picked))
+        print(
+            f"{top_n:>5} {sum(recalls) / len(recalls):>8.1%} "
+            f"{sum(timings) / len(timings) * 1000:>8.2f}ms {sum(chars) // len(chars):>10}"
+        )
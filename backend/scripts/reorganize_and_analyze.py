@@ -1,21 +1,19 @@
 import os
 import json
 import shutil
-import time
 import sys
 
 # Add parent directory to path to allow importing app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from google import genai
 from google.genai import types
 from app.config import settings
+from app.service.video_files import video_file_store
+from app.core.llm_scheduler import llm_scheduler
+from app.service.service_backend import create_genai_client
 
-# Initialize Client
-client = genai.Client(
-    api_key=settings.API_KEY,
-    http_options={"base_url": settings.GOOGLE_GENAI_BASE_URL}
-)
+# Initialize Client（遵循 SERVICE_BACKEND，可离线回放）
+client = create_genai_client()
 
 MODEL_NAME = "gemini-2.0-flash"
 BASE_DIR = settings.DATA_DIR
@@ -24,8 +22,8 @@ EXAMPLE_VIDEO_DIR = os.path.join(BASE_DIR, "范例视频")
 def analyze_video(video_path):
     print(f"Analyzing {video_path}...")
     try:
-        with open(video_path, "rb") as f:
-            video_bytes = f.read()
+        # 同一视频只上传一次，重复分析时复用远端文件句柄
+        video_part, _ = video_file_store.get_part(client, video_path)
         
         prompt = """
         你是一名专业的康复训练专家。请分析这个视频中的康复动作。
@@ -40,21 +38,19 @@ def analyze_video(video_path):
         }
         """
         
-        response = client.models.generate_content(
+        # 批处理优先级：按模型限速排队，被限流时自动退避重试
+        response = llm_scheduler.call(MODEL_NAME, lambda: client.models.generate_content(
             model=MODEL_NAME,
             contents=[
                 types.Content(
                     role="user",
                     parts=[
                         types.Part(text=prompt),
-                        types.Part(inline_data=types.Blob(
-                            mime_type="video/mp4",
-                            data=video_bytes
-                        ))
+                        video_part
                     ]
                 )
             ]
-        )
+        ), priority="batch")
         
         # Clean up response text to ensure valid JSON
         text = response.text.strip()
@@ -143,9 +139,7 @@ def process_existing_folder(folder_name):
     
     # Remove old folder
     shutil.rmtree(source_dir)
-    
-    # Sleep briefly to avoid rate limits
-    time.sleep(1)
+
 
 if __name__ == "__main__":
     print("Starting reorganization of Back Training and Lower Back Pain videos...")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 测试不访问网络：外部服务走 synthetic 后端，且不写入持久化向量缓存（须在导入 app 之前设置）
+os.environ.setdefault("SERVICE_BACKEND", "synthetic")
+os.environ.setdefault("EMBED_CACHE", "0")
+
+# 测试直接导入 app 包（与 scripts/ 下脚本的做法一致）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import pytest
+from app.service.audio_timing import build_cues, mp3_duration, mp3_frames, to_webvtt
+from app.service.tts_provider import _SILENT_FRAME, _SILENT_FRAME_SECONDS
+
+def _id3(payload_size, footer=False):
+    # ID3v2 标签长度为 syncsafe 整数（每字节 7 位）
+    size = bytes([(payload_size >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    return b"ID3" + bytes([4, 0, 0x10 if footer else 0]) + size + bytes(payload_size + (10 if footer else 0))
+
+def test_mp3_frames_parses_mpeg2_layer3():
+    audio = _SILENT_FRAME * 5
+    frames = mp3_frames(audio)
+    assert [(offset, length) for offset, length, _ in frames] == [(i * 144, 144) for i in range(5)]
+    assert mp3_duration(audio) == pytest.approx(5 * _SILENT_FRAME_SECONDS)
+
+@pytest.mark.parametrize("footer", [False, True])
+def test_mp3_frames_skips_id3_tag(footer):
+    tag = _id3(300, footer)
+    frames = mp3_frames(tag + _SILENT_FRAME * 3)
+    assert [offset for offset, _, _ in frames] == [len(tag) + i * 144 for i in range(3)]
+
+def test_mp3_frames_resyncs_after_garbage_and_drops_truncated_tail():
+    audio = b"\x00garbage" + _SILENT_FRAME * 2 + _SILENT_FRAME[:50]
+    frames = mp3_frames(audio)
+    assert [offset for offset, _, _ in frames] == [8, 8 + 144]
+
+def test_build_cues_splits_on_pause_and_length():
+    boundaries = [
+        {"offset": 0.0, "duration": 0.2, "text": "hello"},
+        {"offset": 0.25, "duration": 0.2, "text": "world"},
+        # 停顿超过 max_gap，另起一条
+        {"offset": 1.5, "duration": 0.3, "text": "你好"},
+        {"offset": 1.8, "duration": 0.3, "text": "世界"},
+    ]
+    cues = build_cues(boundaries, start=10.0)
+    assert [cue["text"] for cue in cues] == ["hello world", "你好世界"]
+    assert cues[0]["start"] == pytest.approx(10.0)
+    assert cues[0]["end"] == pytest.approx(10.45)
+    assert cues[1]["start"] == pytest.approx(11.5)
+
+    long_words = [{"offset": i * 0.1, "duration": 0.1, "text": "字" * 10} for i in range(3)]
+    assert len(build_cues(long_words, max_chars=18)) == 3
+
+def test_to_webvtt_formats_timestamps():
+    vtt = to_webvtt([{"start": 3661.5, "end": 3662.0004, "text": "字幕"}])
+    assert vtt == "WEBVTT\n\n01:01:01.500 --> 01:01:02.000\n字幕\n"
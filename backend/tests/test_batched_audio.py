@@ -0,0 +1,60 @@
+import pytest
+from app.service.audio_timing import mp3_duration, mp3_frames
+from app.service.tts_provider import _SILENT_FRAME, _SILENT_FRAME_SECONDS
+from app.service.video_producer import _split_batched_audio
+
+NARRATIONS = ["Hello, world!", "第二页。"]
+BOUNDARIES = [
+    {"offset": 0.0, "duration": 0.2, "text": "Hello"},
+    {"offset": 0.25, "duration": 0.25, "text": "world"},
+    {"offset": 0.8, "duration": 0.2, "text": "第二"},
+    {"offset": 1.0, "duration": 0.2, "text": "页"},
+]
+
+def _audio(seconds):
+    return _SILENT_FRAME * int(seconds / _SILENT_FRAME_SECONDS)
+
+def test_split_cuts_on_frame_boundaries_between_slides():
+    audio = _audio(1.5)
+    pieces = _split_batched_audio(audio, BOUNDARIES, NARRATIONS)
+    assert pieces is not None and len(pieces) == 2
+
+    # 切分后每段都是完整的帧序列，拼回去与原音频一致
+    assert b"".join(piece for piece, _ in pieces) == audio
+    for piece, _ in pieces:
+        assert len(piece) % len(_SILENT_FRAME) == 0
+        assert mp3_frames(piece)[0][0] == 0
+
+    first, second = pieces
+    assert [w["text"] for w in first[1]] == ["Hello", "world"]
+    assert [w["text"] for w in second[1]] == ["第二", "页"]
+
+    # 切点落在两页之间的停顿内（中点 0.65 秒之后的第一个帧边界）
+    cut = mp3_duration(first[0])
+    assert 0.65 <= cut < 0.65 + _SILENT_FRAME_SECONDS + 1e-9
+    # 第二页的时间轴平移到该段音频起点
+    assert second[1][0]["offset"] == pytest.approx(0.8 - cut)
+    assert second[1][1]["offset"] == pytest.approx(1.0 - cut)
+    assert first[1][0]["offset"] == pytest.approx(0.0)
+
+def test_split_ignores_punctuation_only_boundaries():
+    boundaries = BOUNDARIES[:2] + [{"offset": 0.5, "duration": 0.0, "text": "!"}] + BOUNDARIES[2:]
+    pieces = _split_batched_audio(_audio(1.5), boundaries, NARRATIONS)
+    assert pieces is not None
+    assert [w["text"] for w in pieces[0][1]] == ["Hello", "world"]
+
+@pytest.mark.parametrize("boundaries", [
+    # 词与讲解词对不上
+    [dict(BOUNDARIES[0], text="Goodbye")] + BOUNDARIES[1:],
+    # 最后一页没有读完
+    BOUNDARIES[:3],
+    # 第二页没有任何词
+    BOUNDARIES[:2],
+])
+def test_split_returns_none_when_words_do_not_align(boundaries):
+    assert _split_batched_audio(_audio(1.5), boundaries, NARRATIONS) is None
+
+def test_split_returns_none_when_audio_ends_before_cut():
+    # 音频在切点之前就结束，无法切出第二页
+    assert _split_batched_audio(_audio(0.5), BOUNDARIES, NARRATIONS) is None
+    assert _split_batched_audio(b"", BOUNDARIES, NARRATIONS) is None
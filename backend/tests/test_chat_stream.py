@@ -0,0 +1,143 @@
+import asyncio
+from app.api.chat_stream import ChatStreamLog, ChatStreamWriter
+
+def _writer(sent, log, protocol=2, flush_interval=0.05, flush_chars=10):
+    async def send(message):
+        sent.append(message)
+    return ChatStreamWriter(send, "client", protocol=protocol,
+                            flush_interval=flush_interval, flush_chars=flush_chars, log=log)
+
+def test_first_chunk_sent_immediately_then_flush_by_size():
+    sent, log = [], ChatStreamLog()
+
+    async def main():
+        writer = _writer(sent, log, flush_interval=10)
+        # 空闲状态下第一个片段立即发送
+        await writer.write("你好")
+        assert [m["delta"] for m in sent] == ["你好"]
+        # 之后的片段先缓冲，累计达到 flush_chars 立即发送
+        await writer.write("abcd")
+        await writer.write("efg")
+        assert len(sent) == 1
+        await writer.write("hij")
+        assert [m["delta"] for m in sent] == ["你好", "abcdefghij"]
+        await writer.close()
+
+    asyncio.run(main())
+    assert [m["seq"] for m in sent] == [1, 2, 3]
+
+def test_flush_by_interval_timer():
+    sent, log = [], ChatStreamLog()
+
+    async def main():
+        writer = _writer(sent, log, flush_interval=0.05, flush_chars=1000)
+        await writer.write("a")
+        await writer.write("b")
+        await writer.write("c")
+        assert [m["delta"] for m in sent] == ["a"]
+        # 定时器到期后发送缓冲内容，无需新的片段触发
+        await asyncio.sleep(0.15)
+        assert [m["delta"] for m in sent] == ["a", "bc"]
+        assert writer._timer is None
+        await writer.close()
+
+    asyncio.run(main())
+
+def test_close_flushes_tail_before_final_frame():
+    sent, log = [], ChatStreamLog()
+
+    async def main():
+        writer = _writer(sent, log, flush_interval=10, flush_chars=1000)
+        await writer.write("前")
+        await writer.write("尾部")
+        await writer.close({"usage": {"total_tokens": 3}})
+        # 定时器已取消，不会在完成消息之后再补发
+        await asyncio.sleep(0)
+        return writer
+
+    writer = asyncio.run(main())
+    assert [m["type"] for m in sent] == ["chat_delta", "chat_delta", "chat_response"]
+    assert sent[1]["delta"] == "尾部"
+    final = sent[-1]
+    assert final["message"] == "前尾部" and final["is_complete"]
+    assert final["usage"] == {"total_tokens": 3}
+    assert [m["seq"] for m in sent] == [1, 2, 3]
+    assert all(m["stream_id"] == writer.stream_id for m in sent)
+    assert writer.stats()["messages"] == 3
+
+def test_close_waits_for_inflight_timer_flush():
+    sent, log = [], ChatStreamLog()
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def slow_send(message):
+            if message.get("delta") == "bc":
+                await gate.wait()
+            sent.append(message)
+
+        writer = ChatStreamWriter(slow_send, "client", protocol=2,
+                                  flush_interval=0.01, flush_chars=1000, log=log)
+        await writer.write("a")
+        await writer.write("b")
+        await writer.write("c")
+        # 定时器已开始发送 "bc" 并持有锁
+        await asyncio.sleep(0.05)
+        closing = asyncio.ensure_future(writer.close())
+        await asyncio.sleep(0.01)
+        assert not closing.done()
+        gate.set()
+        await closing
+
+    asyncio.run(main())
+    assert [m.get("delta") for m in sent] == ["a", "bc", None]
+    assert [m["seq"] for m in sent] == [1, 2, 3]
+
+def test_frames_after_returns_exactly_missed_frames():
+    sent, log = [], ChatStreamLog()
+
+    async def main():
+        writer = _writer(sent, log, flush_interval=10, flush_chars=1)
+        for text in ["一", "二", "三"]:
+            await writer.write(text)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(main())
+    assert log.frames_after("client", writer.stream_id, 0) == sent
+    assert log.frames_after("client", writer.stream_id, 2) == sent[2:]
+    assert log.frames_after("client", writer.stream_id, 4) == []
+    assert log.frames_after("client", "other-stream", 0) is None
+    assert log.frames_after("unknown", writer.stream_id, 0) is None
+
+    # 新的回复覆盖旧记录，旧 stream_id 无法续传
+    newer = _writer([], log)
+    assert log.frames_after("client", writer.stream_id, 0) is None
+    assert log.frames_after("client", newer.stream_id, 0) == []
+
+def test_log_keeps_only_recent_clients():
+    log = ChatStreamLog(max_clients=2)
+    for client in ["a", "b", "c"]:
+        log.start(client, f"s-{client}")
+    assert log.frames_after("a", "s-a", 0) is None
+    assert log.frames_after("c", "s-c", 0) == []
+
+def test_v1_sends_full_text_without_seq(monkeypatch):
+    sent = []
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+
+    async def main():
+        writer = _writer(sent, ChatStreamLog(), protocol=1)
+        await writer.write("你")
+        await writer.write("好")
+        await writer.close()
+
+    asyncio.run(main())
+    assert sent == [
+        {"type": "chat_stream", "chunk": "你", "full_text": "你"},
+        {"type": "chat_stream", "chunk": "好", "full_text": "你好"},
+        {"type": "chat_response", "message": "你好", "is_complete": True},
+    ]
+
+async def _no_sleep(_):
+    return None
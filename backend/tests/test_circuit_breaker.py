@@ -0,0 +1,99 @@
+import asyncio
+import time
+from app.config import settings
+from app.core.circuit_breaker import CircuitBreaker
+from app.service.tts_provider import TTSProvider, TTSRouter, LocalTTSProvider
+
+def _breaker(**kwargs):
+    options = dict(failure_threshold=0.5, window=4, min_calls=2, cooldown=0.05)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+def test_breaker_trips_on_failure_rate_and_recovers():
+    breaker = _breaker()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert not breaker.is_open()
+    # half_open 只放行一次探测
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_failed_probe_reopens_breaker():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+
+def test_is_open_does_not_consume_probe():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert not breaker.is_open()
+    assert breaker.allow()
+
+class _FailingProvider(TTSProvider):
+    name = "failing"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def synthesize(self, text, voice, rate):
+        self.calls += 1
+        raise ConnectionError("down")
+
+class _OkProvider(TTSProvider):
+    name = "ok"
+
+    async def synthesize(self, text, voice, rate):
+        return b"mp3", []
+
+def test_router_skips_backoff_once_breaker_opens(monkeypatch):
+    monkeypatch.setattr(settings, "TTS_BREAKER_MIN_CALLS", 1)
+    monkeypatch.setattr(settings, "TTS_BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(settings, "TTS_RETRY_BACKOFF", 5.0)
+    failing = _FailingProvider()
+    router = TTSRouter([failing, _OkProvider()])
+
+    start = time.perf_counter()
+    audio, _, provider = asyncio.run(router.synthesize("你好", "voice", "+0%"))
+    # 第一次失败即熔断：不再退避等待，直接切换到下一个服务
+    assert time.perf_counter() - start < 1.0
+    assert failing.calls == 1
+    assert audio == b"mp3" and provider.name == "ok"
+
+def test_local_tts_passes_text_on_stdin(monkeypatch):
+    commands = []
+
+    class _Process:
+        returncode = 0
+
+        async def communicate(self, stdin=None):
+            commands[-1].append(stdin)
+            return b"", b""
+
+    async def fake_exec(*cmd, **kwargs):
+        commands.append([list(cmd)])
+        if cmd[0] == "ffmpeg":
+            with open(cmd[cmd.index("48k") + 1], "wb") as f:
+                f.write(b"mp3")
+        return _Process()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", fake_exec)
+    audio, _ = asyncio.run(LocalTTSProvider().synthesize("-5 度也可以练习", "voice", "+0%"))
+    espeak_cmd, espeak_stdin = commands[0]
+    assert audio == b"mp3"
+    assert "--stdin" in espeak_cmd
+    assert "-5 度也可以练习" not in espeak_cmd
+    assert espeak_stdin == "-5 度也可以练习".encode("utf-8")
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+from app.config import settings
+from app.core.llm_scheduler import SchedulerQueueFull
+from app.service.context_cache import ContextCache, is_cache_unsupported
+from app.service.conversation_store import Conversation
+
+SYSTEM = "你是一名康复训练指导教练。"
+
+class APIError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+class _Caches:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.created = []
+
+    async def create(self, model, config):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.created.append(config)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+def _client(caches):
+    return SimpleNamespace(aio=SimpleNamespace(caches=caches))
+
+def _conversation(turns, chars=200):
+    conversation = Conversation("c")
+    for idx in range(turns):
+        conversation.add("user" if idx % 2 == 0 else "model", "膝" * chars)
+    return conversation
+
+def _resolve(cache, client, conversation, model="context-cache-test"):
+    return asyncio.run(cache.resolve(client, model, SYSTEM, conversation))
+
+def test_short_prefix_is_sent_inline(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_MIN_TOKENS", 1024)
+    caches = _Caches()
+    config, contents = _resolve(ContextCache(), _client(caches), _conversation(2))
+    assert config == {"system_instruction": SYSTEM}
+    assert len(contents) == 2
+    assert caches.created == []
+
+def test_history_is_cached_and_anchor_reused(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_MIN_TOKENS", 1024)
+    cache = ContextCache()
+    caches = _Caches()
+    conversation = _conversation(6)
+
+    config, contents = _resolve(cache, _client(caches), conversation)
+    assert config == {"cached_content": "cachedContents/1"}
+    # 系统指令与 6 轮历史都在缓存里，请求中不再携带
+    assert contents == []
+    assert len(caches.created[0].contents) == 6
+
+    # 新增的轮次不足最小缓存长度时沿用同一缓存，只携带新增部分
+    conversation.add("user", "今天膝盖还有点疼")
+    conversation.add("model", "建议先减少训练量")
+    config, contents = _resolve(cache, _client(caches), conversation)
+    assert config == {"cached_content": "cachedContents/1"}
+    assert [item.parts[0].text for item in contents] == ["今天膝盖还有点疼", "建议先减少训练量"]
+    assert len(caches.created) == 1
+    assert cache.stats()["hits"] == 1
+
+    # 未缓存部分再次超过最小长度时扩展锚点
+    for _ in range(6):
+        conversation.add("user", "腿" * 200)
+    config, contents = _resolve(cache, _client(caches), conversation)
+    assert config == {"cached_content": "cachedContents/2"}
+    assert contents == []
+
+def test_transient_failure_cools_down_without_disabling(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_MIN_TOKENS", 100)
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_RETRY", 300)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LLM_BACKOFF_BASE", 0.0)
+    cache = ContextCache()
+    caches = _Caches([APIError(503, "UNAVAILABLE")])
+    conversation = _conversation(2)
+
+    config, contents = _resolve(cache, _client(caches), conversation)
+    assert "system_instruction" in config and len(contents) == 2
+    assert cache.stats()["unsupported_models"] == []
+    # 冷却期内不再尝试创建
+    _resolve(cache, _client(caches), conversation)
+    assert cache.stats()["misses"] == 1
+
+    monkeypatch.setattr(cache, "_retry_after", {})
+    config, _ = _resolve(cache, _client(caches), conversation)
+    assert config == {"cached_content": "cachedContents/1"}
+
+def test_unsupported_model_is_remembered(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_MIN_TOKENS", 100)
+    cache = ContextCache()
+    caches = _Caches([APIError(404, "NOT_FOUND: cachedContents is not supported")])
+    _resolve(cache, _client(caches), _conversation(2))
+    assert cache.stats()["unsupported_models"] == ["context-cache-test"]
+    _resolve(cache, _client(caches), _conversation(2))
+    assert cache.stats()["misses"] == 1
+
+def test_error_classification():
+    assert is_cache_unsupported(APIError(400, "INVALID_ARGUMENT: model does not support caching"))
+    assert is_cache_unsupported(APIError(501, "UNIMPLEMENTED"))
+    assert not is_cache_unsupported(APIError(429, "RESOURCE_EXHAUSTED"))
+    assert not is_cache_unsupported(APIError(503, "UNAVAILABLE"))
+    assert not is_cache_unsupported(APIError(400, "Cached content is too small. min_total_token_count=1024"))
+    assert not is_cache_unsupported(SchedulerQueueFull("LLM 调用队列已满"))
+    assert not is_cache_unsupported(TimeoutError())
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+from app.config import settings
+from app.service.custom_embedding import AiHubMixEmbeddings
+
+class _FakeEmbeddingsAPI:
+    """按文本长度生成向量；前 failures 次请求抛出异常"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.requests = []
+
+    def create(self, input, model):
+        texts = input if isinstance(input, list) else [input]
+        self.requests.append(texts)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("temporary failure")
+        data = [SimpleNamespace(index=idx, embedding=[float(len(text)), float(idx)]) for idx, text in enumerate(texts)]
+        # 乱序返回，验证按 index 还原顺序
+        return SimpleNamespace(data=list(reversed(data)))
+
+def _embeddings(api, **kwargs):
+    embeddings = AiHubMixEmbeddings(**kwargs)
+    embeddings.client = SimpleNamespace(embeddings=api)
+    embeddings.cache = None
+    return embeddings
+
+def test_openai_client_has_no_builtin_retries(monkeypatch):
+    monkeypatch.setattr(settings, "SERVICE_BACKEND", "live")
+    monkeypatch.setattr(settings, "API_KEY", "test-key")
+    assert AiHubMixEmbeddings().client.max_retries == 0
+
+def test_batches_keep_input_order():
+    api = _FakeEmbeddingsAPI()
+    embeddings = _embeddings(api, batch_size=3, max_concurrency=4)
+    texts = ["x" * n for n in range(1, 11)]
+    vectors = embeddings.embed_documents(texts)
+    assert [vector[0] for vector in vectors] == [float(n) for n in range(1, 11)]
+    assert sorted(len(batch) for batch in api.requests) == [1, 3, 3, 3]
+
+def test_duplicates_requested_once():
+    api = _FakeEmbeddingsAPI()
+    embeddings = _embeddings(api, batch_size=10)
+    vectors = embeddings.embed_documents(["a", "bb", "a"])
+    assert api.requests == [["a", "bb"]]
+    assert vectors[0] == vectors[2]
+
+def test_batch_retried_once_per_attempt(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "EMBED_RETRY_BACKOFF", 0.0)
+    api = _FakeEmbeddingsAPI(failures=2)
+    embeddings = _embeddings(api, batch_size=10)
+    assert len(embeddings.embed_documents(["a", "b"])) == 2
+    assert len(api.requests) == 3
+    assert embeddings.stats()["retries"] == 2
+
+def test_retries_exhausted_raise(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "EMBED_RETRY_BACKOFF", 0.0)
+    api = _FakeEmbeddingsAPI(failures=5)
+    embeddings = _embeddings(api)
+    with pytest.raises(ConnectionError):
+        embeddings.embed_query("查询")
+    assert len(api.requests) == 2
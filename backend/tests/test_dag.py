@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from app.core.dag import DAGExecutor
+
+def test_independent_stages_run_concurrently_and_receive_dep_results():
+    dag = DAGExecutor()
+    running = []
+    peak = []
+
+    def stage(value, delay):
+        async def fn(*args):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(delay)
+            running.pop()
+            return value + sum(args)
+        return fn
+
+    dag.add("a", stage(1, 0.05))
+    dag.add("b", stage(10, 0.01))
+    dag.add("c", stage(100, 0.0), deps=["a", "b"])
+
+    results = asyncio.run(dag.run())
+    assert results == {"a": 1, "b": 10, "c": 111}
+    # a 与 b 互不依赖，应同时运行
+    assert max(peak) == 2
+    # c 必须在两个依赖都结束后才启动
+    assert dag.timings["c"]["start"] >= dag.timings["a"]["end"]
+    assert dag.timings["c"]["start"] >= dag.timings["b"]["end"]
+
+def test_critical_path_follows_latest_dependency():
+    dag = DAGExecutor()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+
+    async def fast():
+        await asyncio.sleep(0.0)
+
+    async def join(*_):
+        await asyncio.sleep(0.0)
+
+    dag.add("slow", slow)
+    dag.add("fast", fast)
+    dag.add("join", join, deps=["fast", "slow"])
+    asyncio.run(dag.run())
+
+    assert dag.critical_path() == ["slow", "join"]
+    report = dag.report()
+    assert report["critical_path"] == ["slow", "join"]
+    assert set(report["stages"]) == {"slow", "fast", "join"}
+    assert report["total_ms"] >= report["stages"]["slow"]["duration_ms"]
+
+def test_failure_cancels_other_stages():
+    dag = DAGExecutor()
+    cancelled = []
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def long():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("long")
+            raise
+
+    async def never(_):
+        cancelled.append("never-ran")
+
+    dag.add("boom", boom)
+    dag.add("long", long)
+    dag.add("after", never, deps=["boom"])
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(dag.run())
+    assert cancelled == ["long"]
+
+def test_add_rejects_duplicates_and_undefined_deps():
+    dag = DAGExecutor()
+
+    async def fn(*_):
+        return None
+
+    dag.add("a", fn)
+    with pytest.raises(ValueError):
+        dag.add("a", fn)
+    with pytest.raises(ValueError):
+        dag.add("b", fn, deps=["missing"])
+
+def test_empty_report():
+    dag = DAGExecutor()
+    assert asyncio.run(dag.run()) == {}
+    assert dag.critical_path() == []
+    assert dag.report() == {"stages": {}, "critical_path": [], "total_ms": 0.0}
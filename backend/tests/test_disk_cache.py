@@ -0,0 +1,71 @@
+import os
+import hashlib
+from app.core.disk_cache import DiskCache, hash_file
+
+def _age(cache, key, mtime):
+    os.utime(cache._path(key), (mtime, mtime))
+
+def test_put_get_and_fetch(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1024)
+    assert cache.get("abcd.png") is None
+
+    cache.put_bytes("abcd.png", b"slide")
+    path = cache.get("abcd.png")
+    # 按键前两位分目录
+    assert path == str(tmp_path / "cache" / "ab" / "abcd.png")
+
+    src = tmp_path / "src.mp3"
+    src.write_bytes(b"audio")
+    cache.put_file("ef01.mp3", str(src))
+    dest = tmp_path / "dest.mp3"
+    assert cache.fetch("ef01.mp3", str(dest))
+    assert dest.read_bytes() == b"audio"
+    assert not cache.fetch("missing.mp3", str(tmp_path / "none"))
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    assert stats["bytes"] == len(b"slide") + len(b"audio")
+    # 不计入统计的读取
+    cache.get("abcd.png", track=False)
+    assert cache.stats()["hits"] == 2
+
+def test_overwrite_updates_size(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1024)
+    cache.put_bytes("k1", b"x" * 100)
+    cache.put_bytes("k1", b"x" * 10)
+    assert cache.stats()["bytes"] == 10
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.put_bytes("aa1", b"1" * 100)
+    cache.put_bytes("bb2", b"2" * 100)
+    _age(cache, "aa1", 1000)
+    _age(cache, "bb2", 2000)
+
+    # 命中刷新 mtime，aa1 变为最近使用
+    assert cache.get("aa1") is not None
+    cache.put_bytes("cc3", b"3" * 100)
+
+    assert cache.get("bb2", track=False) is None
+    assert cache.get("aa1", track=False) is not None
+    assert cache.get("cc3", track=False) is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 200
+
+def test_scan_ignores_temp_files_and_clear(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1024)
+    cache.put_bytes("aa1", b"1" * 10)
+    (tmp_path / "cache" / "aa" / "aa1.tmp-deadbeef").write_bytes(b"partial" * 10)
+    # 新实例首次统计时扫描目录
+    assert DiskCache(str(tmp_path / "cache"), max_bytes=1024).stats()["bytes"] == 10
+
+    cache.clear()
+    assert cache.get("aa1") is None
+    assert cache.stats()["bytes"] == 0
+
+def test_hash_file_streams_in_chunks(tmp_path):
+    path = tmp_path / "video.mp4"
+    data = os.urandom(4096)
+    path.write_bytes(data)
+    assert hash_file(str(path), chunk_size=1000) == hashlib.sha256(data).hexdigest()
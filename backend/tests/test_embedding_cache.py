@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from app.core.embedding_cache import EmbeddingCache
+from app.service.custom_embedding import AiHubMixEmbeddings
+
+VECTOR = [0.1234567, -0.7654321, 0.3333333]
+
+def _cache(tmp_path, **kwargs):
+    return EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), **kwargs)
+
+def test_roundtrip_and_whitespace_normalization(tmp_path):
+    cache = _cache(tmp_path, dtype="float32")
+    cache.put_many("m", ["直腿 抬高"], [VECTOR])
+    hit, miss = cache.get_many("m", ["直腿\n抬高", "其他"])
+    assert hit == pytest.approx(VECTOR, rel=1e-6)
+    assert miss is None
+    # 模型不同不共享缓存
+    assert cache.get_many("other", ["直腿 抬高"]) == [None]
+
+def test_float16_vectors_are_identical_on_every_path(tmp_path):
+    cache = _cache(tmp_path, dtype="float16", lru_size=1)
+    rounded = np.asarray(VECTOR, dtype="float16").astype(np.float32).tolist()
+
+    # 未命中时写入：返回值与内存 LRU 都是按存储精度还原后的向量
+    assert cache.put_query("m", "q1", VECTOR) == rounded
+    assert cache.get_query("m", "q1") == rounded
+    # 挤出 LRU 后从磁盘读取，结果不变
+    cache.put_query("m", "q2", [0.0, 0.0, 0.0])
+    assert cache.get_query("m", "q1") == rounded
+    assert cache.get_many("m", ["q1"]) == [rounded]
+
+def test_stats_count_memory_and_disk_hits(tmp_path):
+    cache = _cache(tmp_path, lru_size=4)
+    cache.put_query("m", "q", VECTOR)
+    cache.get_query("m", "q")
+    cache.get_many("m", ["q", "missing"])
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["memory_hits"] == 1 and stats["disk_hits"] == 1 and stats["misses"] == 1
+
+def test_rejects_unknown_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        _cache(tmp_path, dtype="int8")
+
+def test_documents_fresh_and_cached_vectors_match(tmp_path):
+    class _API:
+        def create(self, input, model):
+            return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=VECTOR) for i in range(len(input))])
+
+    embeddings = AiHubMixEmbeddings()
+    embeddings.client = SimpleNamespace(embeddings=_API())
+    embeddings.cache = _cache(tmp_path, dtype="float16")
+    fresh = embeddings.embed_documents(["片段"])
+    cached = embeddings.embed_documents(["片段"])
+    assert fresh == cached
+    assert embeddings.embed_query("片段") == fresh[0]
@@ -0,0 +1,50 @@
+import os
+import subprocess
+from app.config import settings
+from app.service import video_producer
+
+def _missing_xelatex(calls):
+    def run(*args, **kwargs):
+        calls.append(args)
+        raise FileNotFoundError("xelatex")
+    return run
+
+def test_format_build_failure_is_not_persisted(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(settings, "LATEX_FORMAT_CACHE", True)
+    monkeypatch.setattr(settings, "LATEX_FORMAT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LATEX_FORMAT_RETRY", 600)
+    monkeypatch.setattr(video_producer, "_format_dir_cache", {})
+    monkeypatch.setattr(video_producer, "_format_failed_at", {})
+    monkeypatch.setattr(subprocess, "run", _missing_xelatex(calls))
+
+    assert video_producer.ensure_latex_format() is None
+    # 失败不留下任何标记或临时目录
+    assert os.listdir(tmp_path) == []
+    # 重试间隔内直接回退，不再启动 xelatex
+    assert video_producer.ensure_latex_format() is None
+    assert len(calls) == 1
+
+    # 间隔过后（或新进程中）重新尝试构建
+    monkeypatch.setattr(settings, "LATEX_FORMAT_RETRY", 0)
+    assert video_producer.ensure_latex_format() is None
+    assert len(calls) == 2
+
+def test_legacy_failed_marker_is_cleared(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(settings, "LATEX_FORMAT_CACHE", True)
+    monkeypatch.setattr(settings, "LATEX_FORMAT_DIR", str(tmp_path))
+    monkeypatch.setattr(video_producer, "_format_dir_cache", {})
+    monkeypatch.setattr(video_producer, "_format_failed_at", {})
+    monkeypatch.setattr(subprocess, "run", _missing_xelatex(calls))
+
+    video_producer.ensure_latex_format()
+    key = next(iter(video_producer._format_failed_at))
+    marker_dir = tmp_path / key
+    marker_dir.mkdir()
+    (marker_dir / "FAILED").write_text("mylatexformat dump failed\n")
+    video_producer._format_failed_at.clear()
+
+    video_producer.ensure_latex_format()
+    assert len(calls) == 2
+    assert not marker_dir.exists()
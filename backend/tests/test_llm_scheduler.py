@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.config import settings
+from app.core.llm_scheduler import LLMScheduler, SchedulerQueueFull, is_rate_limited
+
+QUEUE_LIMITS = {"chat": 10, "video": 10, "batch": 10}
+
+class RateLimited(Exception):
+    code = 429
+
+def _scheduler(rpm=60, burst=1, **kwargs):
+    return LLMScheduler(rpm=rpm, burst=burst, model_rpm={}, queue_limits=kwargs.get("queue_limits", QUEUE_LIMITS))
+
+def test_is_rate_limited():
+    assert is_rate_limited(RateLimited())
+    assert is_rate_limited(Exception("503 UNAVAILABLE"))
+    assert not is_rate_limited(ValueError("bad request"))
+
+def test_burst_then_wait_for_refill():
+    scheduler = _scheduler(rpm=600, burst=2)
+    start = time.perf_counter()
+    for _ in range(3):
+        scheduler.acquire("m")
+    # 前两个令牌立即发放，第三个等待约 0.1 秒 (600 次/分钟)
+    assert 0.05 < time.perf_counter() - start < 1.0
+
+def test_cooldown_does_not_accumulate_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKOFF_BASE", 0.2)
+    monkeypatch.setattr(settings, "LLM_BACKOFF_MAX", 0.2)
+    scheduler = _scheduler(rpm=6000, burst=5)
+    scheduler.acquire("m")
+    scheduler.record_result("m", RateLimited())
+
+    model = scheduler.stats()["models"]["m"]
+    assert model["tokens"] == 0
+    assert model["cooldown_s"] > 0
+    # 退避期间反复读取统计不会补充令牌
+    for _ in range(5):
+        time.sleep(0.03)
+        assert scheduler.stats()["models"]["m"]["tokens"] == 0
+
+    time.sleep(0.1)
+    # 退避结束后只按结束以来的时间补充（速率已减半），不会一次补满
+    tokens = scheduler.stats()["models"]["m"]["tokens"]
+    assert 0 < tokens < 5
+
+def test_cooldown_blocks_acquire(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKOFF_BASE", 0.2)
+    monkeypatch.setattr(settings, "LLM_BACKOFF_MAX", 0.2)
+    scheduler = _scheduler(rpm=6000, burst=5)
+    scheduler.record_result("m", RateLimited())
+    start = time.perf_counter()
+    scheduler.acquire("m")
+    assert time.perf_counter() - start >= 0.15
+
+def test_rate_recovers_after_success(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKOFF_BASE", 0.0)
+    scheduler = _scheduler(rpm=60)
+    scheduler.record_result("m", RateLimited())
+    assert scheduler.stats()["models"]["m"]["effective_rpm"] == 30
+    scheduler.record_result("m")
+    assert scheduler.stats()["models"]["m"]["effective_rpm"] == 33
+
+def test_priority_order():
+    scheduler = _scheduler(rpm=1200, burst=1)
+    scheduler.acquire("m")
+    order = []
+
+    async def waiter(priority):
+        await scheduler.aacquire("m", priority)
+        order.append(priority)
+
+    async def main():
+        tasks = [asyncio.create_task(waiter(priority)) for priority in ("batch", "video", "chat")]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["chat", "video", "batch"]
+
+def test_queue_limit_rejects():
+    scheduler = _scheduler(rpm=1, burst=1, queue_limits={"chat": 1, "video": 1, "batch": 0})
+    with pytest.raises(SchedulerQueueFull):
+        scheduler.acquire("m", "batch")
+    assert scheduler.stats()["rejected"]["batch"] == 1
+
+def test_zero_rpm_means_unlimited():
+    scheduler = _scheduler(rpm=0, burst=1)
+    start = time.perf_counter()
+    for _ in range(20):
+        scheduler.acquire("m")
+    assert time.perf_counter() - start < 0.5
+    model = scheduler.stats()["models"]["m"]
+    assert model["tokens"] is None and model["effective_rpm"] is None
+
+def test_call_retries_rate_limited(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKOFF_BASE", 0.01)
+    scheduler = _scheduler(rpm=6000, burst=5)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+
+    assert scheduler.call("m", fn, max_retries=3) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.stats()["models"]["m"]["throttled"] == 2
+
+def test_call_does_not_retry_other_errors():
+    scheduler = _scheduler()
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.call("m", fn, max_retries=3)
+    assert len(attempts) == 1
+
+def test_threads_share_bucket():
+    scheduler = _scheduler(rpm=1200, burst=1)
+    done = []
+    threads = [threading.Thread(target=lambda: done.append(scheduler.acquire("m"))) for _ in range(4)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(done) == 4
+    # 1 个立即发放，其余 3 个各间隔 0.05 秒
+    assert time.perf_counter() - start >= 0.1
@@ -0,0 +1,66 @@
+import pytest
+from langchain_core.documents import Document
+from app.config import settings
+from app.core.rag_engine import RAGEngine
+
+@pytest.fixture
+def kb_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_DB_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(settings, "KB_VERSION_FILE", str(tmp_path / "kb_version.txt"))
+    monkeypatch.setattr(settings, "PDF_PATH", str(tmp_path / "missing.pdf"))
+
+def _add(engine, texts):
+    """模拟 add_pdf 的入库步骤（不经过 PDF 解析）"""
+    engine.vector_store.add_documents([Document(page_content=text) for text in texts])
+    engine.bump_kb_version()
+
+def test_empty_knowledge_base(kb_dirs):
+    engine = RAGEngine()
+    engine.initialize_knowledge_base()
+    assert engine.document_count() == 0
+    assert engine.query("直腿抬高") == "知识库为空，请先上传 PDF 文档。"
+
+def test_sees_documents_added_by_another_process(kb_dirs):
+    # 两个实例共用向量库目录与版本文件，相当于两个 worker 进程
+    server = RAGEngine()
+    server.initialize_knowledge_base()
+    assert server.document_count() == 0
+
+    ingest = RAGEngine()
+    ingest.initialize_knowledge_base()
+    _add(ingest, ["直腿抬高训练要点", "膝关节屈伸练习"])
+
+    assert server.kb_version() == 1
+    assert server.document_count() == 2
+    assert server.query("直腿抬高", k=1)
+
+def test_count_cached_until_version_changes(kb_dirs, monkeypatch):
+    engine = RAGEngine()
+    engine.initialize_knowledge_base()
+    _add(engine, ["片段一"])
+    assert engine.document_count() == 1
+
+    calls = []
+    collection = engine.vector_store._collection
+    original_count = collection.count
+
+    def counting_count():
+        calls.append(1)
+        return original_count()
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("document_count 不应扫描集合")
+
+    monkeypatch.setattr(collection, "count", counting_count)
+    monkeypatch.setattr(engine.vector_store, "get", no_scan)
+    for _ in range(3):
+        assert engine.document_count() == 1
+    assert calls == []
+
+    # 其他进程更新版本后重新统计一次，仍走 count() 而不是 get()
+    other = RAGEngine()
+    other.initialize_knowledge_base()
+    _add(other, ["片段二"])
+    assert engine.document_count() == 2
+    assert engine.document_count() == 2
+    assert calls == [1]
@@ -0,0 +1,98 @@
+import pytest
+from app.config import settings
+from app.service import result_cache as result_cache_module
+from app.service.result_cache import ResultCache
+
+SCRIPT = {"slides": [{"title": "直腿抬高", "narration": "保持膝关节伸直。"}]}
+
+@pytest.fixture
+def kb(monkeypatch):
+    version = {"value": 1}
+    monkeypatch.setattr(result_cache_module.rag_engine, "kb_version", lambda: version["value"])
+    return version
+
+@pytest.fixture
+def cache(tmp_path, kb):
+    return ResultCache(str(tmp_path / "results"), max_bytes=10 * 1024 * 1024)
+
+def _session(tmp_path, name, video=b"mp4", captions=b"WEBVTT\n"):
+    session = tmp_path / name
+    session.mkdir()
+    (session / "final_output.mp4").write_bytes(video)
+    if captions is not None:
+        (session / "captions.vtt").write_bytes(captions)
+    return session
+
+def test_json_levels_hit_and_miss_independently(cache):
+    job = cache.job_key("video-hash", "提示词", "gemini")
+    assert cache.get_json("analysis", job) is None
+    cache.put_json("analysis", job, {"raw_description": "描述", "script_data": SCRIPT})
+
+    assert cache.get_json("analysis", job)["script_data"] == SCRIPT
+    # 其他级别、其他附加键互不影响
+    assert cache.get_json("recommend", job, "index-fp") is None
+    cache.put_json("recommend", job, [{"filename": "a.mp4"}], "index-fp")
+    assert cache.get_json("recommend", job, "index-fp") == [{"filename": "a.mp4"}]
+    assert cache.get_json("recommend", job, "other-fp") is None
+
+def test_json_survives_memory_eviction(tmp_path, kb):
+    cache = ResultCache(str(tmp_path / "results"), max_bytes=1024 * 1024, memory_entries=1)
+    cache.put_json("analysis", "job-a", {"n": 1})
+    cache.put_json("analysis", "job-b", {"n": 2})
+    # job-a 已被挤出内存，从磁盘读取
+    assert cache.get_json("analysis", "job-a") == {"n": 1}
+    assert cache.get_json("analysis", "job-a") == {"n": 1}
+    assert cache.stats()["memory_hits"] == 1
+
+def test_job_key_depends_on_inputs_and_kb_version(cache, kb):
+    key = cache.job_key("video-hash", "提示词", "gemini")
+    assert key == cache.job_key("video-hash", "提示词", "gemini")
+    assert key != cache.job_key("video-hash", "其他提示词", "gemini")
+    assert key != cache.job_key("video-hash", "提示词", "other-model")
+    assert cache.job_key("video-hash", None, "gemini") == cache.job_key("video-hash", "", "gemini")
+
+    cache.put_json("analysis", key, {"raw_description": "旧知识库"})
+    kb["value"] = 2
+    new_key = cache.job_key("video-hash", "提示词", "gemini")
+    assert new_key != key
+    assert cache.get_json("analysis", new_key) is None
+
+def test_video_keyed_by_script_digest(cache, tmp_path):
+    digest = cache.script_digest(SCRIPT)
+    cache.put_video(digest, str(_session(tmp_path, "render", video=b"mp4-v1", captions=b"WEBVTT v1\n")))
+
+    target = tmp_path / "hit"
+    target.mkdir()
+    assert cache.fetch_video(digest, str(target))
+    assert (target / "final_output.mp4").read_bytes() == b"mp4-v1"
+    assert (target / "captions.vtt").read_bytes() == b"WEBVTT v1\n"
+
+    # 脚本重新生成后摘要变化，不会取到为旧脚本渲染的视频
+    changed = {"slides": SCRIPT["slides"] + [{"title": "新页面", "narration": "新增内容。"}]}
+    other = tmp_path / "miss"
+    other.mkdir()
+    assert cache.script_digest(changed) != digest
+    assert not cache.fetch_video(cache.script_digest(changed), str(other))
+    assert not (other / "final_output.mp4").exists()
+
+def test_video_key_includes_voice_and_rate(cache, tmp_path, monkeypatch):
+    digest = cache.script_digest(SCRIPT)
+    cache.put_video(digest, str(_session(tmp_path, "render", captions=None)))
+    monkeypatch.setattr(settings, "TTS_RATE", "+50%")
+    target = tmp_path / "target"
+    target.mkdir()
+    assert not cache.fetch_video(digest, str(target))
+
+def test_invalidate_clears_all_levels(cache, tmp_path):
+    job = cache.job_key("video-hash", "提示词", "gemini")
+    digest = cache.script_digest(SCRIPT)
+    cache.put_json("analysis", job, {"script_data": SCRIPT})
+    cache.put_video(digest, str(_session(tmp_path, "render")))
+
+    cache.invalidate()
+    target = tmp_path / "target"
+    target.mkdir()
+    assert cache.get_json("analysis", job) is None
+    assert not cache.fetch_video(digest, str(target))
+    stats = cache.stats()
+    assert stats["memory_entries"] == 0 and stats["bytes"] == 0
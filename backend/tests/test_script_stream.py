@@ -0,0 +1,92 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from app.service.script_stream import SlideStreamParser, parse_slides_partial
+from app.service.video_llm import VideoLLMService, DEFAULT_SCRIPT
+
+SCRIPT = {
+    "slides": [
+        {"title": "第一步", "bullets": ["保持躯干稳定"], "narration": "第一页讲解。"},
+        {"title": '第二步 {括号} "引号"', "bullets": ["动作缓慢"], "narration": "含有 } 与 ] 的讲解。"},
+        {"title": "第三步", "bullets": [], "narration": "第三页讲解。"},
+    ]
+}
+TEXT = json.dumps(SCRIPT, ensure_ascii=False)
+
+def _feed(text, step):
+    parser = SlideStreamParser()
+    slides = []
+    for i in range(0, len(text), step):
+        slides.extend(parser.feed(text[i:i + step]))
+    return parser, slides
+
+def test_slides_emitted_as_they_close():
+    for step in (1, 7, len(TEXT)):
+        parser, slides = _feed(TEXT, step)
+        assert slides == SCRIPT["slides"]
+        assert parser.complete
+
+def test_truncated_output_keeps_closed_slides_only():
+    cut = TEXT.index("第三步") + 3
+    parser, slides = _feed(TEXT[:cut], 5)
+    assert [slide["title"] for slide in slides] == ["第一步", SCRIPT["slides"][1]["title"]]
+    assert not parser.complete
+    assert parse_slides_partial(TEXT[:cut]) == slides
+
+def test_malformed_slide_is_skipped_and_marks_incomplete():
+    text = '{"slides": [{"title": "好"}, {"title": 1 2}, {"bullets": []}]}'
+    parser, slides = _feed(text, 3)
+    assert slides == [{"title": "好", "bullets": [], "narration": ""}]
+    assert parser.skipped == 2
+    assert not parser.complete
+
+def test_markdown_fence_and_trailing_text_ignored():
+    parser, slides = _feed("```json\n" + TEXT + "\n```\n以上是脚本。", 4)
+    assert len(slides) == 3 and parser.complete
+
+def test_parse_script_reports_completeness():
+    log = lambda msg: None
+    assert VideoLLMService._parse_script(TEXT, log) == (SCRIPT, True)
+    script, complete = VideoLLMService._parse_script(TEXT[:TEXT.index("第三步")], log)
+    assert len(script["slides"]) == 2 and not complete
+    assert VideoLLMService._parse_script("not json", log) == (DEFAULT_SCRIPT, False)
+    assert VideoLLMService._parse_script('{"slides": []}', log) == (DEFAULT_SCRIPT, False)
+
+def _stream_service(chunks, error=None):
+    service = VideoLLMService()
+
+    async def fake_stream(request, priority="video"):
+        async def iterate():
+            for chunk in chunks:
+                yield SimpleNamespace(text=chunk)
+            if error:
+                raise error
+        return iterate()
+
+    service._agenerate_content_stream = fake_stream
+    return service
+
+def _collect(service):
+    status = {}
+
+    async def main():
+        return [slide async for slide in service.astream_script("分析", "知识", status=status)]
+
+    return asyncio.run(main()), status
+
+def test_stream_complete():
+    chunks = [TEXT[i:i + 10] for i in range(0, len(TEXT), 10)]
+    slides, status = _collect(_stream_service(chunks))
+    assert slides == SCRIPT["slides"]
+    assert status == {"complete": True}
+
+def test_stream_error_midway_is_incomplete():
+    cut = TEXT.index("第三步")
+    slides, status = _collect(_stream_service([TEXT[:cut]], error=ConnectionError("stream reset")))
+    assert len(slides) == 2
+    assert status == {"complete": False}
+
+def test_stream_without_slides_falls_back_to_default():
+    slides, status = _collect(_stream_service([], error=ConnectionError("refused")))
+    assert slides == DEFAULT_SCRIPT["slides"]
+    assert status == {"complete": False}
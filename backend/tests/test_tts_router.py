@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from app.config import settings
+from app.service import tts_provider
+from app.service.tts_provider import TTSProvider, TTSRouter
+
+class _Provider(TTSProvider):
+    def __init__(self, name, fail=0, available=True):
+        """fail: 前 fail 次调用失败，-1 表示一直失败"""
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+        self._available = available
+
+    def available(self) -> bool:
+        return self._available
+
+    async def synthesize(self, text, voice, rate):
+        self.calls += 1
+        if self.fail < 0 or self.calls <= self.fail:
+            raise ConnectionError(f"{self.name} down")
+        return f"{self.name}-mp3".encode(), []
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录退避等待时长，不实际等待"""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(tts_provider.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(settings, "TTS_RETRY_BACKOFF", 1.0)
+    return delays
+
+@pytest.fixture
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "TTS_BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(settings, "TTS_BREAKER_WINDOW", 4)
+    monkeypatch.setattr(settings, "TTS_BREAKER_MIN_CALLS", 3)
+    monkeypatch.setattr(settings, "TTS_BREAKER_COOLDOWN", 60)
+
+def test_breaker_opens_and_short_circuits(breaker_settings, sleeps):
+    edge = _Provider("edge", fail=-1)
+    router = TTSRouter([edge])
+
+    with pytest.raises(Exception) as first:
+        asyncio.run(router.synthesize("你好", "voice", "+0%", max_retries=3))
+    assert edge.calls == 3
+    assert router.breakers["edge"].is_open()
+    assert "edge: ConnectionError('edge down')" in str(first.value)
+
+    # 熔断期间不再调用该服务
+    with pytest.raises(Exception) as second:
+        asyncio.run(router.synthesize("你好", "voice", "+0%"))
+    assert edge.calls == 3
+    assert "edge: 已熔断，跳过" in str(second.value)
+    assert router.stats()["edge"]["breaker"]["rejected"] == 1
+
+def test_failover_to_local(breaker_settings, sleeps):
+    edge = _Provider("edge", fail=-1)
+    local = _Provider("local")
+    router = TTSRouter([edge, local])
+    messages = []
+
+    audio, _, provider = asyncio.run(router.synthesize("你好", "voice", "+0%", progress_callback=messages.append, max_retries=2))
+    assert provider is local and audio == b"local-mp3"
+    assert edge.calls == 2
+    assert any("离线引擎" in message for message in messages)
+    assert router.stats()["local"]["breaker"]["state"] == "closed"
+
+def test_no_fallback_when_disabled(breaker_settings, sleeps):
+    local = _Provider("local")
+    router = TTSRouter([_Provider("edge", fail=-1), local])
+    with pytest.raises(Exception):
+        asyncio.run(router.synthesize("你好", "voice", "+0%", max_retries=1, allow_fallback=False))
+    assert local.calls == 0
+
+def test_backoff_skipped_once_breaker_open(breaker_settings, sleeps):
+    edge = _Provider("edge", fail=-1)
+    local = _Provider("local")
+    router = TTSRouter([edge, local])
+
+    asyncio.run(router.synthesize("你好", "voice", "+0%", max_retries=5))
+    # 前两次失败按指数退避等待；第三次失败达到 min_calls 后熔断，不再等待直接切换
+    assert edge.calls == 3
+    assert sleeps == [1.0, 2.0]
+
+def test_retry_recovers_without_failover(breaker_settings, sleeps):
+    edge = _Provider("edge", fail=1)
+    local = _Provider("local")
+    router = TTSRouter([edge, local])
+
+    _, _, provider = asyncio.run(router.synthesize("你好", "voice", "+0%"))
+    assert provider is edge and edge.calls == 2 and local.calls == 0
+    assert sleeps == [1.0]
+
+def test_error_names_the_provider_that_failed(breaker_settings, sleeps):
+    edge = _Provider("edge", fail=-1)
+    local = _Provider("local", fail=-1)
+    router = TTSRouter([edge, local])
+    # Edge 已熔断，本次只有离线引擎真正失败
+    for _ in range(3):
+        router.breakers["edge"].record_failure()
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(router.synthesize("你好", "voice", "+0%", max_retries=1))
+    message = str(error.value)
+    assert "Edge TTS" not in message
+    assert "edge: 已熔断，跳过" in message
+    assert "local: ConnectionError('local down')" in message
+    assert edge.calls == 0 and local.calls == 1
+
+def test_error_lists_unavailable_provider(breaker_settings, sleeps):
+    router = TTSRouter([_Provider("edge", fail=-1), _Provider("local", available=False)])
+    with pytest.raises(Exception) as error:
+        asyncio.run(router.synthesize("你好", "voice", "+0%", max_retries=1))
+    assert "local: 不可用" in str(error.value)
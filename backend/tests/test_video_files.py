@@ -0,0 +1,107 @@
+import time
+from types import SimpleNamespace
+import pytest
+from app.config import settings
+from app.service import video_files
+from app.service.video_files import VideoFileStore, UploadTimeout, is_upload_unsupported
+
+class APIError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+def _file(name, state):
+    return SimpleNamespace(
+        name=name, uri=f"https://files/{name}", mime_type="video/mp4",
+        state=SimpleNamespace(name=state), expiration_time=None,
+    )
+
+class FakeFiles:
+    def __init__(self, upload_error=None, states=("ACTIVE",)):
+        self.upload_error = upload_error
+        self.states = list(states)
+        self.uploads = 0
+        self.deleted = []
+
+    def upload(self, file, config):
+        self.uploads += 1
+        if self.upload_error:
+            raise self.upload_error
+        return _file("files/abc", self.states.pop(0) if len(self.states) > 1 else self.states[0])
+
+    def get(self, name):
+        return _file(name, self.states.pop(0) if len(self.states) > 1 else self.states[0])
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VIDEO_TRANSFER_MODE", "upload")
+    return VideoFileStore(str(tmp_path / "index.json"), ttl=3600)
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"fake video")
+    return str(path)
+
+def _is_inline(part):
+    return part.inline_data is not None
+
+def test_upload_once_then_reuse(store, video):
+    client = SimpleNamespace(files=FakeFiles())
+    part, digest = store.get_part(client, video, log=lambda _: None)
+    assert part.file_data.file_uri == "https://files/files/abc" and digest
+    part, _ = store.get_part(client, video, log=lambda _: None)
+    assert part.file_data is not None
+    assert client.files.uploads == 1 and store.reuses == 1
+
+@pytest.mark.parametrize("error, expected", [
+    (APIError(404, "Not Found"), True),
+    (APIError(501, "Not Implemented"), True),
+    (Exception("files API is not supported by this proxy"), True),
+    (APIError(500, "Internal"), False),
+    (APIError(503, "UNAVAILABLE"), False),
+    (APIError(429, "RESOURCE_EXHAUSTED"), False),
+    (APIError(408, "Request Timeout"), False),
+    (TimeoutError("read timed out"), False),
+    (UploadTimeout("processing"), False),
+])
+def test_is_upload_unsupported(error, expected):
+    assert is_upload_unsupported(error) is expected
+
+def test_transient_failure_only_cools_down(store, video, monkeypatch):
+    monkeypatch.setattr(settings, "VIDEO_UPLOAD_RETRY", 60)
+    client = SimpleNamespace(files=FakeFiles(upload_error=APIError(503, "UNAVAILABLE")))
+    part, digest = store.get_part(client, video, log=lambda _: None)
+    assert _is_inline(part) and digest is None
+    assert store._upload_supported
+
+    # 冷却期内直接内联，不再请求上传
+    store.get_part(client, video, log=lambda _: None)
+    assert client.files.uploads == 1
+
+    # 冷却结束后重新尝试上传
+    store._retry_after = time.monotonic() - 1
+    client.files.upload_error = None
+    part, _ = store.get_part(client, video, log=lambda _: None)
+    assert part.file_data is not None and client.files.uploads == 2
+
+def test_unsupported_error_disables_upload(store, video):
+    client = SimpleNamespace(files=FakeFiles(upload_error=APIError(404, "Not Found")))
+    part, _ = store.get_part(client, video, log=lambda _: None)
+    assert _is_inline(part)
+    assert not store._upload_supported
+    assert store.stats()["mode"] == "inline"
+
+def test_processing_timeout_deletes_remote_file(store, video, monkeypatch):
+    monkeypatch.setattr(settings, "VIDEO_UPLOAD_TIMEOUT", 0.05)
+    monkeypatch.setattr(video_files.time, "sleep", lambda _: None)
+    client = SimpleNamespace(files=FakeFiles(states=("PROCESSING",)))
+
+    part, digest = store.get_part(client, video, log=lambda _: None)
+    assert _is_inline(part) and digest is None
+    assert client.files.deleted == ["files/abc"]
+    # 超时属于临时故障：不会永久关闭上传，也不会缓存句柄
+    assert store._upload_supported and store.stats()["cached_handles"] == 0
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.service.video_llm import VideoLLMService
+
+class _FakeModels:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content(self, **request):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(text=f"analysis-{self.calls}")
+
+def _service():
+    service = VideoLLMService()
+    models = _FakeModels()
+    service.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    return service, models
+
+def _request():
+    return {"model": "coalesce-test-model", "contents": ["分析这段视频"], "config": None}
+
+def test_identical_requests_share_one_upstream_call():
+    service, models = _service()
+
+    async def main():
+        return await asyncio.gather(*(service._agenerate_content(_request(), coalesce=True) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert [item.text for item in results] == ["analysis-1"] * 3
+    assert models.calls == 1
+    stats = service.coalesce_stats()
+    assert stats["requests"] == 3 and stats["upstream"] == 1 and stats["coalesced"] == 2
+
+def test_cancelled_leader_does_not_kill_coalesced_request():
+    service, models = _service()
+
+    async def main():
+        # 第一个调用方（领导者）的连接关闭，任务被取消
+        leader = asyncio.create_task(service._agenerate_content(_request(), coalesce=True))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(service._agenerate_content(_request(), coalesce=True))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    response = asyncio.run(main())
+    assert response.text == "analysis-2"
+    assert models.calls == 2
+    assert service.coalesce_stats()["inflight"] == 0
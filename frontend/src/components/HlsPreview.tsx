@@ -0,0 +1,56 @@
+import React, { useEffect, useRef } from 'react';
+
+export interface HlsPreviewProps {
+  playlistUrl: string;
+  className?: string;
+}
+
+/**
+ * 渐进式预览：播放后端不断追加片段的 HLS 播放列表 (stream.m3u8)，
+ * 后续幻灯片仍在渲染时即可开始观看。
+ * Safari 原生支持 HLS，其余浏览器按需加载 hls.js。
+ */
+export const HlsPreview: React.FC<HlsPreviewProps> = ({ playlistUrl, className }) => {
+  const videoRef = useRef<HTMLVideoElement>(null);
+
+  useEffect(() => {
+    const video = videoRef.current;
+    if (!video) return;
+
+    if (video.canPlayType('application/vnd.apple.mpegurl')) {
+      video.src = playlistUrl;
+      return () => {
+        video.removeAttribute('src');
+        video.load();
+      };
+    }
+
+    let disposed = false;
+    let destroy: (() => void) | null = null;
+    import('hls.js').then(({ default: Hls }) => {
+      if (disposed || !Hls.isSupported()) return;
+      const hls = new Hls();
+      hls.on(Hls.Events.ERROR, (_event, data) => {
+        if (!data.fatal) return;
+        // 列表刚创建时可能短暂 404，网络错误重新加载，媒体错误尝试恢复
+        if (data.type === Hls.ErrorTypes.MEDIA_ERROR) {
+          hls.recoverMediaError();
+        } else {
+          hls.startLoad();
+        }
+      });
+      hls.loadSource(playlistUrl);
+      hls.attachMedia(video);
+      destroy = () => hls.destroy();
+    }).catch((error) => {
+      console.error('❌ 加载 hls.js 失败:', error);
+    });
+
+    return () => {
+      disposed = true;
+      destroy?.();
+    };
+  }, [playlistUrl]);
+
+  return <video ref={videoRef} controls playsInline className={className} />;
+};
@@ -7,6 +7,7 @@ import remarkGfm from 'remark-gfm';
 import { useLanguageStore } from '../store/useLanguageStore';
 import { translations } from '../lib/translations';
 import { useChatStore, type ChatMessage, type ExampleVideo } from '../store/useChatStore';
+import { HlsPreview } from '../components/HlsPreview';
 
 interface HistoryItemProps {
   summary: string;
@@ -123,6 +124,8 @@ export const HomePage: React.FC = () => {
   const [statusInfo, setStatusInfo] = useState<string>("");  // 后端状态信息
   const [isUploadingPdf, setIsUploadingPdf] = useState(false);  // PDF 上传状态
   const [isModelSelectorOpen, setIsModelSelectorOpen] = useState(false);  // 模型选择器展开状态
+  // 渐进式预览：收到第一个 segment 事件后播放 HLS 列表，最终 MP4 完成后移除
+  const [liveStream, setLiveStream] = useState<{ playlistUrl: string; published: number; total: number | null } | null>(null);
   const userName = "Alex";  // 用户昵称
   
   // 从当前session获取进度信息和聊天历史
@@ -153,7 +156,13 @@ export const HomePage: React.FC = () => {
   const chatEndRef = useRef<HTMLDivElement>(null);
   const currentSessionIdRef = useRef<string | null>(currentSessionId);  // 使用 ref 保存最新的 sessionId
   const streamingMessageRef = useRef<string>("");  // 使用 ref 保存流式消息
+  // 增量流式协议 (v2) 状态：用于去重与断线续传
+  const streamStateRef = useRef<{ streamId: string | null; lastSeq: number; done: boolean }>({ streamId: null, lastSeq: 0, done: true });
   const modelSelectorRef = useRef<HTMLDivElement>(null);  // 模型选择器引用
+  // 服务端对话状态：每个会话已同步给服务端的历史条数，之后只发送增量
+  const historySyncedRef = useRef<Record<string, number>>({});
+  // 最近一次聊天请求，服务端要求重发完整历史 (history_resync) 时使用
+  const lastChatRequestRef = useRef<{ payload: Record<string, unknown>; history: { role: string; content: string }[] } | null>(null);
 
   // 更新 ref 的值
   useEffect(() => {
@@ -203,6 +212,15 @@ export const HomePage: React.FC = () => {
       setIsChatting(false);
       setStreamingMessage("");
       setStatusInfo("");
+
+      // 上次连接断开时回复尚未完成：请求服务端从头重发该回复的增量
+      const stream = streamStateRef.current;
+      if (stream.streamId && !stream.done) {
+        stream.lastSeq = 0;
+        streamingMessageRef.current = "";
+        setIsChatting(true);
+        websocket.send(JSON.stringify({ type: 'chat_resume', stream_id: stream.streamId, last_seq: 0 }));
+      }
       
       // 注意：不清除store中的进度状态，让用户看到之前的处理进度
       // 如果任务已完成，后端不会再发送消息；如果还在处理，会继续收到进度更新
@@ -217,6 +235,42 @@ export const HomePage: React.FC = () => {
         setStatusInfo('🤔 AI 正在思考...');
         setIsChatting(true);
         setStreamingMessage("");  // 清空流式消息
+        streamingMessageRef.current = "";
+        streamStateRef.current = { streamId: null, lastSeq: 0, done: false };
+      } else if (data.type === 'chat_delta') {
+        // 增量片段 (v2)：按 seq 去重，发现缺帧时请求续传
+        const stream = streamStateRef.current;
+        if (data.stream_id !== stream.streamId) {
+          streamStateRef.current = { streamId: data.stream_id, lastSeq: 0, done: false };
+          streamingMessageRef.current = "";
+        }
+        const current = streamStateRef.current;
+        if (data.seq <= current.lastSeq) return;
+        if (data.seq > current.lastSeq + 1) {
+          websocket.send(JSON.stringify({ type: 'chat_resume', stream_id: current.streamId, last_seq: current.lastSeq }));
+          return;
+        }
+        current.lastSeq = data.seq;
+        const text = streamingMessageRef.current + data.delta;
+        streamingMessageRef.current = text;
+        flushSync(() => {
+          setStreamingMessage(text);
+          setIsChatting(true);
+          setStatusInfo('📡 正在生成回复...');
+        });
+      } else if (data.type === 'history_resync') {
+        // 服务端已无该会话的历史（如重启），重发完整历史
+        const pending = lastChatRequestRef.current;
+        if (pending && pending.payload.conversation_id === data.conversation_id) {
+          historySyncedRef.current[data.conversation_id] = pending.history.length;
+          websocket.send(JSON.stringify({ ...pending.payload, history_offset: 0, history: pending.history }));
+        }
+      } else if (data.type === 'chat_resume_failed') {
+        // 服务端已无该回复的记录
+        streamStateRef.current.done = true;
+        setIsChatting(false);
+        setStreamingMessage("");
+        setStatusInfo('');
       } else if (data.type === 'chat_stream') {
         // 流式输出片段
         const timestamp = new Date().toISOString();
@@ -234,6 +288,12 @@ export const HomePage: React.FC = () => {
         
       } else if (data.type === 'chat_response') {
         // 流式输出完成或非流式响应
+        if (data.stream_id) {
+          // v2 完成消息可能因续传重复到达
+          const stream = streamStateRef.current;
+          if (stream.streamId === data.stream_id && stream.done) return;
+          streamStateRef.current = { streamId: data.stream_id, lastSeq: data.seq, done: true };
+        }
         console.log('✅ AI 回复完成');
         console.log('📦 最终消息 - data.message:', data.message?.length, 'streamingMessageRef:', streamingMessageRef.current?.length);
         setStatusInfo('✅ 回复完成');
@@ -262,7 +322,15 @@ export const HomePage: React.FC = () => {
         if (sessionId) {
           updateSessionProgress(sessionId, data.message, true);
         }
+      } else if (data.type === 'segment') {
+        // 新的 HLS 片段已发布：首个片段到达时开始预览，之后播放器自行轮询列表
+        setLiveStream((prev) => ({
+          playlistUrl: data.playlist_url,
+          published: Math.max(prev && prev.playlistUrl === data.playlist_url ? prev.published : 0, data.index + 1),
+          total: data.total ?? null,
+        }));
       } else if (data.type === 'complete') {
+        setLiveStream(null);
         const sessionId = currentSessionIdRef.current;
         if (sessionId) {
           updateSessionProgress(sessionId, "完成！", false);
@@ -300,6 +368,7 @@ export const HomePage: React.FC = () => {
       } else if (data.type === 'error') {
         console.error('❌ WebSocket 错误:', data.message);
         alert(`Error: ${data.message}`);
+        setLiveStream(null);
         setIsUploading(false);
         setIsChatting(false);
       }
@@ -356,16 +425,24 @@ export const HomePage: React.FC = () => {
     
     console.log('📤 发送消息:', currentMessage);
     
-    ws.send(JSON.stringify({
+    const history = chatHistory.map(msg => ({ 
+      role: msg.role, 
+      content: msg.type === 'video' ? '[系统已生成康复指导视频]' : msg.content 
+    }));
+    // 只发送服务端尚未见过的历史
+    const synced = historySyncedRef.current[currentSessionId] ?? 0;
+    const offset = synced <= history.length ? synced : 0;
+    const payload = {
       type: 'chat',
       message: currentMessage,
       model: selectedModel,
       stream: true,  // 启用流式输出
-      history: chatHistory.map(msg => ({ 
-        role: msg.role, 
-        content: msg.type === 'video' ? '[系统已生成康复指导视频]' : msg.content 
-      }))
-    }));
+      protocol: 2,   // 增量流式协议，不带此字段时服务端使用旧协议
+      conversation_id: currentSessionId,
+    };
+    lastChatRequestRef.current = { payload, history };
+    historySyncedRef.current[currentSessionId] = history.length;
+    ws.send(JSON.stringify({ ...payload, history_offset: offset, history: history.slice(offset) }));
 
     setCurrentMessage("");
   };
@@ -451,6 +528,7 @@ export const HomePage: React.FC = () => {
 
   const uploadFile = async (file: File, prompt?: string) => {
     setIsUploading(true);
+    setLiveStream(null);
     if (currentSessionId) {
       updateSessionProgress(currentSessionId, "正在上传视频...", true);
     }
@@ -872,6 +950,23 @@ export const HomePage: React.FC = () => {
                   </div>
                 ))}
                 
+                {/* 渲染中的视频预览：已完成的幻灯片片段可先播放 */}
+                {liveStream && (
+                  <div className="flex gap-3 justify-start" key="live-preview">
+                    <div className="flex-shrink-0 w-8 h-8 rounded-full bg-gradient-to-br from-healink-purple-start to-healink-purple-end flex items-center justify-center text-white text-sm font-bold shadow-md">
+                      G
+                    </div>
+                    <div className="bg-white text-healink-navy shadow-sm rounded-2xl rounded-bl-none p-4 max-w-[80%] flex flex-col gap-2">
+                      <p className="font-bold">
+                        视频生成中，可先观看已完成部分（{liveStream.published}{liveStream.total ? `/${liveStream.total}` : ''} 页）
+                      </p>
+                      <div className="rounded-lg overflow-hidden bg-black/10 aspect-video">
+                        <HlsPreview playlistUrl={liveStream.playlistUrl} className="w-full h-full object-contain" />
+                      </div>
+                    </div>
+                  </div>
+                )}
+
                 {/* 流式输出中的消息 */}
                 {isChatting && streamingMessage && streamingMessage.length > 0 && (
                   <div className="flex gap-3 justify-start" key="streaming">